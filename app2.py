@@ -1,4 +1,5 @@
 import json
+import os
 import uuid
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
@@ -6,7 +7,10 @@ from langchain_core.messages.tool import ToolMessage
 #from src.session_state import init_session_state
 
 from src.nodes import *
-from src.workflow import create_unified_workflow
+from src.workflow import get_workflow, run_turn, start_session
+from src.supabase import warm_up
+from src.metrics import start_metrics_server
+from src.turns import TURN_POLL_SECONDS, current_turn, end_session, submit_turn, take_turn
 
 
 from datetime import datetime
@@ -15,7 +19,22 @@ from langchain_core.messages import HumanMessage, AIMessage
 # ===============================
 # 🎨 PAGE CONFIGURATION
 # ===============================
-app=create_unified_workflow()
+@st.cache_resource(show_spinner=False)
+def load_workflow():
+    """Compiled graph, LLM clients and retrieval backend, built once per process."""
+    start_metrics_server()  # /metrics on METRICS_HOST:METRICS_PORT for capacity planning
+    warm_up()
+    try:
+        get_vectorstore()
+    except Exception as e:
+        print(f"⚠️  Retrieval warm-up failed: {e}")
+    return get_workflow()
+
+
+app = load_workflow()
+
+# Messages drawn per rerun; older ones stay behind "Load earlier messages" (0 draws them all)
+CHAT_WINDOW = int(os.environ.get("CHAT_WINDOW", 20))
 def set_page_config():
     """Configure the Streamlit page."""
     st.set_page_config(
@@ -31,7 +50,7 @@ def set_page_config():
 # ===============================
 
 def set_page_style():
-    """Apply custom CSS styling."""
+    """Apply custom CSS styling. Chat turns rerun only the chat panel, so this is sent once per page run."""
     st.markdown("""
         <style>
         /* Main background - full page */
@@ -215,6 +234,14 @@ def initialize_session_state():
     # Workflow state (for graph continuity)
     if "workflow_state" not in st.session_state:
         st.session_state.workflow_state = None
+    
+    # Number of graph messages already shown (graph state lives in the checkpointer)
+    if "graph_message_count" not in st.session_state:
+        st.session_state.graph_message_count = 0
+
+    # How many of the latest messages the chat panel draws
+    if "chat_window" not in st.session_state:
+        st.session_state.chat_window = CHAT_WINDOW
 
 
 # ===============================
@@ -272,6 +299,7 @@ def setup_sidebar():
         
         if st.button("🔄 Start New Assessment", use_container_width=True):
             # Reset all session state
+            end_session(st.session_state.session_id)
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.rerun()
@@ -292,12 +320,18 @@ def setup_sidebar():
         """, unsafe_allow_html=True)
 
 
+def sidebar_state() -> tuple:
+    """The session fields the sidebar shows."""
+    return (st.session_state.phase, st.session_state.route, st.session_state.total_score,
+            st.session_state.appointment_confirmed, st.session_state.questions_answered)
+
+
 # ===============================
 # 💬 CHAT DISPLAY
 # ===============================
 
 def display_chat_history():
-    """Display the complete chat history."""
+    """Display the chat history, windowed to the latest CHAT_WINDOW messages."""
     
     if not st.session_state.messages:
         st.markdown("""
@@ -312,8 +346,23 @@ def display_chat_history():
         """, unsafe_allow_html=True)
         return
     
-    # Display all messages
-    for message in st.session_state.messages:
+    # Display the latest messages; earlier ones load on request
+    messages = st.session_state.messages
+    window = st.session_state.chat_window
+    hidden = len(messages) - window if window else 0
+    if hidden > 0:
+        st.button(f"Load earlier messages ({hidden})", key="load_earlier",
+                  on_click=load_earlier_messages, use_container_width=True)
+        messages = messages[hidden:]
+    draw_messages(messages)
+
+
+def load_earlier_messages():
+    st.session_state.chat_window += CHAT_WINDOW
+
+
+def draw_messages(messages: list):
+    for message in messages:
         if isinstance(message, HumanMessage):
             with st.chat_message("user"):
                 st.write(message.content)
@@ -326,214 +375,135 @@ def display_chat_history():
 # 🔄 MESSAGE PROCESSING
 # ===============================
 
-def process_conversation_phase(user_input: str):
-    """Process messages during the conversation/classification phase."""
-    
-    # Add user message
+def append_new_ai_messages(result: dict):
+    """Show the assistant messages the graph produced during this turn."""
+    graph_messages = result.get('messages', [])
+    seen = st.session_state.graph_message_count
+    for message in graph_messages[seen:]:
+        if isinstance(message, AIMessage):
+            st.session_state.messages.append(message)
+    st.session_state.graph_message_count = len(graph_messages)
+
+
+def start_graph_turn(user_input: str):
+    """
+    Send the student's message to the graph on a background worker (src/turns.py).
+    turn_progress() shows how far it got and applies the result when it is done.
+    """
+    session_id = st.session_state.session_id
+
+    def run(turn):
+        # Resumes the pending question or booking reply, or sends just the new message;
+        # the checkpointer holds the rest of the session
+        return run_turn(app, session_id, user_input, callbacks=turn.callbacks)
+
+    if submit_turn(session_id, user_input, run, phase=st.session_state.phase) is None:
+        st.toast("Still working on your last message...")
+        return
     st.session_state.messages.append(HumanMessage(content=user_input))
-    
-    # Prepare state for graph
-    if st.session_state.workflow_state is None:
-        state = {
-            "student_id": st.session_state.student_id,
-            "session_id": st.session_state.session_id,
-            "messages": st.session_state.messages
-        }
-    else:
-        state = st.session_state.workflow_state
-        state["messages"] = st.session_state.messages
-    
-    try:
-        # Invoke the graph (Phase 1: Conversation)
-        result = app.invoke(state)
-        
-        # Update workflow state
-        st.session_state.workflow_state = result
-        
-        # Extract AI response
-        if result.get('messages'):
-            last_message = result['messages'][-1]
-            if isinstance(last_message, AIMessage) and not result.get('disorder'):
-                st.session_state.messages.append(last_message)
-        
-        # Check if disorder was classified
-        if result.get('disorder'):
-            st.session_state.disorder = result['disorder']
-            st.session_state.classified = True
-            st.session_state.phase = "questionnaire"
-            
-            # Trigger questionnaire creation
-            questionnaire_result = create_questionnaire(result)
-
-            st.session_state.workflow_state= questionnaire_result
-            
-            if questionnaire_result.get('messages'):
-                 st.session_state.messages.append(questionnaire_result['messages'][-1])
-            st.session_state.questionnaire_started = True
-        
-    except Exception as e:
-        st.error(f"Error processing message: {str(e)}")
 
 
-def process_questionnaire_phase(user_input: str):
-    """Process answers during the questionnaire phase."""
-    
-    # Add user message
-    st.session_state.messages.append(HumanMessage(content=user_input))
+def process_conversation_phase(result: dict):
+    """Apply a conversation/classification turn's result."""
+    st.session_state.workflow_state = result
     
-    state = st.session_state.workflow_state
-    state['messages'].append(HumanMessage(content=user_input))
-    
-    try:
-        # Score the answer
-        scored = score_user_answer(state)
-        
-        # Save the score
-        saved = save_answer_score(scored)
-        st.session_state.workflow_state = saved
-        
-        # Increment counter
-        st.session_state.questions_answered += 1
-        
-        # Check if complete
-        if saved.get('next_node') == 'total_score_label':
-            st.session_state.questionnaire_complete = True
-            
-            # Calculate total
-            final_assessment = total_score_label(saved)
-            st.session_state.workflow_state = final_assessment
-            
-            # Store results
-            st.session_state.total_score = final_assessment.get('total_score')
-            st.session_state.score_label = final_assessment.get('score_label')
-            st.session_state.severity = final_assessment.get('severity')
-            
-            # Add assessment message
-            if final_assessment.get('messages'):
-                st.session_state.messages.append(final_assessment['messages'][-1])
-            
-            # Move to recommendations
-            st.session_state.phase = "recommendations"
-            
-            # Generate recommendations
-            generate_recommendations()
-        
-        else:
-            # Next question
-            if saved.get('messages'):
-                st.session_state.messages.append(saved['messages'][-1])
+    # Check if disorder was classified (the graph has already asked the first question)
+    if result.get('disorder'):
+        st.session_state.disorder = result['disorder']
+        st.session_state.classified = True
+        st.session_state.phase = "questionnaire"
+        st.session_state.questionnaire_started = True
     
-    except Exception as e:
-        st.error(f"Error processing answer: {str(e)}")
+    append_new_ai_messages(result)
 
 
-def generate_recommendations():
-    """Generate recommendations based on assessment."""
+def process_questionnaire_phase(result: dict):
+    """Apply a questionnaire answer's result (score, save, then next question or results)."""
+    st.session_state.workflow_state = result
     
-    state = st.session_state.workflow_state
+    # Increment counter
+    st.session_state.questions_answered += 1
     
-    try:
-        # Transition to recommendations
-        rec_state = transition_to_recommendations(state)
-        
-        # Determine route
-        routed = determine_route(rec_state)
-        st.session_state.route = routed.get('route')
-        
-        # Generate appropriate recommendation
-        if st.session_state.route == "treatment_plan":
-            final = generate_treatment_plan(routed)
-            #recommendation=final.get('recommendation')
-        else:
-            final = generate_appointment_recommendation(routed)
-            st.session_state.appointment_mode = True
-        
-        st.session_state.workflow_state = final
+    # Check if complete (the graph continues straight into recommendations)
+    if result.get('total_score') is not None:
+        st.session_state.questionnaire_complete = True
         
-        # Add recommendation message
-        if final.get('messages'):
-            st.session_state.messages.append(final['messages'][-1])
+        # Store results
+        st.session_state.total_score = result.get('total_score')
+        st.session_state.score_label = result.get('score_label')
+        st.session_state.severity = result.get('severity')
         
-        st.session_state.recommendation_generated = True
+        # Move to recommendations
+        st.session_state.phase = "recommendations"
+        st.session_state.route = result.get('route')
+        st.session_state.appointment_mode = result.get('route') == "appointment"
+        st.session_state.recommendation_generated = bool(result.get('recommendation'))
     
-    except Exception as e:  
-        st.error(f"Error generating recommendations: {str(e)}")
+    append_new_ai_messages(result)
 
 
-def process_appointment_interaction(user_input: str):
-    """Handle appointment booking interactions."""
+def process_appointment_interaction(result: dict):
+    """Apply the result of a reply to handle_appointment."""
+    st.session_state.workflow_state = result
     
-    st.session_state.messages.append(HumanMessage(content=user_input))
-    
-    state = st.session_state.workflow_state
-    state['user_message'] = user_input
+    append_new_ai_messages(result)
     
+    # Check if confirmed
+    if result.get('appointment_confirmed'):
+        st.session_state.appointment_confirmed = True
+        st.balloons()
+
+
+# Result handler and error message for a turn, by the phase it was sent in
+TURN_HANDLERS = {
+    "conversation": (process_conversation_phase, "Error processing message"),
+    "questionnaire": (process_questionnaire_phase, "Error processing answer"),
+    "recommendations": (process_appointment_interaction, "Error processing appointment"),
+}
+
+
+def finish_turn(turn):
+    """Apply a finished turn to the session; errors are shown under the chat."""
+    handler, error_message = TURN_HANDLERS[turn.phase]
     try:
-        # Process through appointment handler
-        result = handle_appointment_interaction(state)
-        st.session_state.workflow_state = result
-        
-        # Add response
-        if result.get('messages'):
-            st.session_state.messages.append(result['messages'][-1])
-        
-        # Check if confirmed
-        if result.get('appointment_confirmed'):
-            st.session_state.appointment_confirmed = True
-            st.balloons()
-    
+        handler(turn.result())
     except Exception as e:
-        st.error(f"Error processing appointment: {str(e)}")
+        st.session_state.turn_error = f"{error_message}: {str(e)}"
+
+
+@st.fragment(run_every=TURN_POLL_SECONDS)
+def turn_progress():
+    """
+    Polls the session's running turn, showing the stage it is in until it
+    finishes. Messages and errors from turns finished since chat_panel last ran
+    are drawn here; the whole page reruns only when the sidebar has changed.
+    """
+    turn = current_turn(st.session_state.session_id)
+    if turn is not None and turn.done:
+        before = sidebar_state()
+        take_turn(st.session_state.session_id)
+        finish_turn(turn)
+        if sidebar_state() != before:
+            st.rerun()
+
+    draw_messages(st.session_state.messages[st.session_state.drawn_messages:])
+    if error := st.session_state.get("turn_error"):
+        st.error(error)
+    if turn is not None and not turn.done:
+        with st.chat_message("assistant"):
+            st.caption(f"{turn.stage.capitalize()}... ({turn.elapsed:.0f}s)")
 
 
 # ===============================
-# 🎯 MAIN APPLICATION
+# 💬 CHAT PANEL
 # ===============================
 
-def main():
-    """Main application entry point."""
-    
-    set_page_config()
-    set_page_style()
-    initialize_session_state()
-    setup_sidebar()
-    
-    # Student ID input (if not set)
-    if st.session_state.student_id is None:
-        st.markdown("""
-            <div style='text-align: center; padding: 2rem;'>
-                <h2>Break the silence...</h2>
-                <p>Enter your Student ID to start</p>
-            </div>
-        """, unsafe_allow_html=True)
-        
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            student_id = st.text_input("Student ID", placeholder="e.g., S2099", label_visibility="collapsed")
-            
-            if st.button("Start Assessment", use_container_width=True, type="primary"):
-                if student_id:
-                    st.session_state.student_id = student_id
-                    
-                    # Initialize conversation
-                    state = {
-                        "student_id": student_id,
-                        "session_id": st.session_state.session_id,
-                        "messages": []
-                    }
-                    
-                    #result = app.invoke(state)
-                    result= start_conversation(state)
-
-                    st.session_state.workflow_state = result
-                    
-                    if result.get('messages'):
-                        st.session_state.messages.append(result['messages'][-1])
-                    
-                    st.rerun()
-                else:
-                    st.warning("Please enter your Student ID")
-        return
+@st.fragment
+def chat_panel():
+    """
+    Chat history, input and turn handling. A chat turn reruns only this
+    fragment, so the page config, CSS and sidebar are not redrawn per message.
+    """
     # ✅ FIX: Show welcome message AFTER student ID is set but BEFORE any messages
     if st.session_state.student_id and len(st.session_state.messages) == 1:
         # Only show when there's exactly 1 message (the greeting)
@@ -567,46 +537,93 @@ def main():
     
     # Chat input
     if prompt := st.chat_input(placeholder):
-        with st.chat_message("user"):
-            st.write(prompt)
-        
-        with st.spinner("Thinking..."):
-            # Route to appropriate handler
-            if st.session_state.phase == "conversation":
-                process_conversation_phase(prompt)
-            
-            elif st.session_state.phase == "questionnaire":
-                process_questionnaire_phase(prompt)
-            
-            elif st.session_state.phase == "recommendations":
-                #st.session_state.recommendation_generated = True
-                    
-                if st.session_state.route == "appointment":
-                     # Handle appointment booking interactions
-                    if not st.session_state.appointment_confirmed:
-                        process_appointment_interaction(prompt)
-                    else:
-                        # Appointment already confirmed, just acknowledge
-                        st.session_state.messages.append(HumanMessage(content=prompt))
-                        st.session_state.messages.append(AIMessage(
-                            content="Your appointment is all set! If you need to make changes, please contact the counseling center. Is there anything else I can help you with?"
-                        ))
-
-                elif st.session_state.route == "treatment_plan":
-                     # Treatment plan already shown, handle follow-up questions
-                    st.session_state.messages.append(HumanMessage(content=prompt))
-                    st.session_state.messages.append(AIMessage(
-                        content="Remember, the self-care strategies I shared are meant to complement professional support if needed. "
-                    ))
+        st.session_state.pop("turn_error", None)
+        before = sidebar_state()
+        shown = len(st.session_state.messages)
+        # Route to appropriate handler; graph turns run in the background
+        if st.session_state.phase in ("conversation", "questionnaire"):
+            start_graph_turn(prompt)
+        
+        elif st.session_state.phase == "recommendations":
+            #st.session_state.recommendation_generated = True
+                
+            if st.session_state.route == "appointment":
+                 # Handle appointment booking interactions
+                if not st.session_state.appointment_confirmed:
+                    start_graph_turn(prompt)
                 else:
-                    # General follow-up conversation
-                    
+                    # Appointment already confirmed, just acknowledge
                     st.session_state.messages.append(HumanMessage(content=prompt))
                     st.session_state.messages.append(AIMessage(
-                        content="Thank you for sharing. Is there anything else I can help you with today?"
+                        content="Your appointment is all set! If you need to make changes, please contact the counseling center. Is there anything else I can help you with?"
                     ))
+
+            elif st.session_state.route == "treatment_plan":
+                 # Treatment plan already shown, handle follow-up questions
+                st.session_state.messages.append(HumanMessage(content=prompt))
+                st.session_state.messages.append(AIMessage(
+                    content="Remember, the self-care strategies I shared are meant to complement professional support if needed. "
+                ))
+            else:
+                # General follow-up conversation
+                
+                st.session_state.messages.append(HumanMessage(content=prompt))
+                st.session_state.messages.append(AIMessage(
+                    content="Thank you for sharing. Is there anything else I can help you with today?"
+                ))
+        
+        # Rerun the whole page only when the sidebar has something new to show;
+        # otherwise draw just the new messages
+        if sidebar_state() != before:
+            st.rerun()
+        draw_messages(st.session_state.messages[shown:])
+
+    # Everything up to here is drawn; turn_progress draws what finished turns add
+    st.session_state.drawn_messages = len(st.session_state.messages)
+    if current_turn(st.session_state.session_id) or st.session_state.get("turn_error"):
+        turn_progress()
+
+
+# ===============================
+# 🎯 MAIN APPLICATION
+# ===============================
+
+def main():
+    """Main application entry point."""
+    
+    set_page_config()
+    set_page_style()
+    initialize_session_state()
+    setup_sidebar()
+    
+    # Student ID input (if not set)
+    if st.session_state.student_id is None:
+        st.markdown("""
+            <div style='text-align: center; padding: 2rem;'>
+                <h2>Break the silence...</h2>
+                <p>Enter your Student ID to start</p>
+            </div>
+        """, unsafe_allow_html=True)
         
-        st.rerun()
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col2:
+            student_id = st.text_input("Student ID", placeholder="e.g., S2099", label_visibility="collapsed")
+            
+            if st.button("Start Assessment", use_container_width=True, type="primary"):
+                if student_id:
+                    st.session_state.student_id = student_id
+                    
+                    # Initialize conversation (runs the greeting node and checkpoints the session)
+                    result = start_session(app, st.session_state.session_id, student_id)
+
+                    st.session_state.workflow_state = result
+                    append_new_ai_messages(result)
+                    
+                    st.rerun()
+                else:
+                    st.warning("Please enter your Student ID")
+        return
+    chat_panel()
 
 
 # ===============================
@@ -0,0 +1,70 @@
+# ==============================
+# ⏱️ Import-time budget for the src package
+# ==============================
+# Imports a module in fresh interpreters with `-X importtime`, reports the
+# slowest dependencies, and exits non-zero if the median cumulative import
+# time exceeds the budget or a module that must stay lazy gets imported.
+# Run it in CI so cold starts of new app replicas do not creep back up.
+#
+#   python -m benchmarks.import_time                       (src.workflow, 900 ms)
+#   python -m benchmarks.import_time --module src.api --budget-ms 1200
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# Heavy clients that are only imported on first use (see LazyModel / get_vectorstore in src/tools.py)
+MUST_STAY_LAZY = ("qdrant_client", "langchain_qdrant", "langchain_openai", "openai", "langchain_community")
+DEFAULT_BUDGET_MS = float(os.environ.get("IMPORT_BUDGET_MS", 900))
+
+
+def import_profile(module: str) -> dict:
+    """{module name: cumulative microseconds} for one cold import of `module`."""
+    env = {**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-import-benchmark")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env, check=True
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        profile[name] = int(cumulative_us)
+    return profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="src.workflow")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    profiles = [import_profile(args.module) for _ in range(args.runs)]
+    median_ms = statistics.median(p[args.module] for p in profiles) / 1000
+
+    print(f"{args.module}: median {median_ms:.0f} ms over {args.runs} cold imports (budget {args.budget_ms:.0f} ms)\n")
+    top_level = {name: us for name, us in profiles[-1].items() if "." not in name and name != args.module}
+    print(f"{'slowest top-level imports':<40}{'ms':>8}")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<40}{us / 1000:>8.1f}")
+
+    failures = []
+    if median_ms > args.budget_ms:
+        failures.append(f"import time {median_ms:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+    eager = [name for name in MUST_STAY_LAZY if name in profiles[-1]]
+    if eager:
+        failures.append(f"imported eagerly: {', '.join(eager)}")
+
+    for failure in failures:
+        print(f"\n❌ {failure}")
+    if not failures:
+        print("\n✅ Within budget")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# ==============================
+# 🚦 Closed-loop load generator
+# ==============================
+# Drives N simulated students through all three phases of the unified workflow
+# (5 chat turns -> questionnaire -> treatment plan or appointment booking),
+# with a fixed number of concurrent students, against the offline stand-ins.
+# Reports throughput and p50/p95/p99 latency per phase and per node.
+#
+#   python -m benchmarks.loadtest --students 200 --concurrency 20 \
+#       --llm-latency lognormal:0.8,0.4 --qdrant-latency lognormal:0.05,0.3 --db-latency fixed:0.02
+#
+# --trace-sample-rate 0.05 also writes Chrome traces of sampled turns to TRACE_DIR.
+import argparse
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.standins import install_standins
+
+CHAT_MESSAGES = [
+    "I haven't been sleeping well and I keep worrying about exams.",
+    "Everything feels like too much lately, I can't keep up.",
+    "I don't really enjoy the things I used to.",
+    "My heart races before every class presentation.",
+    "I've been snapping at my friends over small things.",
+    "I feel tired all the time, even after resting.",
+]
+KEYWORD_ANSWERS = ["never", "rarely", "sometimes", "often", "very often", "nearly every day", "not at all", "several days"]
+FREE_TEXT_ANSWERS = [
+    "hmm, I guess it happens from time to time",
+    "it's been pretty bad honestly",
+    "not really something I think about",
+    "more than I'd like to admit",
+]
+MAX_QUESTIONNAIRE_TURNS = 15
+MAX_BOOKING_TURNS = 3
+
+
+class Recorder:
+    """Thread-safe latency samples per phase and per node."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = defaultdict(list)
+        self.nodes = defaultdict(list)
+        self.turns = 0
+        self.errors = 0
+
+    def turn(self, phase: str, seconds: float, node_times: list):
+        with self.lock:
+            self.turns += 1
+            self.phases[phase].append(seconds)
+            for node, node_seconds in node_times:
+                self.nodes[node].append(node_seconds)
+
+    def error(self):
+        with self.lock:
+            self.errors += 1
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def timed_turn(app, recorder, phase, payload, config):
+    """Run one turn via stream(updates) so each node's wall time can be attributed."""
+    from src.tracing import turn_span
+
+    start = last = time.perf_counter()
+    node_times = []
+    with turn_span(config["configurable"]["thread_id"]):
+        for update in app.stream(payload, config, stream_mode="updates"):
+            now = time.perf_counter()
+            for node in update:
+                if not node.startswith("__"):
+                    node_times.append((node, now - last))
+            last = now
+    recorder.turn(phase, time.perf_counter() - start, node_times)
+    return app.get_state(config).values
+
+
+def simulate_student(app, recorder, free_text_ratio, rng):
+    from langchain_core.messages import HumanMessage
+    from langgraph.types import Command
+    from src.workflow import session_config
+
+    session_id = str(uuid.uuid4())
+    config = session_config(session_id)
+    student_id = f"LT{rng.randrange(10**6):06d}"
+
+    state = timed_turn(app, recorder, "start", {"student_id": student_id, "session_id": session_id, "messages": []}, config)
+
+    # Phase 1: five chat turns until should_classify fires
+    while not state.get("disorder"):
+        state = timed_turn(app, recorder, "conversation", {"messages": [HumanMessage(content=rng.choice(CHAT_MESSAGES))]}, config)
+
+    # Phase 2: answer every questionnaire item
+    for _ in range(MAX_QUESTIONNAIRE_TURNS):
+        if state.get("total_score") is not None:
+            break
+        answer = rng.choice(FREE_TEXT_ANSWERS if rng.random() < free_text_ratio else KEYWORD_ANSWERS)
+        state = timed_turn(app, recorder, "questionnaire", Command(resume=answer), config)
+
+    # Phase 3: treatment plan is shown directly; appointments need confirmation
+    if state.get("route") == "appointment":
+        for _ in range(MAX_BOOKING_TURNS):
+            if state.get("appointment_confirmed"):
+                break
+            reply = "yes, book it" if rng.random() < 0.8 else "do you have other times?"
+            state = timed_turn(app, recorder, "appointment", Command(resume=reply), config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--free-text-ratio", type=float, default=0.3)
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.4")
+    parser.add_argument("--qdrant-latency", default="lognormal:0.05,0.3")
+    parser.add_argument("--db-latency", default="fixed:0.02")
+    parser.add_argument("--session-store", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--trace-sample-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    install_standins(args.llm_latency, args.qdrant_latency, args.db_latency)
+    if args.trace_sample_rate:
+        from src.tracing import set_sample_rate
+        set_sample_rate(args.trace_sample_rate)
+
+    from langgraph.checkpoint.memory import InMemorySaver
+    from src.workflow import create_unified_workflow
+    if args.session_store == "sqlite":
+        from src.session_store import SQLiteSessionSaver
+        checkpointer = SQLiteSessionSaver(":memory:")
+    else:
+        checkpointer = InMemorySaver()
+    app = create_unified_workflow(checkpointer=checkpointer)
+
+    recorder = Recorder()
+    seeds = random.Random(args.seed)
+
+    def run_one(_):
+        try:
+            simulate_student(app, recorder, args.free_text_ratio, random.Random(seeds.random()))
+        except Exception as e:
+            print(f"⚠️  Student failed: {e}")
+            recorder.error()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run_one, range(args.students)))
+    elapsed = time.perf_counter() - start
+
+    print(f"\nStudents: {args.students} | concurrency: {args.concurrency} | errors: {recorder.errors}")
+    print(f"Elapsed: {elapsed:.1f}s | {args.students / elapsed:.2f} students/s | {recorder.turns / elapsed:.2f} turns/s\n")
+    for title, groups in (("PHASE", recorder.phases), ("NODE", recorder.nodes)):
+        print(f"{title:<32}{'n':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+        for name, samples in sorted(groups.items(), key=lambda item: -sum(item[1])):
+            print(f"{name:<32}{len(samples):>7}"
+                  + "".join(f"{percentile(samples, p) * 1000:>11.1f}" for p in (50, 95, 99)))
+        print()
+
+    from src.metrics import questionnaire_items_saved
+    print(f"{'INSTRUMENT':<32}{'n':>7}{'avg items saved':>18}")
+    for (instrument,), child in sorted(questionnaire_items_saved._children.items()):
+        completed = sum(child.counts)
+        print(f"{instrument:<32}{completed:>7}{child.sum / completed:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
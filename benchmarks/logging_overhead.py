@@ -0,0 +1,37 @@
+# ==============================
+# 🪵 Logging overhead on the request thread
+# ==============================
+# Per-call cost of the structured logger as seen by a node:
+#   - debug() while LOG_LEVEL=INFO (must be indistinguishable from no call)
+#   - info() with structured fields (only enqueues; formatting runs on the listener)
+#
+#   python -m benchmarks.logging_overhead
+import io
+import timeit
+
+from src.logs import configure_logging, flush_logs, get_logger
+
+CALLS = 200_000
+
+
+def per_call_ns(stmt, namespace) -> float:
+    return min(timeit.repeat(stmt, globals=namespace, number=CALLS, repeat=5)) / CALLS * 1e9
+
+
+def main():
+    configure_logging(level="INFO", stream=io.StringIO())
+    log = get_logger("benchmark")
+    namespace = {"log": log, "question_id": "pss4", "score": 2}
+
+    baseline = per_call_ns("pass", namespace)
+    debug_off = per_call_ns('log.debug("Score saved", extra={"question_id": question_id, "score": score})', namespace)
+    info_on = per_call_ns('log.info("Score saved", extra={"question_id": question_id, "score": score})', namespace)
+    flush_logs()
+
+    print(f"{'empty statement':<40}{baseline:>10.0f} ns")
+    print(f"{'debug() with LOG_LEVEL=INFO':<40}{debug_off:>10.0f} ns")
+    print(f"{'info() enqueued':<40}{info_on:>10.0f} ns")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# ==============================
+# ⏱️ Startup / rerun cost benchmark
+# ==============================
+# Times what every Streamlit rerun used to pay (building and compiling the
+# StateGraph) against the cached accessor, then times full reruns of app.py
+# with Streamlit's AppTest harness, at growing chat lengths with the whole
+# history drawn and with the CHAT_WINDOW view.
+#
+#   SUPABASE_BACKEND=sqlite python -m benchmarks.rerun_cost
+import statistics
+import time
+from src.workflow import create_unified_workflow, get_workflow
+
+RUNS = 20
+HISTORY_LENGTHS = (10, 50, 200)
+
+
+def _time(fn, runs=RUNS):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(samples), max(samples)
+
+
+def _history(length):
+    from langchain_core.messages import AIMessage, HumanMessage
+    text = "I've been really stressed about exams and I can't sleep properly. " * 3
+    return [(HumanMessage if i % 2 else AIMessage)(content=f"{i}: {text}") for i in range(length)]
+
+
+def main():
+    mean, worst = _time(create_unified_workflow)
+    print(f"create_unified_workflow() per rerun : mean {mean:8.2f} ms | max {worst:8.2f} ms")
+
+    get_workflow()
+    mean, worst = _time(get_workflow)
+    print(f"get_workflow() (cached)             : mean {mean:8.3f} ms | max {worst:8.3f} ms")
+
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file("app.py", default_timeout=60)
+    at.run()  # first run pays the one-off cost
+    mean, worst = _time(at.run, runs=10)
+    print(f"app.py rerun (AppTest)              : mean {mean:8.2f} ms | max {worst:8.2f} ms")
+
+    # A student mid-conversation; chat_window 0 draws everything, as before windowing
+    for length in HISTORY_LENGTHS:
+        for label, window in (("all", 0), ("window", None)):
+            at = AppTest.from_file("app.py", default_timeout=60)
+            at.session_state["student_id"] = "S0001"
+            at.session_state["messages"] = _history(length)
+            if window is not None:
+                at.session_state["chat_window"] = window
+            at.run()
+            mean, worst = _time(at.run, runs=10)
+            print(f"app.py rerun, {length:>3} messages, {label:<6}: mean {mean:8.2f} ms | max {worst:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# ==============================
+# 🚨 Risk detector latency per turn
+# ==============================
+# Time src.risk.detect_risk on a mix of ordinary, questionnaire-style and
+# flagged messages (short to several paragraphs), and the whole track node
+# on a realistic history. Exits non-zero if the p99 goes over the budget.
+# The screen runs before every LLM call, so it has to stay well under 1 ms.
+#
+#   python -m benchmarks.risk_latency
+#   python -m benchmarks.risk_latency --budget-us 100 --iterations 20000
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from src.nodes import track_conversation
+from src.risk import detect_risk
+
+DEFAULT_BUDGET_US = float(os.environ.get("RISK_BUDGET_US", 250))
+
+MESSAGES = [
+    "sometimes",
+    "nearly every day",
+    "Not at all, I've been fine on that front.",
+    "I've been so stressed with exams, I can barely sleep and I keep worrying about failing.",
+    "This exam is killing me lol",
+    "I'm not suicidal, just really overwhelmed with everything going on at home and at uni.",
+    "Honestly I don't know. Some days are okay and some days I can't get out of bed. " * 6,
+    "I want to end it all",
+    "I've been thinking about taking all my pills tonight, I have a plan",
+    "I feel hopeless and like a burden to everyone, goodbye",
+    "I want to end it",
+    "I dont want to be here anymore",
+    "thinking about jumping off a bridge",
+    "I wish I could disappear",
+    "I feel like a burden to everyone",
+]
+
+
+def percentile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1]
+
+
+def time_calls(fn, args_list, iterations):
+    samples = []
+    for i in range(iterations):
+        args = args_list[i % len(args_list)]
+        start = time.perf_counter_ns()
+        fn(*args)
+        samples.append((time.perf_counter_ns() - start) / 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50_000)
+    parser.add_argument("--budget-us", type=float, default=DEFAULT_BUDGET_US)
+    args = parser.parse_args()
+
+    messages = MESSAGES[:]
+    random.shuffle(messages)
+    detect = time_calls(detect_risk, [(m,) for m in messages], args.iterations)
+
+    # track runs on the full history; ten exchanges is the most a conversation reaches before classification
+    histories = []
+    for m in messages:
+        history = [msg for i in range(10) for msg in (AIMessage(content="How has that been?"), HumanMessage(content=MESSAGES[i]))]
+        histories.append(({"messages": history + [HumanMessage(content=m)]},))
+    track = time_calls(track_conversation, histories, args.iterations // 10)
+
+    print(f"{'':<28}{'p50 us':>10}{'p99 us':>10}{'max us':>10}")
+    for label, samples in (("detect_risk", detect), ("track_conversation node", track)):
+        print(f"{label:<28}{percentile(samples, 50):>10.1f}{percentile(samples, 99):>10.1f}{max(samples):>10.1f}")
+
+    p99 = percentile(track, 99)
+    if p99 > args.budget_us:
+        print(f"\n❌ track p99 {p99:.1f} us exceeds budget {args.budget_us:.0f} us")
+        sys.exit(1)
+    print(f"\n✅ Within budget ({args.budget_us:.0f} us per turn)")
+
+
+if __name__ == "__main__":
+    main()
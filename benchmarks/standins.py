@@ -0,0 +1,178 @@
+# ==============================
+# 🧪 Offline stand-ins for OpenAI, Qdrant and Supabase
+# ==============================
+# Each stand-in sleeps for a sample from a configurable latency distribution,
+# so load tests see realistic waits without any network access.
+#
+# Latency specs:  zero | fixed:S | uniform:A,B | lognormal:MEDIAN,SIGMA   (seconds)
+import math
+import os
+import random
+import re
+import time
+from datetime import date, timedelta
+from typing import Any, List, Optional
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-standin")
+os.environ.setdefault("PLAN_CACHE_PATH", "")  # plan cache stays in memory during load tests
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+from src.models import AnswerScores, ItemScore
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a zero-argument sampler returning seconds."""
+    kind, _, args = (spec or "zero").partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "zero":
+        return lambda: 0.0
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        median, sigma = values
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Unknown latency spec: {spec!r}")
+
+
+def _sleep(sampler):
+    delay = sampler()
+    if delay > 0:
+        time.sleep(delay)
+
+
+# ----- LLM -----
+_HELD_ID = re.compile(r"appointment_id: ([^)\s]+)\)")
+_CONFIRM = re.compile(r"\b(yes|yep|yess|sure|okay|ok|confirm|book it)\b", re.I)
+
+
+class StandInChatModel(BaseChatModel):
+    """Chat model that answers instantly (plus sampled latency) with plausible shapes."""
+
+    latency: Any = None
+    tool_names: List[str] = []
+    rag_probability: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "standin"
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs) -> ChatResult:
+        _sleep(self.latency)
+        text = " ".join(str(m.content) for m in messages)
+        tool_calls = []
+
+        if "rag" in self.tool_names and random.random() < self.rag_probability:
+            tool_calls.append({"name": "rag", "args": {"query": text[-200:]}, "id": f"call_{random.getrandbits(32)}"})
+        elif "book_appointment" in self.tool_names:
+            user_reply = str(messages[-1].content) if messages else ""
+            held = _HELD_ID.search(text)
+            if held and _CONFIRM.search(user_reply):
+                tool_calls.append({"name": "book_appointment", "args": {"appointment_id": held.group(1)}, "id": "call_book"})
+            else:
+                tool_calls.append({"name": "get_nearest_available_slot", "args": {}, "id": "call_slots"})
+
+        content = "" if tool_calls else "That sounds really hard. Can you tell me more about it?"
+        # Rough token counts (~4 chars/token) so usage metrics have something to show
+        usage = {"input_tokens": len(text) // 4, "output_tokens": len(content) // 4 + 10 * len(tool_calls)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        reply = AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def bind_tools(self, tools, **kwargs):
+        names = [getattr(t, "name", None) or getattr(t, "__name__", str(t)) for t in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    def with_structured_output(self, schema, **kwargs):
+        def respond(_input):
+            _sleep(self.latency)
+            fields = getattr(schema, "model_fields", {})
+            if "scores" in fields:
+                # Score the current item and, now and then, one of the other open items listed in the prompt
+                prompt = "\n".join(str(getattr(message, "content", message)) for message in _input)
+                items = [int(n) for n in re.findall(r"^item (\d+):", prompt, re.MULTILINE)]
+                scored = items[:2] if len(items) > 1 and random.random() < 0.3 else items[:1]
+                return schema(scores=[ItemScore(item=n, score=random.randint(0, 3), reasoning="stand-in") for n in scored])
+            if "disorder" in fields:
+                return schema(disorder=random.choice(["anxiety", "depression", "stress"]), reasoning="stand-in")
+            if "score" in fields:
+                return schema(score=random.randint(0, 3), reasoning="stand-in")
+            return schema.model_construct()
+        return RunnableLambda(respond)
+
+
+# ----- Qdrant -----
+class StandInVectorStore:
+    """similarity_search over a fixed corpus, with sampled latency."""
+
+    def __init__(self, latency, corpus_size: int = 200):
+        self.latency = latency
+        self.corpus = [
+            Document(page_content=f"Guidance snippet {i}: evidence-based coping strategies.", metadata={"_id": f"doc-{i}"})
+            for i in range(corpus_size)
+        ]
+
+    def similarity_search(self, query: str, k: int = 5):
+        _sleep(self.latency)
+        start = hash(query) % (len(self.corpus) - k)
+        return self.corpus[start:start + k]
+
+
+# ----- Supabase -----
+class _SlowBuilder:
+    """Wraps a query builder so execute() waits for the sampled round trip."""
+
+    def __init__(self, inner, latency):
+        self._inner = inner
+        self._latency = latency
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name == "execute":
+            def execute():
+                _sleep(self._latency)
+                return attr()
+            return execute
+        return lambda *args, **kwargs: _SlowBuilder(attr(*args, **kwargs), self._latency)
+
+
+class StandInSupabase:
+    """SQLite-backed Supabase stand-in with per-round-trip latency."""
+
+    def __init__(self, latency, path: str = ":memory:", seed_days: int = 30):
+        from src.local_backend import LocalSupabase
+        self.inner = LocalSupabase(path)
+        # Slots start tomorrow so every run sees the same pool regardless of time of day
+        self.inner.seed_appointments(days=seed_days, start=date.today() + timedelta(days=1), hours=range(0, 24))
+        self.latency = latency
+
+    def table(self, name):
+        return _SlowBuilder(self.inner.table(name), self.latency)
+
+    def rpc(self, name, params=None):
+        return _SlowBuilder(self.inner.rpc(name, params), self.latency)
+
+
+def install_standins(llm_latency: str = "zero", qdrant_latency: str = "zero", db_latency: str = "zero"):
+    """Point every LLM, vector store and Supabase call in `src` at the stand-ins."""
+    import src.helperfunctions as helperfunctions
+    import src.nodes as nodes
+    import src.supabase as supabase_module
+    import src.tools as tools
+
+    llm = StandInChatModel(latency=parse_latency(llm_latency))
+    nodes.llm = llm
+    nodes.llm_with_tools = llm.bind_tools([tools.rag])
+    nodes.llm_structured = llm.with_structured_output(nodes.Feedback)
+    nodes.llm_answer_scores = llm.with_structured_output(AnswerScores)
+    nodes.llm_with_tools_full = llm.bind_tools(tools.APPOINTMENT_TOOLS)
+    helperfunctions.questionnaire_reword_chain = helperfunctions.questionnaire_reword_prompt | llm
+
+    tools._vectorstore = StandInVectorStore(parse_latency(qdrant_latency))
+    supabase_module._client = StandInSupabase(parse_latency(db_latency))
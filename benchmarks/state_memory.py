@@ -0,0 +1,86 @@
+# ==============================
+# 📦 Session state memory benchmark
+# ==============================
+# Compares the old node pattern ({**state, "messages": state["messages"] + [...]}
+# with questionnaire_config / reword_questionnaire / rag_context text in the
+# state) against delta returns with references, over one simulated session.
+#
+#   python -m benchmarks.state_memory
+import pickle
+import tracemalloc
+from langchain_core.messages import AIMessage, HumanMessage
+from src.helperfunctions import QUESTIONNAIRES
+
+CHAT_TURNS = 5
+RAG_DOC = "Evidence-based guidance on coping with stress and low mood. " * 20
+
+
+def _old_state():
+    # The old state carried the full questionnaire definition
+    config = QUESTIONNAIRES['stress']
+    return {
+        "messages": [AIMessage(content="Hello, how are you feeling today?")],
+        "session_id": "bench", "student_id": "S0000", "iterator": 0,
+        "rag_context": None, "disorder": "stress",
+        "questionnaire_config": config.definition,
+        "reword_questionnaire": {f"pss{i}": f"Reworded version of: {q}" for i, q in config.questions.items()},
+    }
+
+
+def _new_state():
+    return {
+        "messages": [AIMessage(content="Hello, how are you feeling today?")],
+        "session_id": "bench", "student_id": "S0000", "iterator": 0,
+        "rag_doc_ids": None, "disorder": "stress",
+    }
+
+
+def _turns():
+    """(human text, ai text) for the chat turns plus one per questionnaire item."""
+    for i in range(CHAT_TURNS):
+        yield f"chat message {i}", f"therapist reply {i}"
+    for i in QUESTIONNAIRES['stress'].questions:
+        yield "sometimes", f"question {i + 1}"
+
+
+def run_old():
+    state = _old_state()
+    allocated = 0
+    for human, ai in _turns():
+        state = {**state, "messages": state["messages"] + [HumanMessage(content=human)]}
+        tracemalloc.start()
+        # Two nodes per turn, each copying the whole state and message history
+        state = {**state, "rag_context": "Retrieved Knowledge Base Context:\n\n" + RAG_DOC * 5}
+        state = {**state, "messages": state["messages"] + [AIMessage(content=ai)]}
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return state, allocated
+
+
+def run_new():
+    state = _new_state()
+    allocated = 0
+    for human, ai in _turns():
+        state["messages"].append(HumanMessage(content=human))
+        tracemalloc.start()
+        # Nodes return only what changed; the reducer appends the new message
+        update = {"rag_doc_ids": [f"doc-{i}" for i in range(5)]}
+        state.update(update)
+        update = {"messages": [AIMessage(content=ai)]}
+        state["messages"].extend(update["messages"])
+        allocated += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return state, allocated
+
+
+def main():
+    turns = CHAT_TURNS + QUESTIONNAIRES['stress'].item_count
+    for name, run in (("before", run_old), ("after", run_new)):
+        state, allocated = run()
+        size = len(pickle.dumps(state))
+        print(f"{name:>6}: session state {size / 1024:7.1f} KiB | "
+              f"per-turn node allocation {allocated / turns / 1024:7.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
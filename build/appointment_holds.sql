@@ -0,0 +1,83 @@
+-- ==============================
+-- 📅 Appointment holds (short-lived reservations)
+-- ==============================
+-- Run once in the Supabase SQL editor. Adds a `held_until` column and the
+-- RPCs used by src/reservations.py:
+--   hold_appointment         Available (or expired hold) -> Held for one student
+--   confirm_appointment_hold Held by this student (or Available) -> Booked, atomically
+--   release_appointment_hold Held by this student -> Available (a hold that will not be shown or used)
+--   release_expired_holds    bulk Held -> Available once held_until has passed
+
+alter table appointments add column if not exists held_until timestamptz;
+
+create index if not exists appointments_held_until_idx
+    on appointments (held_until)
+    where status = 'Held';
+
+create or replace function hold_appointment(
+    p_appointment_id text,
+    p_student_id text,
+    p_ttl_seconds integer default 300
+)
+returns setof appointments
+language sql
+as $$
+    update appointments
+       set status = 'Held',
+           student_id = p_student_id,
+           held_until = now() + make_interval(secs => p_ttl_seconds)
+     where appointment_id::text = p_appointment_id
+       and (status = 'Available'
+            or (status = 'Held' and (student_id = p_student_id or held_until < now())))
+    returning *;
+$$;
+
+create or replace function confirm_appointment_hold(
+    p_appointment_id text,
+    p_student_id text
+)
+returns setof appointments
+language sql
+as $$
+    update appointments
+       set status = 'Booked',
+           student_id = p_student_id,
+           held_until = null
+     where appointment_id::text = p_appointment_id
+       and (status = 'Available'
+            or (status = 'Held' and (student_id = p_student_id or held_until < now())))
+    returning *;
+$$;
+
+create or replace function release_appointment_hold(
+    p_appointment_id text,
+    p_student_id text
+)
+returns setof appointments
+language sql
+as $$
+    update appointments
+       set status = 'Available',
+           student_id = null,
+           held_until = null
+     where appointment_id::text = p_appointment_id
+       and status = 'Held'
+       and student_id = p_student_id
+    returning *;
+$$;
+
+create or replace function release_expired_holds()
+returns integer
+language sql
+as $$
+    with released as (
+        update appointments
+           set status = 'Available',
+               student_id = null,
+               held_until = null
+         where status = 'Held'
+           and held_until < now()
+        returning 1
+    )
+    select count(*)::integer from released;
+$$;
@@ -0,0 +1,175 @@
+## HTTP API ##
+# Headless async service over the unified workflow. Sessions live in the
+# checkpoint store, so several workers can run behind a load balancer:
+#
+#   python -m src.api            (API_HOST / API_PORT, default 0.0.0.0:8080)
+#
+# Endpoints
+#   POST /sessions                        {"student_id"}  -> greeting
+#   GET  /sessions/{session_id}                           -> phase + summary
+#   POST /sessions/{session_id}/turns     {"message"}     -> new assistant messages
+#   POST /sessions/{session_id}/turns/stream {"message"}  -> server-sent events
+#   GET  /metrics                                         -> Prometheus text format
+import asyncio
+import json
+import os
+import uuid
+from weakref import WeakValueDictionary
+
+from aiohttp import web
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src import metrics
+from src.tracing import turn_span
+from src.workflow import aturn_payload, get_workflow, session_config, session_phase
+
+API_HOST = os.environ.get("API_HOST", "0.0.0.0")
+API_PORT = int(os.environ.get("API_PORT", 8080))
+
+# Fields of the state that clients need to drive the UI
+SUMMARY_KEYS = (
+    "student_id", "disorder", "current_question_id", "total_score", "score_label",
+    "severity", "route", "suggested_appointment_id", "appointment_confirmed"
+)
+
+# One turn at a time per session within this worker
+_session_locks = WeakValueDictionary()
+
+
+def _session_lock(session_id: str) -> asyncio.Lock:
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[session_id] = lock
+    return lock
+
+
+def _summary(session_id: str, state: dict) -> dict:
+    return {
+        "session_id": session_id,
+        "phase": session_phase(state),
+        "state": {key: state.get(key) for key in SUMMARY_KEYS}
+    }
+
+
+def _new_ai_messages(state: dict, seen: int) -> list:
+    return [msg.content for msg in state.get("messages", [])[seen:] if isinstance(msg, AIMessage)]
+
+
+async def _read_json(request: web.Request, field: str) -> str:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+    value = body.get(field) if isinstance(body, dict) else None
+    if not value or not isinstance(value, str):
+        raise web.HTTPBadRequest(text=f"'{field}' is required")
+    return value
+
+
+async def _existing_state(app, session_id: str) -> dict:
+    snapshot = await app.aget_state(session_config(session_id))
+    if not snapshot.values:
+        raise web.HTTPNotFound(text=f"Unknown session: {session_id}")
+    return snapshot.values
+
+
+async def create_session(request: web.Request) -> web.Response:
+    student_id = await _read_json(request, "student_id")
+    app = request.app["workflow"]
+    session_id = str(uuid.uuid4())
+    with turn_span(session_id):
+        state = await app.ainvoke(
+            {"student_id": student_id, "session_id": session_id, "messages": []},
+            session_config(session_id)
+        )
+    return web.json_response({**_summary(session_id, state), "messages": _new_ai_messages(state, 0)})
+
+
+async def get_session(request: web.Request) -> web.Response:
+    session_id = request.match_info["session_id"]
+    state = await _existing_state(request.app["workflow"], session_id)
+    return web.json_response(_summary(session_id, state))
+
+
+async def post_turn(request: web.Request) -> web.Response:
+    session_id = request.match_info["session_id"]
+    message = await _read_json(request, "message")
+    app = request.app["workflow"]
+
+    async with _session_lock(session_id):
+        before = await _existing_state(app, session_id)
+        payload = await aturn_payload(app, session_id, message)
+        with turn_span(session_id):
+            state = await app.ainvoke(payload, session_config(session_id))
+
+    return web.json_response({
+        **_summary(session_id, state),
+        "messages": _new_ai_messages(state, len(before.get("messages", [])))
+    })
+
+
+async def stream_turn(request: web.Request) -> web.StreamResponse:
+    """Same as post_turn, but streams node progress and LLM tokens as SSE."""
+    session_id = request.match_info["session_id"]
+    message = await _read_json(request, "message")
+    app = request.app["workflow"]
+    config = session_config(session_id)
+    await _existing_state(app, session_id)  # 404 before the stream starts
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    await response.prepare(request)
+
+    async def send(event: str, data) -> None:
+        await response.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    async with _session_lock(session_id):
+        before = await _existing_state(app, session_id)
+        payload = await aturn_payload(app, session_id, message)
+        try:
+            with turn_span(session_id):
+                async for mode, chunk in app.astream(payload, config, stream_mode=["updates", "messages"]):
+                    if mode == "messages":
+                        token, metadata = chunk
+                        if isinstance(token, AIMessageChunk) and token.content:
+                            await send("token", {"node": metadata.get("langgraph_node"), "text": token.content})
+                    else:
+                        for node in chunk:
+                            if not node.startswith("__"):
+                                await send("node", {"node": node})
+            state = (await app.aget_state(config)).values
+            await send("done", {
+                **_summary(session_id, state),
+                "messages": _new_ai_messages(state, len(before.get("messages", [])))
+            })
+        except Exception as e:
+            await send("error", {"error": str(e)})
+
+    await response.write_eof()
+    return response
+
+
+async def get_metrics(request: web.Request) -> web.Response:
+    return web.Response(body=metrics.render().encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+def create_app(workflow=None) -> web.Application:
+    """aiohttp application serving the workflow (the process-wide one by default)."""
+    api = web.Application()
+    api["workflow"] = workflow or get_workflow()
+    api.add_routes([
+        web.post("/sessions", create_session),
+        web.get("/sessions/{session_id}", get_session),
+        web.post("/sessions/{session_id}/turns", post_turn),
+        web.post("/sessions/{session_id}/turns/stream", stream_turn),
+        web.get("/metrics", get_metrics),
+    ])
+    return api
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=API_HOST, port=API_PORT)
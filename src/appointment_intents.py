@@ -0,0 +1,148 @@
+## APPOINTMENT INTENTS ##
+# Local router for replies to a slot suggestion, so the common answers do not
+# need an LLM round trip in handle_appointment_interaction:
+#
+#   confirm       "yes", "book it", "sounds good"      -> book the held slot
+#   alternatives  "other times", "anything else?"      -> show (and hold) other slots
+#   time          "Monday afternoon", "tomorrow at 3"  -> slots nearest that time
+#   None          anything else (cancel, "the second one", questions) -> LLM
+#
+# Cancel/reject words are checked first, so "ok cancel it" never books. Negated
+# replies ("I can't do Monday", "anything but friday") and questions ("is there
+# parking at 5?") go to the LLM before any time parsing, so they never become a
+# time request for the day or hour they mention.
+#
+# Parses are cached per normalized message and hold only relative values
+# (day offset / weekday / hour), so a cached parse stays valid across days.
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import NamedTuple, Optional
+import re
+
+CONFIRM_WORDS = {"yes", "yeah", "yep", "yup", "yess", "yes please", "sure", "ok", "okay", "confirm", "perfect", "great"}
+CONFIRM_PHRASES = ("book it", "book that", "book this", "sounds good", "that works", "works for me", "please do",
+                   "lets do it", "go ahead", "i ll take it", "ill take it", "fine by me")
+ALTERNATIVE_PHRASES = ("other time", "other times", "other option", "other options", "another time", "another slot",
+                       "another day", "different time", "different day", "something else", "anything else",
+                       "more options", "alternatives", "alternative", "other slots", "other days", "doesnt work",
+                       "does not work", "cant make it", "cannot make it", "not available")
+NEGATORS = {"no", "not", "dont", "cant", "cannot", "wont", "nope", "nah", "never", "isnt", "doesnt", "wouldnt",
+            "couldnt", "unable", "but", "except", "besides", "apart"}
+REJECT_WORDS = {"cancel", "cancelled", "canceled", "cancellation", "unbook", "stop", "reject", "decline",
+                "nevermind", "forget", "wait"}
+REJECT_PHRASES = ("never mind", "hold on", "changed my mind", "call it off")
+
+WEEKDAYS = {name: i for i, names in enumerate((
+    ("monday", "mon"), ("tuesday", "tue", "tues"), ("wednesday", "wed"), ("thursday", "thu", "thurs"),
+    ("friday", "fri"), ("saturday", "sat"), ("sunday", "sun"),
+)) for name in names}
+DAY_PARTS = {"morning": 9, "noon": 12, "midday": 12, "lunchtime": 12, "afternoon": 13, "evening": 17, "tonight": 18}
+
+_CLOCK = re.compile(r"\b(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b")
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+
+
+class TimeRequest(NamedTuple):
+    """Relative form of a requested time; resolved against the current date by when()."""
+    day_offset: Optional[int] = None   # today = 0, tomorrow = 1
+    weekday: Optional[int] = None      # next occurrence of this weekday (Monday = 0)
+    next_week: bool = False
+    iso_date: Optional[str] = None
+    hour: Optional[int] = None
+    minute: int = 0
+
+
+class Intent(NamedTuple):
+    kind: str                          # confirm | alternatives | time
+    time: Optional[TimeRequest] = None
+
+
+def _normalize(message: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9:\- ]", " ", message.lower().replace("'", "")).split())
+
+
+def _parse_time(text: str) -> Optional[TimeRequest]:
+    fields = {}
+    words = text.split()
+    if "day after tomorrow" in text:
+        fields["day_offset"] = 2
+    elif "tomorrow" in words or "tmrw" in words:
+        fields["day_offset"] = 1
+    elif "today" in words or "tonight" in words:
+        fields["day_offset"] = 0
+    iso = _ISO_DATE.search(text)
+    if iso:
+        fields["iso_date"] = iso.group(0)
+    for i, word in enumerate(words):
+        if word in WEEKDAYS:
+            fields["weekday"] = WEEKDAYS[word]
+            if i and words[i - 1] == "next":
+                fields["next_week"] = True
+            break
+    if "next week" in text:
+        fields["next_week"] = True
+
+    for part, hour in DAY_PARTS.items():
+        if part in words:
+            fields["hour"] = hour
+    clock = _CLOCK.search(_ISO_DATE.sub(" ", text))
+    if clock and (clock.group(2) or clock.group(3) or clock.group(0).startswith("at")):
+        hour, minute, meridiem = int(clock.group(1)), int(clock.group(2) or 0), clock.group(3)
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+        elif meridiem is None and 1 <= hour <= 7:
+            hour += 12  # "at 3" means the afternoon during opening hours
+        if hour < 24 and minute < 60:
+            fields["hour"], fields["minute"] = hour, minute
+
+    return TimeRequest(**fields) if fields else None
+
+
+@lru_cache(maxsize=2048)
+def _classify(text: str, question: bool) -> Optional[Intent]:
+    words = set(text.split())
+    if words & REJECT_WORDS or any(phrase in text for phrase in REJECT_PHRASES):
+        return None
+    if any(phrase in text for phrase in ALTERNATIVE_PHRASES):
+        return Intent("alternatives")
+    if question or words & NEGATORS:
+        return None
+    requested = _parse_time(text)
+    if requested:
+        return Intent("time", requested)
+    if text in CONFIRM_WORDS or any(phrase in text for phrase in CONFIRM_PHRASES) or \
+            (len(words) <= 4 and words & CONFIRM_WORDS):
+        return Intent("confirm")
+    return None
+
+
+def classify_appointment_reply(message: str) -> Optional[Intent]:
+    """Intent of a reply to a slot suggestion, or None when only the LLM can tell."""
+    message = message or ""
+    return _classify(_normalize(message), "?" in message)
+
+
+def when(requested: TimeRequest, now: datetime = None) -> datetime:
+    """Earliest datetime matching a TimeRequest, never before now."""
+    now = now or datetime.now()
+    day = now.date()
+    if requested.iso_date:
+        day = date.fromisoformat(requested.iso_date)
+    elif requested.day_offset is not None:
+        day = day + timedelta(days=requested.day_offset)
+    elif requested.weekday is not None:
+        ahead = (requested.weekday - day.weekday()) % 7
+        if requested.next_week and ahead == 0:
+            ahead = 7
+        day = day + timedelta(days=ahead)
+    elif requested.next_week:
+        day = day + timedelta(days=7 - day.weekday())
+
+    if requested.hour is None:
+        return max(datetime.combine(day, datetime.min.time()), now)
+    moment = datetime.combine(day, datetime.min.time()).replace(hour=requested.hour, minute=requested.minute)
+    if moment < now and requested.iso_date is None and requested.day_offset is None and requested.weekday is None:
+        moment += timedelta(days=1)  # "at 3" after 3pm means tomorrow
+    return max(moment, now)
@@ -0,0 +1,55 @@
+## ASSESSMENT CACHE ##
+# Bounded LRU of each student's latest (condition, severity), filled when
+# total_score_label writes the result so the recommendation phase can start
+# without reading it back from Supabase.
+from collections import OrderedDict
+from threading import Lock
+import os
+
+from src.metrics import cache_lookup
+
+ASSESSMENT_CACHE_SIZE = int(os.environ.get("ASSESSMENT_CACHE_SIZE", 4096))
+
+
+class AssessmentCache:
+    """Thread-safe LRU mapping student_id -> (condition, severity)."""
+
+    def __init__(self, maxsize: int = ASSESSMENT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, student_id: str):
+        with self._lock:
+            entry = self._entries.get(student_id)
+            if entry is None:
+                self.misses += 1
+                cache_lookup("assessment", False)
+                return None
+            self._entries.move_to_end(student_id)
+            self.hits += 1
+            cache_lookup("assessment", True)
+            return entry
+
+    def put(self, student_id: str, condition: str, severity: str) -> None:
+        with self._lock:
+            self._entries[student_id] = (condition, severity)
+            self._entries.move_to_end(student_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, student_id: str) -> None:
+        with self._lock:
+            self._entries.pop(student_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+assessment_cache = AssessmentCache()
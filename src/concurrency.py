@@ -0,0 +1,150 @@
+## CONCURRENT TOOL CALLS ##
+# A process-wide bounded thread pool for blocking I/O (Supabase, Qdrant) that
+# a node can overlap. Work is submitted with a copy of the caller's context,
+# so trace spans and log session IDs follow it into the worker threads.
+#
+#   run_tool_calls  LLM tool calls: reads concurrently, writes in order
+#   fan_out         independent lookups with per-branch timeouts and fallbacks
+#
+#   TOOL_WORKERS  pool size (default 4); at most this many calls run at once per process
+#
+# fan_out does not use the pool: each branch gets its own thread, so a stuck
+# branch (a slow Qdrant) can never queue another one (the slots lookup) behind it.
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from threading import Lock, Thread
+from typing import Any, Callable, NamedTuple, Optional
+import contextvars
+import os
+import time
+
+from src.logs import get_logger
+from src.metrics import fanout_fallbacks, tool_latency
+
+log = get_logger(__name__)
+
+TOOL_WORKERS = int(os.environ.get("TOOL_WORKERS", 4))
+
+# Tools that only read; everything else is treated as mutating and runs in order
+READ_ONLY_TOOLS = {"get_nearest_available_slot", "check_conflicts", "retrieve_treatment_info", "rag"}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="tool")
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn on the shared pool inside a copy of the current context."""
+    return get_executor().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def invoke_tool(tool, args: dict) -> str:
+    """tool.invoke with its latency recorded; a failing call becomes an error string like the tools' own."""
+    start = time.perf_counter()
+    try:
+        return tool.invoke(args)
+    except Exception as e:
+        log.warning("Tool call failed: %s", e, extra={"tool": tool.name})
+        return f"Error running {tool.name}: {e}"
+    finally:
+        tool_latency.labels(tool.name).observe(time.perf_counter() - start)
+
+
+def run_tool_calls(calls: list, tools: dict) -> list:
+    """
+    Run [(tool name, args), ...] and return their results in the same order.
+    Consecutive read-only calls run concurrently; a mutating call waits for
+    everything before it and runs alone, so writes keep their order.
+    """
+    results = [None] * len(calls)
+    reads = []  # indexes of the read-only calls since the last write
+
+    def flush_reads():
+        if len(reads) == 1:
+            i = reads[0]
+            results[i] = invoke_tool(tools[calls[i][0]], calls[i][1])
+        elif reads:
+            futures = [(i, submit(invoke_tool, tools[calls[i][0]], calls[i][1])) for i in reads]
+            for i, future in futures:
+                results[i] = future.result()
+        reads.clear()
+
+    for i, (name, args) in enumerate(calls):
+        if name not in tools:
+            results[i] = f"Unknown tool: {name}"
+        elif name in READ_ONLY_TOOLS:
+            reads.append(i)
+        else:
+            flush_reads()
+            results[i] = invoke_tool(tools[name], args)
+    flush_reads()
+    return results
+
+
+## FAN-OUT ##
+class Branch(NamedTuple):
+    fn: Callable[[], Any]
+    timeout: float          # seconds; every branch starts when the fan-out does
+    fallback: Any = None    # used if fn raises or does not finish in time
+    on_discard: Optional[Callable[[Any], None]] = None  # undo a result that arrives after the timeout
+
+
+def start_branch(fn) -> Future:
+    """Run fn on a thread of its own, inside a copy of the current context."""
+    future = Future()
+    context = contextvars.copy_context()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn))
+        except BaseException as e:
+            future.set_exception(e)
+
+    Thread(target=run, name="fanout", daemon=True).start()
+    return future
+
+
+def _discard_late(name: str, branch: Branch):
+    def discard(future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        try:
+            branch.on_discard(future.result())
+        except Exception as e:
+            log.warning("Discarding a late fan-out result failed: %s", e, extra={"branch": name})
+    return discard
+
+
+def fan_out(branches: dict) -> dict:
+    """
+    Start every branch at once and return {name: result or fallback}.
+    A branch that times out keeps running, but nobody waits for it; its result
+    is handed to on_discard if it has one (e.g. to release a slot it held).
+    """
+    start = time.perf_counter()
+    futures = {name: start_branch(branch.fn) for name, branch in branches.items()}
+    results = {}
+    for name, branch in branches.items():
+        remaining = max(0.0, branch.timeout - (time.perf_counter() - start))
+        try:
+            results[name] = futures[name].result(timeout=remaining)
+        except FutureTimeout:
+            if branch.on_discard is not None:
+                futures[name].add_done_callback(_discard_late(name, branch))
+            fanout_fallbacks.labels(name, "timeout").inc()
+            log.warning("Fan-out branch timed out, using fallback", extra={"branch": name, "timeout": branch.timeout})
+            results[name] = branch.fallback
+        except Exception as e:
+            fanout_fallbacks.labels(name, "error").inc()
+            log.warning("Fan-out branch failed, using fallback: %s", e, extra={"branch": name})
+            results[name] = branch.fallback
+    return results
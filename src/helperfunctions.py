@@ -1,25 +1,57 @@
-from typing import List
+from typing import List, Optional
+from collections import OrderedDict
+from threading import Lock
+import hashlib
+import os
 from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
 from src.tools import retrieve_treatment_info
+from src.reservations import hold_slot, release_hold
 from src.models import UnifiedState
+from src.questionnaires import (
+    DEFAULT_DISORDER, DISORDERS, QUESTIONNAIRES, QUESTIONNAIRES_BY_TYPE, QuestionnaireSpec, get_questionnaire_config, route_for_severity
+)
 from src.supabase import supabase
+from src.assessment_cache import assessment_cache
+from src.metrics import cache_lookup
+from src.logs import get_logger
 from langchain_core.prompts import ChatPromptTemplate
-from src.tools import llm
-
-SEVERITY_ROUTING = {
-    "minimal depression": "treatment_plan",
-    "mild depression": "treatment_plan",
-    "minimal anxiety": "treatment_plan",
-    "low stress": "treatment_plan",
-    "moderate depression": "treatment_plan",
-    "mild anxiety": "treatment_plan",
-    "moderate stress": "treatment_plan",
-    "moderately severe depression": "appointment",
-    "moderate anxiety": "appointment",
-    "high stress": "appointment",
-    "severe depression": "appointment",
-    "moderate to severe anxiety": "appointment"
-}
+from src.tools import LazyModel, llm
+
+log = get_logger(__name__)
+
+# Retrieved documents are kept here, keyed by ID, so graph state only carries the IDs
+DOCUMENT_CACHE_SIZE = 512
+_document_cache = OrderedDict()
+_document_cache_lock = Lock()
+
+def document_id(doc: Document) -> str:
+    """Stable ID for a retrieved document (Qdrant point ID, else a content hash)."""
+    doc_id = doc.metadata.get("_id") or getattr(doc, "id", None)
+    if doc_id is None:
+        doc_id = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+    return str(doc_id)
+
+def remember_documents(docs: List[Document]) -> List[str]:
+    """Cache retrieved documents and return their IDs for the state."""
+    ids = []
+    with _document_cache_lock:
+        for doc in docs:
+            doc_id = document_id(doc)
+            _document_cache[doc_id] = doc
+            _document_cache.move_to_end(doc_id)
+            ids.append(doc_id)
+        while len(_document_cache) > DOCUMENT_CACHE_SIZE:
+            _document_cache.popitem(last=False)
+    return ids
+
+def documents_for_ids(doc_ids: List[str]) -> List[Document]:
+    """Resolve document IDs from the state back to the cached documents."""
+    with _document_cache_lock:
+        docs = [_document_cache[doc_id] for doc_id in doc_ids or [] if doc_id in _document_cache]
+    if doc_ids:
+        cache_lookup("documents", len(docs) == len(doc_ids))
+    return docs
 
 def format_documents(docs: List[Document]) -> str:
     """Format retrieved documents into a readable context string."""
@@ -30,8 +62,27 @@ def format_documents(docs: List[Document]) -> str:
         context += f"[Document {i}]\n{doc.page_content}\n\n"
     return context
 
+def tool_result_text(result) -> str:
+    """A tool's return value as chat text; retrieval tools return Documents."""
+    if isinstance(result, list) and all(isinstance(doc, Document) for doc in result):
+        return format_documents(result)
+    return result if isinstance(result, str) else str(result)
+
+def route_entry(state: UnifiedState) -> str:
+    """Where a turn enters the graph: greeting for new sessions, tracking while chatting."""
+    stage = state.get("workflow_stage")
+    if not stage:
+        return "start_conversation"
+    return "track" if stage == "conversation" else "end"
+
+def has_user_message(state: UnifiedState) -> bool:
+    """True once the student has said something in this session."""
+    return any(isinstance(msg, HumanMessage) for msg in state.get("messages", []))
+
 def should_classify(state: UnifiedState) -> str:
     """Determines whether to continue conversation or classify disorder."""
+    if state.get("risk"):
+        return "safety"
     iterator = state.get("iterator", 0)
     return "classify" if iterator >= 5 else "continue"
 
@@ -68,130 +119,144 @@ Question: {question}
 Your conversational version (just the reworded question, nothing else):""".strip()
 )
 
-questionnaire_reword_chain = questionnaire_reword_prompt | llm
-
-
-# QUESTIONNAIRE DEFINITIONS
-# ============================================
-
-QUESTIONNAIRES = {
-    'stress': {
-        'type': 'pss',
-        'name': 'Perceived Stress Scale',
-        'questions': {
-            1: 'have you been upset because of something that happened unexpectedly?',
-            2: 'how often have you felt that you were unable to control the important things in your life?',
-            3: 'how often have you felt nervous and stressed?',
-            4: 'how often have you been angered because of things that were outside of your control?',
-            5: 'how often have you felt that difficulties were piling up so high that you could not overcome them?',
-            6: 'how often have you found that you could not cope with all the things that you had to do?',
-            7: 'how often have you felt confident about your ability to handle your personal problems?',
-            8: 'how often have you felt that things were going your way?',
-            9: 'how often have you been able to control irritations in your life?',
-            10:'how often have you felt that you were on top of things?'
-        },
-        'reverse_scoring': [7, 8, 9, 10],
-        'score_ranges': [
-            (0, 13, 'Low stress'),
-            (14, 26, 'Moderate stress'),
-            (27, 40, 'High stress')
-        ],
-        'max_score': 40,
-        'scale_type': '0-4'  # PSS uses 0-4 scale
-    },
-    'depression': {
-        'type': 'phq',
-        'name': 'Patient Health Questionnaire (PHQ-9)',
-        'questions': {
-            1: 'Little interest or pleasure in doing things',
-            2: 'Feeling down, depressed, or hopeless',
-            3: 'Trouble falling or staying asleep, or sleeping too much',
-            4: 'Feeling tired or having little energy',
-            5: 'Poor appetite or overeating',
-            6: 'Feeling bad about yourself - or that you are a failure or have let yourself or your family down',
-            7: 'Trouble concentrating on things, such as reading the newspaper or watching television',
-            8: 'Moving or speaking so slowly that other people could have noticed. Or the opposite - being so fidgety or restless that you have been moving around a lot more than usual',
-            9: 'Thoughts that you would be better off dead, or of hurting yourself in some way'
-        },
-        'reverse_scoring': [],  # PHQ-9 has no reverse scoring
-        'score_ranges': [
-            (0, 4, 'Minimal depression'),
-            (5, 9, 'Mild depression'),
-            (10, 14, 'Moderate depression'),
-            (15, 19, 'Moderately severe depression'),
-            (20, 27, 'Severe depression')
-        ],
-        'max_score': 27,
-        'scale_type': '0-3'  # PHQ-9 uses 0-3 scale
-    },
-    'anxiety': {
-        'type': 'gad',
-        'name': 'Generalized Anxiety Disorder (GAD-7)',
-        'questions': {
-            1: 'Feeling nervous, anxious, or on edge',
-            2: 'Not being able to stop or control worrying',
-            3: 'Worrying too much about different things',
-            4: 'Trouble relaxing',
-            5: 'Being so restless that it\'s hard to sit still',
-            6: 'Becoming easily annoyed or irritable',
-            7: 'Feeling afraid as if something awful might happen'
-        },
-        'reverse_scoring': [],  # GAD-7 has no reverse scoring
-        'score_ranges': [
-            (0, 4, 'Minimal anxiety'),
-            (5, 9, 'Mild anxiety'),
-            (10, 14, 'Moderate anxiety'),
-            (15, 21, 'Severe anxiety')
-        ],
-        'max_score': 21,
-        'scale_type': '0-3'  # GAD-7 uses 0-3 scale
-    }
-}
+questionnaire_reword_chain = LazyModel(lambda: questionnaire_reword_prompt | llm.resolve())
+
+
+## ADAPTIVE QUESTIONNAIRES ##
+# Stop asking once the remaining items can no longer change the score label.
+# Items listed as mandatory in questionnaires.json are still asked. ADAPTIVE_QUESTIONNAIRE=0
+# restores asking every item.
+ADAPTIVE_QUESTIONNAIRE = os.environ.get("ADAPTIVE_QUESTIONNAIRE", "1") != "0"
+# Let one free-text answer score several open items in the same LLM call
+MULTI_ITEM_EXTRACTION = os.environ.get("MULTI_ITEM_EXTRACTION", "1") != "0"
+
+# Reworded questions depend only on the questionnaire, so they are generated
+# once per process and shared by every session instead of living in the state
+_reworded_questions = {}
+_reworded_questions_lock = Lock()
+
+def get_reworded_questions(disorder: str) -> dict:
+    """Conversational versions of a questionnaire's items, keyed like 'pss1'."""
+    reworded = _reworded_questions.get(disorder)
+    cache_lookup("reworded_questions", reworded is not None)
+    if reworded is not None:
+        return reworded
+
+    with _reworded_questions_lock:
+        reworded = _reworded_questions.get(disorder)
+        if reworded is None:
+            config = get_questionnaire_config(disorder)
+            reworded = {}
+            for n in range(1, config.item_count + 1):
+                reword_question = questionnaire_reword_chain.invoke({"question": config.items[n]}).content
+                reworded[config.columns[n]] = reword_question
+            _reworded_questions[disorder] = reworded
+    return reworded
 
 
 ## Graph 3 Functions
+# Recommendation nodes fetch knowledge-base context and slots concurrently
+# (src/concurrency.fan_out); past these limits they go ahead without them
+RAG_TIMEOUT_SECONDS = float(os.environ.get("RAG_TIMEOUT_SECONDS", 2.0))
+SLOTS_TIMEOUT_SECONDS = float(os.environ.get("SLOTS_TIMEOUT_SECONDS", 5.0))
+
+def hold_first_slot(slots: List[dict], student_id: str) -> tuple:
+    """
+    Hold the first of `slots` this student can get, so confirming it later does
+    not race everyone else who was shown the same slot.
+    Returns (held appointment_id or None, slots with the held one first).
+    """
+    for slot in slots:
+        if student_id and hold_slot(slot['id'], student_id):
+            log.info("Holding slot", extra={"appointment_id": slot['id'], "student_id": student_id})
+            return slot['id'], [slot] + [other for other in slots if other is not slot]
+    return None, slots
+
+
+def release_held_slot(held: tuple, student_id: str) -> None:
+    """Undo hold_first_slot for a result that will not be shown."""
+    appointment_id, _ = held
+    if appointment_id and student_id:
+        release_hold(appointment_id, student_id)
+        log.info("Released slot hold", extra={"appointment_id": appointment_id, "student_id": student_id})
+
 ## DB Helper function
 
-def get_student_assessment_from_db(student_id: str) -> tuple[str, str]:
+# Used when no real assessment can be read; never cached
+DEFAULT_ASSESSMENT = (DEFAULT_DISORDER, QUESTIONNAIRES[DEFAULT_DISORDER].default_severity)
+
+def get_student_assessment_from_db(student_id: str) -> Optional[tuple[str, str]]:
     """
     Get condition and severity from Supabase based on latest questionnaire.
-    Returns: (condition, severity) tuple
+    Returns: (condition, severity) tuple, or None if no scored row could be read
     """
     if supabase is None:
-        print("⚠️  Supabase not initialized. Using defaults.")
-        return ("stress", "moderate stress")
+        log.warning("Supabase not initialized, using default assessment")
+        return None
 
     try:
+        label_columns = ", ".join(spec.label_column for spec in QUESTIONNAIRES.values())
         response = supabase.table("student_questionnaire_results") \
-            .select("type, pss_score_label, phq_score_label, gad_score_label") \
+            .select(f"type, {label_columns}") \
             .eq("student_id", student_id) \
             .order("timestamp", desc=True) \
             .limit(1) \
             .execute()
 
         if not response.data:
-            print(f"⚠️  No results found for student {student_id}")
-            return ("stress", "moderate stress")
+            log.warning("No questionnaire results found", extra={"student_id": student_id})
+            return None
 
         result = response.data[0]
-        questionnaire_type = result["type"].upper()
+        config = QUESTIONNAIRES_BY_TYPE.get((result.get("type") or "").upper())
+        severity = result.get(config.label_column) if config else None
+        if severity is None:
+            log.warning("Latest questionnaire has no score label", extra={"student_id": student_id})
+            return None
 
-        type_mapping = {
-            "PSS": ("stress", result.get("pss_score_label", "moderate stress")),
-            "PHQ": ("depression", result.get("phq_score_label", "moderate depression")),
-            "GAD": ("anxiety", result.get("gad_score_label", "mild anxiety"))
-        }
+        return (config.disorder, severity)
 
-        condition, severity = type_mapping.get(
-            questionnaire_type,
-            ("stress", "moderate stress")
-        )
+    except Exception as e:
+        log.error("Error retrieving assessment: %s", e)
+        return None
 
-        return (condition, severity or "moderate stress")
+def get_student_assessment(student_id: str) -> tuple[str, str]:
+    """
+    Latest (condition, severity) for a student: from the assessment cache when
+    total_score_label ran in this process, otherwise from Supabase. Falls back
+    to DEFAULT_ASSESSMENT (uncached) when no scored row can be read.
+    """
+    cached = assessment_cache.get(student_id)
+    if cached is not None:
+        return cached
+
+    assessment = get_student_assessment_from_db(student_id)
+    if assessment is None:
+        return DEFAULT_ASSESSMENT
+    condition, severity = assessment
+    assessment_cache.put(student_id, condition, severity)
+    return (condition, severity)
+
+def save_student_assessment(student_id: str, questionnaire_type: str, condition: str,
+                            total_score: int, score_label: str):
+    """
+    Write-through: store the final score/label in Supabase, then in the
+    assessment cache. Nothing is cached if the DB write fails or matches no row.
+    """
+    config = QUESTIONNAIRES_BY_TYPE[questionnaire_type.upper()]
+    update_data = {
+        config.total_column: total_score,
+        config.label_column: score_label
+    }
+    result = supabase.table('student_questionnaire_results').update(
+        update_data
+    ).eq('student_id', student_id).execute()
 
-    except Exception as e:
-        print(f"⚠️  Error retrieving assessment: {str(e)}")
-        return ("stress", "moderate stress")
+    if result.data:
+        assessment_cache.put(student_id, condition, score_label)
+    else:
+        log.warning("Assessment update matched no row, not cached", extra={"student_id": student_id})
+    return result
 
 def retrieve_context_for_recommendation(condition: str, severity: str) -> str:
     """
@@ -205,9 +270,9 @@ def retrieve_context_for_recommendation(condition: str, severity: str) -> str:
         })
 
         context = format_documents(retrieved_docs)
-        print(f"✓ RAG context retrieved ({len(retrieved_docs)} documents)")
+        log.debug("Recommendation context retrieved", extra={"documents": len(retrieved_docs)})
         return context
 
     except Exception as e:
-        print(f"⚠️  RAG retrieval error: {str(e)}")
+        log.warning("RAG retrieval error: %s", e)
         return ""
@@ -0,0 +1,327 @@
+## LOCAL SUPABASE BACKEND ##
+# SQLite stand-in for the Supabase tables this project uses. It implements the
+# subset of the PostgREST query builder we call (table().select/insert/update/
+# eq/gte/lte/lt/order/limit/execute) plus the appointment-hold RPCs, so the whole
+# flow can run and be benchmarked offline.
+# Select it with SUPABASE_BACKEND=sqlite (path from SUPABASE_SQLITE_PATH).
+from datetime import date, datetime, timedelta, timezone
+from threading import RLock
+import re
+import sqlite3
+
+from src.questionnaires import QUESTIONNAIRES
+
+# Item, total and label columns of every instrument in questionnaires.json
+_RESULT_COLUMNS = [
+    (column, kind)
+    for spec in QUESTIONNAIRES.values()
+    for column, kind in [(column, "INTEGER") for column in spec.columns[1:]]
+    + [(spec.total_column, "INTEGER"), (spec.label_column, "TEXT")]
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS student_questionnaire_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id TEXT,
+    timestamp TEXT,
+    type TEXT,
+    {", ".join(f"{column} {kind}" for column, kind in _RESULT_COLUMNS)}
+);
+CREATE INDEX IF NOT EXISTS sqr_student_idx ON student_questionnaire_results (student_id);
+
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    appointment_date TEXT NOT NULL,
+    appointment_time TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'Available',
+    student_id TEXT,
+    held_until TEXT
+);
+CREATE INDEX IF NOT EXISTS appointments_status_date_idx ON appointments (status, appointment_date, appointment_time);
+CREATE INDEX IF NOT EXISTS appointments_date_idx ON appointments (appointment_date, appointment_time);
+"""
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _column(name: str) -> str:
+    """Validate a column/table name before it is interpolated into SQL."""
+    name = name.strip()
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name!r}")
+    return name
+
+
+class APIResponse:
+    """Mirrors postgrest's APIResponse: rows are in `.data`."""
+
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Awaitable:
+    """Lets the async client `await builder.execute()` like the real AsyncClient."""
+
+    def __init__(self, response: APIResponse):
+        self._response = response
+
+    def __await__(self):
+        if False:
+            yield
+        return self._response
+
+
+class QueryBuilder:
+    """One PostgREST-style request against a single table."""
+
+    def __init__(self, backend: "LocalSupabase", table: str):
+        self._backend = backend
+        self._table = _column(table)
+        self._action = None
+        self._columns = "*"
+        self._payload = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+
+    # ----- actions -----
+    def select(self, columns: str = "*", count=None):
+        self._action = "select"
+        self._columns = columns
+        return self
+
+    def insert(self, payload):
+        self._action = "insert"
+        self._payload = payload if isinstance(payload, list) else [payload]
+        return self
+
+    def update(self, payload: dict):
+        self._action = "update"
+        self._payload = payload
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # ----- filters / modifiers -----
+    def _filter(self, column: str, op: str, value):
+        self._filters.append((_column(column), op, value))
+        return self
+
+    def eq(self, column: str, value):
+        return self._filter(column, "=", value)
+
+    def neq(self, column: str, value):
+        return self._filter(column, "!=", value)
+
+    def gt(self, column: str, value):
+        return self._filter(column, ">", value)
+
+    def gte(self, column: str, value):
+        return self._filter(column, ">=", value)
+
+    def lt(self, column: str, value):
+        return self._filter(column, "<", value)
+
+    def lte(self, column: str, value):
+        return self._filter(column, "<=", value)
+
+    def order(self, column: str, desc: bool = False):
+        self._order.append((_column(column), "DESC" if desc else "ASC"))
+        return self
+
+    def limit(self, size: int):
+        self._limit = int(size)
+        return self
+
+    # ----- execution -----
+    def _where(self):
+        if not self._filters:
+            return "", []
+        clauses = []
+        params = []
+        for column, op, value in self._filters:
+            if value is None and op in ("=", "!="):
+                clauses.append(f"{column} IS {'NOT ' if op == '!=' else ''}NULL")
+            else:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        return " WHERE " + " AND ".join(clauses), params
+
+    def _select_list(self):
+        if self._columns.strip() == "*":
+            return "*"
+        return ", ".join(_column(column) for column in self._columns.split(","))
+
+    def _run(self) -> APIResponse:
+        backend = self._backend
+        with backend.lock:
+            conn = backend.conn
+            where, params = self._where()
+
+            if self._action == "select":
+                sql = f"SELECT {self._select_list()} FROM {self._table}{where}"
+                if self._order:
+                    sql += " ORDER BY " + ", ".join(f"{column} {direction}" for column, direction in self._order)
+                if self._limit is not None:
+                    sql += f" LIMIT {self._limit}"
+                rows = conn.execute(sql, params).fetchall()
+                return APIResponse([dict(row) for row in rows])
+
+            if self._action == "insert":
+                inserted = []
+                for record in self._payload:
+                    columns = [_column(column) for column in record]
+                    placeholders = ", ".join("?" for _ in columns)
+                    cursor = conn.execute(
+                        f"INSERT INTO {self._table} ({', '.join(columns)}) VALUES ({placeholders})",
+                        list(record.values())
+                    )
+                    row = conn.execute(f"SELECT * FROM {self._table} WHERE rowid = ?", (cursor.lastrowid,)).fetchone()
+                    inserted.append(dict(row))
+                conn.commit()
+                return APIResponse(inserted)
+
+            if self._action == "update":
+                rowids = [row[0] for row in conn.execute(f"SELECT rowid FROM {self._table}{where}", params)]
+                if not rowids:
+                    return APIResponse([])
+                assignments = ", ".join(f"{_column(column)} = ?" for column in self._payload)
+                marks = ", ".join("?" for _ in rowids)
+                conn.execute(
+                    f"UPDATE {self._table} SET {assignments} WHERE rowid IN ({marks})",
+                    list(self._payload.values()) + rowids
+                )
+                conn.commit()
+                rows = conn.execute(f"SELECT * FROM {self._table} WHERE rowid IN ({marks})", rowids).fetchall()
+                return APIResponse([dict(row) for row in rows])
+
+            if self._action == "delete":
+                rows = conn.execute(f"SELECT * FROM {self._table}{where}", params).fetchall()
+                conn.execute(f"DELETE FROM {self._table}{where}", params)
+                conn.commit()
+                return APIResponse([dict(row) for row in rows])
+
+        raise ValueError("Call select(), insert(), update() or delete() before execute()")
+
+    def execute(self):
+        response = self._run()
+        return _Awaitable(response) if self._backend.is_async else response
+
+
+class RPCBuilder:
+    """Local implementations of the Postgres functions in build/appointment_holds.sql."""
+
+    def __init__(self, backend: "LocalSupabase", name: str, params: dict):
+        self._backend = backend
+        self._name = name
+        self._params = params or {}
+
+    def _run(self) -> APIResponse:
+        now = datetime.now(timezone.utc).isoformat()
+        params = self._params
+        with self._backend.lock:
+            conn = self._backend.conn
+
+            if self._name in ("hold_appointment", "confirm_appointment_hold"):
+                if self._name == "hold_appointment":
+                    held_until = (datetime.now(timezone.utc) + timedelta(seconds=params.get("p_ttl_seconds", 300))).isoformat()
+                    assignments, values = "status = 'Held', student_id = ?, held_until = ?", [params["p_student_id"], held_until]
+                else:
+                    assignments, values = "status = 'Booked', student_id = ?, held_until = NULL", [params["p_student_id"]]
+                cursor = conn.execute(
+                    f"""UPDATE appointments SET {assignments}
+                        WHERE appointment_id = ?
+                          AND (status = 'Available'
+                               OR (status = 'Held' AND (student_id = ? OR held_until < ?)))""",
+                    values + [params["p_appointment_id"], params["p_student_id"], now]
+                )
+                conn.commit()
+                if not cursor.rowcount:
+                    return APIResponse([])
+                row = conn.execute("SELECT * FROM appointments WHERE appointment_id = ?", (params["p_appointment_id"],)).fetchone()
+                return APIResponse([dict(row)])
+
+            if self._name == "release_appointment_hold":
+                cursor = conn.execute(
+                    """UPDATE appointments SET status = 'Available', student_id = NULL, held_until = NULL
+                       WHERE appointment_id = ? AND status = 'Held' AND student_id = ?""",
+                    (params["p_appointment_id"], params["p_student_id"])
+                )
+                conn.commit()
+                if not cursor.rowcount:
+                    return APIResponse([])
+                row = conn.execute("SELECT * FROM appointments WHERE appointment_id = ?", (params["p_appointment_id"],)).fetchone()
+                return APIResponse([dict(row)])
+
+            if self._name == "release_expired_holds":
+                cursor = conn.execute(
+                    """UPDATE appointments SET status = 'Available', student_id = NULL, held_until = NULL
+                       WHERE status = 'Held' AND held_until < ?""",
+                    (now,)
+                )
+                conn.commit()
+                return APIResponse(cursor.rowcount)
+
+        raise ValueError(f"Unknown RPC: {self._name}")
+
+    def execute(self):
+        response = self._run()
+        return _Awaitable(response) if self._backend.is_async else response
+
+
+class LocalSupabase:
+    """Drop-in for supabase.Client covering table() and rpc() on SQLite."""
+
+    def __init__(self, path: str = ":memory:", is_async: bool = False):
+        self.path = path
+        self.is_async = is_async
+        self.lock = RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._add_instrument_columns()
+
+    def _add_instrument_columns(self):
+        """Add the columns of instruments added to questionnaires.json since the database was created."""
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(student_questionnaire_results)")}
+        for column, kind in _RESULT_COLUMNS:
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE student_questionnaire_results ADD COLUMN {column} {kind}")
+        self.conn.commit()
+
+    def as_async(self) -> "LocalSupabase":
+        """Async view over the same database, for code written against acreate_client."""
+        clone = object.__new__(LocalSupabase)
+        clone.__dict__.update(self.__dict__)
+        clone.is_async = True
+        return clone
+
+    def table(self, name: str) -> QueryBuilder:
+        return QueryBuilder(self, name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict = None) -> RPCBuilder:
+        return RPCBuilder(self, name, params)
+
+    def seed_appointments(self, days: int = 30, start: date = None, hours=range(9, 17)) -> int:
+        """Fill `appointments` with Available slots (one per hour per day) for load tests."""
+        start = start or date.today()
+        rows = [
+            ((start + timedelta(days=day)).isoformat(), f"{hour:02d}:00:00")
+            for day in range(days)
+            for hour in hours
+        ]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO appointments (appointment_date, appointment_time, status) VALUES (?, ?, 'Available')",
+                rows
+            )
+            self.conn.commit()
+        return len(rows)
@@ -0,0 +1,176 @@
+## STRUCTURED LOGGING ##
+# Leveled, structured logs for the workflow. Request threads only put records
+# on a queue; formatting, PII redaction and the stderr write happen on a
+# background QueueListener thread. Every record carries the session_id of the
+# node that emitted it, so one conversation can be followed across workers.
+#
+#   LOG_LEVEL   DEBUG | INFO (default) | WARNING | ERROR
+#   LOG_FORMAT  text (default) | json
+#   LOG_REDACT  1 (default) | 0 to log answers and student IDs verbatim (local debugging only)
+#
+# Debug output is disabled by default; a disabled logger.debug() call costs one
+# cached level check. Guard expensive arguments with logger.isEnabledFor(DEBUG).
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from threading import Lock
+import atexit
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import sys
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+LOG_REDACT = os.environ.get("LOG_REDACT", "1") != "0"
+ROOT_LOGGER = "mental_health_agent"
+
+DEBUG = logging.DEBUG
+
+# Free-text fields that may contain what the student wrote; never logged verbatim
+REDACTED_FIELDS = {"answer", "user_message", "message", "content", "query", "reasoning", "record"}
+PSEUDONYMIZED_FIELDS = {"student_id"}
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+_PHONE = re.compile(r"(?<![\w.:])\+?\d[\d\s().-]{7,}\d(?![\w.:])")
+_NOT_PHONE = re.compile(r"\d{1,3}(\.\d{1,3}){3}|\d{4}-\d{2}-\d{2}")  # IP addresses, ISO dates
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "session_id"}
+
+session_id_var = ContextVar("log_session_id", default="-")
+
+
+## REDACTION ##
+def pseudonymize(value) -> str:
+    """Stable short hash so one student's records still correlate without the raw ID."""
+    return "anon-" + hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:10]
+
+
+def _mask_phone(match) -> str:
+    candidate = match.group(0)
+    digits = sum(ch.isdigit() for ch in candidate)
+    if digits < 9 or digits > 15 or _NOT_PHONE.search(candidate):
+        return candidate
+    return "[phone]"
+
+
+def redact_text(text: str) -> str:
+    return _PHONE.sub(_mask_phone, _EMAIL.sub("[email]", text))
+
+
+def redact_field(key: str, value):
+    if not LOG_REDACT or value is None:
+        return value
+    if key in REDACTED_FIELDS:
+        return f"[redacted {len(str(value))} chars]"
+    if key in PSEUDONYMIZED_FIELDS:
+        return pseudonymize(value)
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: redact_field(key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+## FORMATTERS (run on the listener thread) ##
+class TextFormatter(logging.Formatter):
+    """time LEVEL [session] logger: message | key=value ..."""
+
+    def format(self, record):
+        record.message = redact_text(record.getMessage()) if LOG_REDACT else record.getMessage()
+        line = f"{self.formatTime(record)} {record.levelname:<7} [{record.session_id}] {record.name}: {record.message}"
+        fields = _fields(record)
+        if fields:
+            line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        message = record.getMessage()
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "session_id": record.session_id,
+            "msg": redact_text(message) if LOG_REDACT else message,
+            **_fields(record)
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+## NON-BLOCKING HANDLER ##
+class _SessionQueueHandler(QueueHandler):
+    """Stamps the session ID and enqueues; all formatting is left to the listener."""
+
+    def prepare(self, record):
+        record.session_id = session_id_var.get()
+        return record
+
+
+_listener = None
+_configure_lock = Lock()
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, stream=None) -> None:
+    """Attach the queue handler to the package logger (idempotent unless re-called with new settings)."""
+    global _listener
+    with _configure_lock:
+        root = logging.getLogger(ROOT_LOGGER)
+        if _listener is not None:
+            _listener.stop()
+            root.handlers.clear()
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JSONFormatter() if fmt == "json" else TextFormatter())
+
+        records = queue.SimpleQueue()
+        root.addHandler(_SessionQueueHandler(records))
+        root.setLevel(level)
+        root.propagate = False
+
+        _listener = QueueListener(records, output, respect_handler_level=True)
+        _listener.start()
+
+
+def flush_logs() -> None:
+    """Drain the queue (stops and restarts the listener); used at exit and in tooling."""
+    if _listener is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def _shutdown():
+    if _listener is not None:
+        _listener.stop()
+
+
+atexit.register(_shutdown)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the package namespace, configuring the queue handler on first use."""
+    if _listener is None:
+        configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name.rsplit('.', 1)[-1]}")
+
+
+def with_session_id(node):
+    """Wrap a node so everything it logs carries state['session_id']."""
+    @functools.wraps(node)
+    def wrapper(state, *args, **kwargs):
+        token = session_id_var.set(state.get("session_id") or "-")
+        try:
+            return node(state, *args, **kwargs)
+        finally:
+            session_id_var.reset(token)
+    return wrapper
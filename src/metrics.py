@@ -0,0 +1,272 @@
+## METRICS ##
+# Process-wide counters and histograms in the Prometheus text exposition
+# format, scraped from GET /metrics (src/api.py) or, for Streamlit
+# deployments, from a small HTTP server on METRICS_HOST:METRICS_PORT.
+#
+# The interface mirrors prometheus_client (metric.labels(...).inc/observe)
+# without adding a dependency.
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+import functools
+import os
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.logs import get_logger
+
+log = get_logger(__name__)
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))  # 0 disables the standalone server
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        _registry.append(self)
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for key, child in children:
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self.labels().inc(amount)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {child.value:g}"]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def _render_child(self, key, child):
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            bucket_labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {child.sum:g}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All registered metrics in the text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+## METRIC DEFINITIONS ##
+node_latency = Histogram("workflow_node_duration_seconds", "Wall time of each workflow node.", ["node"])
+phase_transitions = Counter("workflow_phase_transitions_total", "Sessions moving between phases.", ["from_phase", "to_phase"])
+llm_calls = Counter("llm_calls_total", "LLM calls per call site (workflow node).", ["site"])
+llm_tokens = Counter("llm_tokens_total", "LLM tokens per call site, split into prompt and completion.", ["site", "kind"])
+llm_latency = Histogram("llm_call_duration_seconds", "LLM call latency per call site.", ["site"])
+embedding_calls = Counter("embedding_calls_total", "Query embedding calls.", ["site"])
+qdrant_searches = Counter("qdrant_searches_total", "Qdrant similarity searches.", ["site"])
+qdrant_latency = Histogram("qdrant_search_duration_seconds", "Embedding + Qdrant search latency.", ["site"])
+supabase_requests = Counter("supabase_requests_total", "Supabase round trips per table or RPC.", ["table"])
+supabase_latency = Histogram("supabase_request_duration_seconds", "Supabase round-trip latency per table or RPC.", ["table"])
+cache_requests = Counter("cache_requests_total", "Cache lookups by cache and result (hit/miss).", ["cache", "result"])
+questionnaire_items_saved = Histogram(
+    "questionnaire_items_saved", "Items not asked per completed questionnaire (adaptive early stopping).",
+    ["instrument"], buckets=tuple(range(11))
+)
+fanout_fallbacks = Counter("fanout_fallbacks_total", "Fan-out branches answered by their fallback.", ["branch", "reason"])
+tool_latency = Histogram("tool_call_duration_seconds", "Latency of each tool call made by a node.", ["tool"])
+turns_dropped = Counter("turns_dropped_total", "Chat messages not run because the session was busy or repeated them.", ["reason"])
+risk_detections = Counter("risk_detections_total", "Messages routed to the safety response.", ["source", "category"])
+
+# Sessions crossing into each phase are counted when these nodes complete
+PHASE_TRANSITIONS = {
+    "start_conversation": ("new", "conversation"),
+    "transition_to_questionnaire": ("conversation", "questionnaire"),
+    "transition_to_recommendations": ("questionnaire", "recommendations"),
+}
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    cache_requests.labels(cache, "hit" if hit else "miss").inc()
+
+
+def timed_node(name: str, node):
+    """Wrap a node so its latency (and any phase transition it makes) is recorded."""
+    histogram = node_latency.labels(name)
+    transition = phase_transitions.labels(*PHASE_TRANSITIONS[name]) if name in PHASE_TRANSITIONS else None
+
+    @functools.wraps(node)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = node(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+        if transition is not None:
+            transition.inc()
+        return result
+    return wrapper
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Counts LLM calls, latency and token usage, labelled by the calling node."""
+
+    def __init__(self):
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        site = (metadata or {}).get("langgraph_node", "other")
+        self._started[run_id] = (site, time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, metadata=metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        site, start = self._started.pop(run_id, ("other", None))
+        llm_calls.labels(site).inc()
+        if start is not None:
+            llm_latency.labels(site).observe(time.perf_counter() - start)
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt, completion = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        if prompt is None:
+            # Chat models report usage on the message instead
+            prompt = completion = 0
+            for batch in response.generations:
+                for generation in batch:
+                    usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                    prompt += usage_metadata.get("input_tokens", 0)
+                    completion += usage_metadata.get("output_tokens", 0)
+        llm_tokens.labels(site, "prompt").inc(prompt)
+        llm_tokens.labels(site, "completion").inc(completion or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+
+metrics_callback = MetricsCallbackHandler()
+
+
+## STANDALONE ENDPOINT ##
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = Lock()
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics from a daemon thread (once per process). Returns the server or None."""
+    global _server
+    if port <= 0:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+            except OSError as e:
+                log.warning("Metrics server not started on %s:%s: %s", host, port, e)
+                return None
+            Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+            log.info("Metrics at http://%s:%s/metrics", host, port)
+    return _server
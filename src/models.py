@@ -2,7 +2,7 @@ from pydantic import BaseModel, Field
 from typing import Annotated, Literal, List, Optional
 from typing_extensions import TypedDict
 from langgraph.graph.message import add_messages
-from langchain_openai import ChatOpenAI
+from src.questionnaires import DISORDERS
 
 ## UNIFIED STATE - Combines all 3 graphs
 ## UNIFIED STATE - Combines all 3 graphs
@@ -10,22 +10,23 @@ from langchain_openai import ChatOpenAI
 class UnifiedState(TypedDict):
     """
     Combined state for conversation, questionnaire, and recommendation workflows.
+    Large static data is referenced, not copied: the questionnaire is looked up
+    by `disorder`, and retrieved documents by `rag_doc_ids`.
     """
     # From Graph 1 (Conversation)
     messages: Annotated[List, add_messages]
     session_id: str
     iterator: int
-    rag_context: Optional[str]
+    rag_doc_ids: Optional[List[str]]
+    risk: Optional[dict]              # RiskMatch of the latest message, if it was flagged (src/risk.py)
 
      # From Graph 2 (Questionnaire) - NEW
     disorder: str
-    question_id: list
     current_question_id: str
-    answer: list
     user_answer: str
     score: int
-    reword_questionnaire: dict
-    questionnaire_config: dict  # ADD THIS LINE
+    extra_scores: Optional[dict]      # other items answered by the same message, e.g. {"phq4": 3}
+    open_items: Optional[List[int]]   # question numbers not answered yet
     next_node: str
     total_score: int
     score_label: str
@@ -38,18 +39,27 @@ class UnifiedState(TypedDict):
     recommendation: Optional[str]
     appointment_confirmed: Optional[bool]
     suggested_appointment_id: Optional[str]
-    conversation_history: List[dict]
     user_message: Optional[str]
     workflow_stage: Optional[str]
 
 
 class Feedback(BaseModel):
-    disorder: Literal["anxiety", "depression", "stress"] = Field(
-        description="Decide from the chat history if the user has disorder of anxiety or depression or stress.",
+    # One choice per instrument in questionnaires.json
+    disorder: Literal[DISORDERS] = Field(
+        description=f"Decide from the chat history if the user has disorder of {' or '.join(DISORDERS)}.",
     )
     reasoning: str = Field(
         description="Give a reasoning of the chosen disorder and why you chose it",
     )
 
-llm = ChatOpenAI(temperature=0.5)
-oai_client = ChatOpenAI()  # Assuming you have this configured
\ No newline at end of file
+
+class ItemScore(BaseModel):
+    item: int = Field(description="Item number exactly as listed")
+    score: int = Field(description="Frequency score on the questionnaire's scale, before any reverse scoring")
+    reasoning: str = Field(description="Short quote or paraphrase from the message that supports the score")
+
+
+class AnswerScores(BaseModel):
+    scores: List[ItemScore] = Field(
+        description="One entry for the current item, plus one for each other listed item the message clearly answers",
+    )
@@ -2,33 +2,41 @@ from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from src.models import UnifiedState, Feedback
 from src.helperfunctions import *
 from src.tools import *
-from typing import Literal
+from typing import Literal, Optional
 from datetime import datetime, timezone
 from pydantic import BaseModel
+from langgraph.types import interrupt
+from src.logs import DEBUG, get_logger
+from src.metrics import questionnaire_items_saved
+from src.risk import SAFETY_RESPONSE, RiskMatch, detect_risk, escalate
+from src.appointment_intents import Intent, classify_appointment_reply, when
+from src.concurrency import Branch, fan_out, run_tool_calls
+from src.plan_cache import KB_INDEX_VERSION, PLAN_CACHE_ENABLED, PLAN_PERSONALIZE, context_fingerprint, plan_cache
+
+log = get_logger(__name__)
 
-llm = ChatOpenAI(temperature=0.5)
 ## Graph 1 Nodes
 def start_conversation(state: UnifiedState) -> UnifiedState:
     """Starts the conversation with a welcoming message."""
     greeting = AIMessage(content="Hello, I'm here to listen and support you. This is a safe space to share what's on your mind. How are you feeling today?")
     return {
-        **state,
         "messages": [greeting],
         "iterator": 0,
-        "rag_context": None,
+        "rag_doc_ids": None,
         "workflow_stage": "conversation"
     }
 
 def track_conversation(state: UnifiedState) -> UnifiedState:
-    """Tracks the number of user inputs."""
-    human_message_count = sum(1 for msg in state["messages"] if isinstance(msg, HumanMessage))
-    return {**state, "iterator": human_message_count}
+    """Tracks the number of user inputs and screens the latest one for risk before anything else runs."""
+    human_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
+    match = detect_risk(human_messages[-1].content) if human_messages else None
+    return {"iterator": len(human_messages), "risk": match._asdict() if match else None}
 
 def retrieve_context(state: UnifiedState) -> UnifiedState:
     """Let the LLM decide whether to call RAG tool based on user message."""
     user_messages = [msg for msg in state["messages"] if isinstance(msg, HumanMessage)]
     if not user_messages:
-        return {**state, "rag_context": None}
+        return {"rag_doc_ids": None}
 
     last_user_message = user_messages[-1].content
 
@@ -53,15 +61,14 @@ when the user mentions symptoms, feelings, or concerns that could benefit from e
                 search_query = str(args)
 
             retrieved_docs = rag.invoke({"query": search_query, "k": 5})
-            context = format_documents(retrieved_docs)
-            print(f"✓ RAG retrieved for query: {search_query}")
-            return {**state, "rag_context": context}
+            log.debug("RAG retrieved", extra={"query": search_query, "documents": len(retrieved_docs)})
+            return {"rag_doc_ids": remember_documents(retrieved_docs)}
         else:
-            return {**state, "rag_context": None}
+            return {"rag_doc_ids": None}
 
     except Exception as e:
-        print(f"⚠️  RAG retrieval error: {str(e)}")
-        return {**state, "rag_context": None}
+        log.warning("RAG retrieval error: %s", e)
+        return {"rag_doc_ids": None}
     
 
 def generate_response(state: UnifiedState) -> UnifiedState:
@@ -79,13 +86,14 @@ Focus on understanding if they show signs of:
 - Stress: feeling overwhelmed, tension, difficulty coping with demands
 """
 
-    if state.get("rag_context"):
-        system_prompt += f"\n\nKNOWLEDGE BASE CONTEXT:\n{state['rag_context']}\n\nUse this context to provide informed, evidence-based support while maintaining a conversational tone."
+    rag_docs = documents_for_ids(state.get("rag_doc_ids"))
+    if rag_docs:
+        system_prompt += f"\n\nKNOWLEDGE BASE CONTEXT:\n{format_documents(rag_docs)}\n\nUse this context to provide informed, evidence-based support while maintaining a conversational tone."
 
     messages = [SystemMessage(content=system_prompt)] + state["messages"]
     response = llm.invoke(messages)
 
-    return {**state, "messages": [response]}
+    return {"messages": [response]}
 
 def classify_disorder(state: UnifiedState) -> UnifiedState:
     """Analyzes conversation and classifies the disorder using RAG for ground truth."""
@@ -122,12 +130,16 @@ This will help classify the following conversation:
 
             classification_docs = rag.invoke({"query": query, "k": 5})
             diagnostic_context = format_documents(classification_docs)
-            print(f"✓ Classification RAG retrieved for: {query}")
+            log.debug("Classification RAG retrieved", extra={"query": query})
 
     except Exception as e:
-        print(f"⚠️  RAG retrieval error during classification: {str(e)}")
+        log.warning("RAG retrieval error during classification: %s", e)
         diagnostic_context = ""
 
+    # Symptom clusters and choices come from questionnaires.json, one per instrument
+    symptom_lines = "\n".join(f"**{config.disorder.capitalize()}:** {config.symptoms}" for config in QUESTIONNAIRES.values())
+    disorder_choices = ", ".join(DISORDERS[:-1]) + f", or {DISORDERS[-1]}"
+
     classification_prompt = f"""Based on the entire conversation history, analyze the user's mental health concerns.
 
 {diagnostic_context}
@@ -136,32 +148,26 @@ the user chat history is
 {conversation_summary}
 
 Look for these key symptoms:
-**Anxiety:** Excessive worry, restlessness, racing thoughts, panic attacks, avoidance behaviors, physical tension
-**Depression:** Persistent sadness, loss of interest/pleasure, hopelessness, fatigue, sleep changes, appetite changes, worthlessness
-**Stress:** Feeling overwhelmed, inability to cope, irritability, concentration problems, burnout
+{symptom_lines}
 
-Classify the PRIMARY concern as anxiety, depression, or stress based on which symptom cluster dominates."""
+Classify the PRIMARY concern as {disorder_choices} based on which symptom cluster dominates."""
 
     messages = state["messages"] + [HumanMessage(content=classification_prompt)]
     result: Feedback = llm_structured.invoke(messages)
 
-    type_mapping = {
-        "anxiety": "GAD",
-        "depression": "PHQ",
-        "stress": "PSS"
-    }
+    # A new assessment is starting - drop any cached result from the last one
+    assessment_cache.invalidate(state["student_id"])
 
     try:
         supabase.table("student_questionnaire_results").insert({
             "student_id": state["student_id"],
-            "type": type_mapping.get(result.disorder.lower(), "PSS")
+            "type": QUESTIONNAIRES[result.disorder].db_type
         }).execute()
-        print("✅ Inserted classification result into Supabase.")
+        log.info("Classification saved", extra={"disorder": result.disorder})
     except Exception as e:
-        print(f"⚠️ Supabase insert failed: {e}")
+        log.error("Supabase insert failed: %s", e)
 
     return {
-        **state,
         "disorder": result.disorder,
         "condition": result.disorder,
         #"messages": [AIMessage(content=f"Based on our conversation and clinical evidence, I've identified your primary concern as {result.disorder}.\n\n{result.reasoning}\n\nTo better understand your situation, I'd like to ask you a few questions. This will help me provide more personalized support.")],
@@ -183,14 +189,11 @@ def transition_to_questionnaire(state: UnifiedState) -> UnifiedState:
     disorder = state.get("disorder", "stress")
     student_id = state.get("student_id")
 
-    print(f"\n🔄 Transitioning from classification to questionnaire...")
-    print(f"   Disorder identified: {disorder}")
-    print(f"   Student ID: {student_id}")
-    print(f"   Messages in state: {len(state.get('messages', []))}")
-    print(f"   Starting questionnaire assessment...\n")
+    log.info("Transitioning to questionnaire", extra={
+        "disorder": disorder, "student_id": student_id, "messages": len(state.get('messages', []))
+    })
 
     return {
-        **state,
         "disorder": disorder,
         "workflow_stage": "questionnaire"
     }
@@ -203,39 +206,24 @@ def create_questionnaire(state: UnifiedState) -> UnifiedState:
     disorder = state.get('disorder', 'stress')
     student_id = state.get('student_id')
 
-    print("\n" + "="*50)
-    print("INITIALIZING QUESTIONNAIRE")
-    print("="*50)
-    print(f"Disorder: {disorder}")
-    print(f"Student ID: {student_id}")
-
     # Get questionnaire config
     if disorder not in QUESTIONNAIRES:
         error_text = f"Unknown disorder type: {disorder}"
         return {
-            **state,
-            'messages': state.get('messages', []) + [AIMessage(content=error_text)],
+            'messages': [AIMessage(content=error_text)],
             'next_node': 'end'
         }
 
     config = QUESTIONNAIRES[disorder]
-    questionnaire_type = config['type']
-    questionnaire_name = config['name']
-    questions = config['questions']
+    questionnaire_type = config.type
 
-    print(f"Questionnaire Type: {questionnaire_type}")
-    print(f"Questionnaire Name: {questionnaire_name}")
-    print(f"Number of Questions: {len(questions)}\n")
+    log.info("Initializing questionnaire", extra={
+        "questionnaire": questionnaire_type, "questions": config.item_count, "student_id": student_id
+    })
 
     try:
-        # Reword all questions
-        reword_questionnaire = {}
-        print('Rewording questions for natural conversation...\n')
-
-        for question_id, question in questions.items():
-            reword_question = questionnaire_reword_chain.invoke({"question": question}).content
-            question_key = f'{questionnaire_type}{question_id}'
-            reword_questionnaire[question_key] = reword_question
+        # Reworded questions are generated once per questionnaire and shared
+        reword_questionnaire = get_reworded_questions(disorder)
 
         timestamp = datetime.now(timezone.utc).isoformat()
 
@@ -251,67 +239,53 @@ def create_questionnaire(state: UnifiedState) -> UnifiedState:
             }
 
             # Initialize all question fields to None
-            for i in range(1, len(questions) + 1):
-                new_record[f'{questionnaire_type}{i}'] = None
+            for column in config.columns[1:]:
+                new_record[column] = None
 
             supabase.table('student_questionnaire_results').insert(new_record).execute()
-            print(f"✓ New record created for student {student_id}\n")
+            log.debug("New questionnaire record created", extra={"student_id": student_id})
 
-            first_question_key = f'{questionnaire_type}1'
+            first_question_key = config.columns[1]
             response_text = f"{reword_questionnaire[first_question_key]}"
             #I'm here to help you sort through your thoughts and find a path that feels right for you, you can share as much or as little as you like. We'll go at your pace.
             return {
-                **state,
-                'messages': state.get('messages', []) + [AIMessage(content=response_text)],
+                'messages': [AIMessage(content=response_text)],
                 'current_question_id': first_question_key,
-                'reword_questionnaire': reword_questionnaire,
-                'questionnaire_config': config,
+                'open_items': config.open_items(0),
                 'next_node': 'ask_question'
             }
         else:
             # Record exists - find first unanswered
-            print(f"✓ Found existing record for student {student_id}")
-            record = exists.data[0]
-
-            first_unanswered = None
-            answered_count = 0
-
-            for i in range(1, len(questions) + 1):
-                question_key = f'{questionnaire_type}{i}'
-                if record.get(question_key) is not None:
-                    answered_count += 1
-                elif first_unanswered is None:
-                    first_unanswered = question_key
+            answered = config.answered_mask(config.scores(exists.data[0]))
+            first_num = config.next_open(answered)
+            first_unanswered = config.columns[first_num] if first_num else None
+            answered_count = config.item_count - config.open_count(answered)
 
             if first_unanswered is None:
-                print("✓ All questions already answered!\n")
+                log.info("All questions already answered")
                 response_text = "You don't have to have it all figured out right now, we can work through it together..."
 
                 return {
-                    **state,
-                    'messages': state.get('messages', []) + [AIMessage(content=response_text)],
-                    'reword_questionnaire': reword_questionnaire,
-                    'questionnaire_config': config,
+                    'messages': [AIMessage(content=response_text)],
                     'next_node': 'total_score_label'
                 }
             else:
-                print(f"✓ Resuming from question {first_unanswered} ({answered_count}/{len(questions)} completed)\n")
+                log.info("Resuming questionnaire", extra={
+                    "question_id": first_unanswered, "answered": answered_count, "questions": config.item_count
+                })
                 response_text = f"{reword_questionnaire[first_unanswered]}"
                 #I'm here to listen. Whatever you're comfortable sharing, we can work through it together.
                 return {
-                    **state,
-                    'messages': state.get('messages', []) + [AIMessage(content=response_text)],
+                    'messages': [AIMessage(content=response_text)],
                     'current_question_id': first_unanswered,
-                    'reword_questionnaire': reword_questionnaire,
-                    'questionnaire_config': config,
+                    'open_items': config.open_items(answered),
                     'next_node': 'ask_question'
                 }
 
     except Exception as e:
         error_text = f"❌ Error creating questionnaire: {e}"
         return {
-            **state,
-            'messages': state.get('messages', []) + [AIMessage(content=error_text)],
+            'messages': [AIMessage(content=error_text)],
             'next_node': 'end'
         }
 
@@ -319,19 +293,24 @@ def create_questionnaire(state: UnifiedState) -> UnifiedState:
 
 
 def ask_question_node(state: UnifiedState) -> UnifiedState:
-    """Display question and signal that we need user input"""
+    """Pause on the current question until the student answers (resumed via run_turn)."""
+    question_id = state.get("current_question_id")
+    answer = interrupt({"question_id": question_id})
     return {
-        **state,
+        "user_answer": answer,
+        "messages": [HumanMessage(content=answer)]
     }
 
 
 def score_user_answer(state: UnifiedState) -> UnifiedState:
     """
     Hybrid scoring: Try keyword matching first, fall back to LLM if needed.
+    The LLM call also scores any other open items the message clearly answers
+    (returned as extra_scores, so those items are not asked again).
     Works for PSS, PHQ-9, and GAD-7.
     """
     question_id = state.get("current_question_id")
-    config = state.get("questionnaire_config", QUESTIONNAIRES['stress'])
+    config = get_questionnaire_config(state.get("disorder", "stress"))
 
     # Get answer
     answer = state.get("user_answer", "")
@@ -342,169 +321,186 @@ def score_user_answer(state: UnifiedState) -> UnifiedState:
 
     answer = answer.lower().strip()
 
-    print("\n" + "-"*50)
-    print(f"SCORING ANSWER FOR {question_id}")
-    print("-"*50)
-    print(f"Answer: '{answer}'\n")
+    # Risk screen runs before any scoring or LLM call; a flagged answer is still
+    # scored locally and saved, after the safety response (see with_risk_check)
+    match = detect_risk(answer)
 
     try:
-        # Extract question number from ID (e.g., 'pss7' -> 7, 'phq3' -> 3)
-        question_num = int(''.join(filter(str.isdigit, question_id)))
-        scale_type = config.get('scale_type', '0-4')
-        is_reverse_scoring = question_num in config.get('reverse_scoring', [])
-
-        # STEP 1: Try keyword matching first (fastest & most reliable)
-        # PSS uses 0-4 scale, PHQ/GAD use 0-3 scale
-        if scale_type == '0-3':
-            # PHQ-9 and GAD-7 scoring (no reverse scoring)
-            keyword_patterns = {
-                0: ['never', 'not at all', 'no'],
-                1: ['several days', 'rarely', 'a few days'],
-                2: ['more than half the days', 'half the days', 'often'],
-                3: ['nearly every day', 'almost every day', 'always']
-            }
-        else:
-            # PSS scoring (0-4 scale with possible reverse scoring)
-            keyword_patterns = {
-                0: ['never', 'not at all', 'no'],
-                1: ['almost never', 'rarely', 'seldom', 'hardly'],
-                2: ['sometimes', 'occasionally', 'once in a while'],
-                3: ['fairly often', 'often', 'frequently', 'regularly'],
-                4: ['very often', 'always', 'constantly', 'all the time']
-            }
+        # Compiled lookup, e.g. 'pss7' -> 7 (see src/questionnaires.py)
+        question_num = config.item_number(question_id)
+        scale_type = config.scale_type
 
-        matched_score = None
-        for base_score, keywords in keyword_patterns.items():
-            if any(keyword in answer for keyword in keywords):
-                matched_score = base_score
-                print(f"✓ Keyword match found: '{answer}' → base score {base_score}")
-                break
+        # STEP 1: Try keyword matching first (fastest & most reliable); keywords come from questionnaires.json
+        matched_score = config.keyword_base_score(answer)
 
         if matched_score is not None:
-            # Apply reverse scoring ONLY for PSS (if applicable)
-            final_score = (4 - matched_score) if is_reverse_scoring else matched_score
-
-            # Cap score at 3 for PHQ/GAD scales
-            if scale_type == '0-3' and final_score > 3:
-                final_score = 3
+            # Reverse scoring (PSS items 7-10) is a table lookup
+            final_score = config.final_score(question_num, matched_score)
 
-            print(f"✓ Scoring type: {'REVERSE' if is_reverse_scoring else 'DIRECT'}")
-            print(f"✓ Scale: {scale_type}")
-            print(f"✓ Final score: {final_score}\n")
+            log.debug("Answer scored by keyword", extra={
+                "question_id": question_id, "answer": answer, "base_score": matched_score,
+                "reverse": config.is_reverse(question_num), "scale": scale_type, "score": final_score
+            })
 
-            return {
-                **state,
+            return with_risk_check(config, question_num, match, {
                 "score": final_score,
+                "extra_scores": None,
                 "next_node": "save_score"
-            }
-
-        # STEP 2: No keyword match - use LLM
-        print(f"⚠️ No exact keyword match, using LLM...")
+            })
+
+        if match is not None:
+            # The safety response must not wait on the LLM; save the mid-scale default instead
+            log.debug("Flagged answer without keyword match, skipping LLM scoring", extra={"question_id": question_id})
+            return with_risk_check(config, question_num, match, {
+                "score": 2,
+                "extra_scores": None,
+                "next_node": "save_score"
+            })
 
-        Score_instructions = f"""
-Score this response for a mental health questionnaire.
+        # STEP 2: No keyword match - one LLM call scores this item and any other open items the message answers
+        other_items = []
+        if MULTI_ITEM_EXTRACTION:
+            # Mandatory items (e.g. PHQ-9 item 9) are always asked explicitly, never inferred
+            other_items = [n for n in state.get("open_items") or [] if n != question_num and n not in config.mandatory]
+        log.debug("No keyword match, scoring with LLM", extra={"question_id": question_id, "other_items": len(other_items)})
 
-Questionnaire type: {config['name']}
-Scale: {scale_type}
-Question {question_num} uses {"REVERSE" if is_reverse_scoring else "DIRECT"} scoring.
+        other_lines = "\n".join(f"item {n}: {config.items[n]}" for n in other_items) or "(none)"
+        score_instructions = f"""Score a student's message for the {config.name} questionnaire.
 
-Scoring guidelines:
-- For PSS (0-4 scale): "never"=0, "almost never"=1, "sometimes"=2, "fairly often"=3, "very often"=4
-  - Apply reverse scoring for questions 7-10 only (flip the score: 0→4, 1→3, 2→2, 3→1, 4→0)
-- For PHQ-9/GAD-7 (0-3 scale): "not at all"=0, "several days"=1, "more than half the days"=2, "nearly every day"=3
-  - NO reverse scoring
+Scale ({scale_type}): {config.scale_legend}
+Always give the plain frequency on this scale; do not reverse any scores.
 
-Response: "{answer}"
+The message answers the CURRENT item:
+item {question_num}: {config.items[question_num]}
 
-Return the numeric score and brief reasoning.
-"""
+It may also clearly answer some of these OTHER open items:
+{other_lines}
 
-        class ScoreResponse(BaseModel):
-            score: int
-            reasoning: str
+Return a score for the current item, plus a score for each other item the message clearly
+describes with a frequency or severity. Do not score items the message does not address."""
 
-        response_score = llm.with_structured_output(ScoreResponse).invoke([
-            SystemMessage(content=Score_instructions),
+        response_scores = llm_answer_scores.invoke([
+            SystemMessage(content=score_instructions),
             HumanMessage(content=answer)
         ])
 
-        score = response_score.score if hasattr(response_score, 'score') else 2
-
-        # Validate score range
-        max_score_value = 3 if scale_type == '0-3' else 4
-        if score > max_score_value:
-            score = max_score_value
-        if score < 0:
-            score = 0
+        score = 2  # Middle of the scale if the current item was not scored
+        extra_scores = {}
+        for item_score in getattr(response_scores, 'scores', None) or []:
+            if item_score.item == question_num:
+                score = config.final_score(question_num, item_score.score)
+            elif item_score.item in other_items:
+                extra_scores[config.columns[item_score.item]] = config.final_score(item_score.item, item_score.score)
 
-        print(f"✓ LLM score: {score}")
-        print(f"   Scale: {scale_type}")
-        print(f"   Reasoning: {response_score.reasoning if hasattr(response_score, 'reasoning') else 'N/A'}\n")
+        log.debug("Answer scored by LLM", extra={
+            "question_id": question_id, "answer": answer, "scale": scale_type, "score": score,
+            "extra_scores": extra_scores
+        })
 
-        return {
-            **state,
+        return with_risk_check(config, question_num, match, {
             "score": score,
+            "extra_scores": extra_scores or None,
             "next_node": "save_score"
-        }
+        })
 
     except Exception as e:
-        print(f"❌ Error scoring: {e}\n")
-        return {
-            **state,
-            "messages": state.get('messages', []) + [AIMessage(content="Could you rephrase that?")],
+        log.error("Error scoring answer: %s", e, extra={"question_id": question_id})
+        return with_risk_check(config, config.item_number(question_id), match, {
+            "messages": [AIMessage(content="Could you rephrase that?")],
             "score": 2,  # Safe default
+            "extra_scores": None,
             "next_node": "save_score"
-        }
+        })
 
 
 
+def with_risk_check(config: QuestionnaireSpec, question_num: int, match: Optional[RiskMatch], result: dict) -> dict:
+    """
+    Route a scored answer through the safety response if its text was flagged
+    or it is a non-zero answer on a risk item (PHQ-9 item 9). The score is
+    saved afterwards either way.
+    """
+    if match is None and result.get("score") and config.is_risk_item(question_num):
+        match = RiskMatch("self_harm", config.columns[question_num], "questionnaire")
+    if match is not None:
+        return {**result, "risk": match._asdict(), "next_node": "safety_response"}
+    return result
+
+
+def safety_response(state: UnifiedState) -> UnifiedState:
+    """
+    Immediate safety message for a flagged message, plus escalation.
+    Makes no LLM, Qdrant or Supabase call of its own.
+    """
+    match = RiskMatch(**state["risk"])
+    escalate(state, match)
+
+    if match.source == "questionnaire":
+        # The risk-item answer is still recorded, then the questionnaire continues
+        next_node = "save_score"
+        response_text = SAFETY_RESPONSE
+    elif state.get("workflow_stage") == "questionnaire" and state.get("current_question_id"):
+        # A flagged answer is scored like any other; save it and move on to the next item
+        next_node = "save_score"
+        response_text = SAFETY_RESPONSE + " Whenever you feel ready, we can carry on with the next question."
+    else:
+        next_node = "end"
+        response_text = SAFETY_RESPONSE
+
+    return {"messages": [AIMessage(content=response_text)], "next_node": next_node}
+
+
 def save_answer_score(state: UnifiedState) -> UnifiedState:
     """Save score and prepare next question - works for all questionnaire types"""
     student_id = state.get("student_id")
     question_id = state.get("current_question_id")
     score = state.get("score")
-    reword_questionnaire = state.get("reword_questionnaire", {})
-    config = state.get("questionnaire_config", QUESTIONNAIRES['stress'])
     disorder = state.get("disorder", "stress")  # Get disorder from state
+    config = get_questionnaire_config(disorder)
+    reword_questionnaire = get_reworded_questions(disorder)
 
-    print("\n" + "-"*50)
-    print(f"SAVING SCORE FOR {question_id}")
-    print("-"*50)
+    # Items the same message answered are written in the same update
+    extra_scores = state.get("extra_scores") or {}
 
     try:
         supabase.table("student_questionnaire_results").update(
-            {question_id: score}
+            {question_id: score, **extra_scores}
         ).eq("student_id", student_id).execute()
 
-        print(f"✓ Score {score} saved successfully\n")
-
         exists = supabase.table("student_questionnaire_results").select("*").eq("student_id", student_id).execute()
 
         if not exists.data:
             error_text = "Error: Record not found"
             return {
-                **state,
-                "messages": state.get('messages', []) + [AIMessage(content=error_text)],
+                "messages": [AIMessage(content=error_text)],
                 "next_node": "end"
             }
 
-        record = exists.data[0]
-        questionnaire_type = config['type']
-        total_questions = len(config['questions'])
-        current_num = int(''.join(filter(str.isdigit, question_id)))
-
-        next_unanswered = None
-        answered_count = 0
-
-        for i in range(1, total_questions + 1):
-            key = f'{questionnaire_type}{i}'
-            if record.get(key) is not None:
-                answered_count += 1
-            elif next_unanswered is None and i > current_num:
-                next_unanswered = key
-
-        print(f"Progress: {answered_count}/{total_questions} questions completed")
-
+        scores = config.scores(exists.data[0])
+        answered = config.answered_mask(scores)
+        total_questions = config.item_count
+        answered_count = total_questions - config.open_count(answered)
+
+        next_num = config.next_open(answered, after=config.item_number(question_id) or 0)
+        open_items = config.open_items(answered)
+
+        log.debug("Score saved", extra={
+            "question_id": question_id, "score": score, "answered": answered_count, "questions": total_questions,
+            "extra_items": len(extra_scores)
+        })
+
+        # Adaptive mode: once the label is decided, only mandatory items are still asked
+        if next_num and ADAPTIVE_QUESTIONNAIRE:
+            decided_label = config.decided_band(scores, answered)
+            if decided_label:
+                pending = config.pending_mandatory(answered)
+                next_num = pending[0] if pending else None
+                log.info("Score label decided early", extra={
+                    "label": decided_label, "answered": answered_count, "questions": total_questions,
+                    "mandatory_pending": len(pending)
+                })
+
+        next_unanswered = config.columns[next_num] if next_num else None
         if next_unanswered:
             acknowledgments = [
                 #"would you mind to share a bit about",
@@ -517,41 +513,33 @@ def save_answer_score(state: UnifiedState) -> UnifiedState:
             import random
             ack = random.choice(acknowledgments)
 
-            print(f"Moving to next question: {next_unanswered}\n")
-
             response_text = f"{ack} {reword_questionnaire[next_unanswered]}".strip()
 
             return {
-                **state,
-                "score": score,
-                "messages": state.get('messages', []) + [AIMessage(content=response_text)],
+                "messages": [AIMessage(content=response_text)],
                 "current_question_id": next_unanswered,
-                "reword_questionnaire": reword_questionnaire,
-                "questionnaire_config": config,
-                "disorder": disorder,  # Preserve disorder
+                "open_items": open_items,
+                "extra_scores": None,
                 "next_node": "ask_question",
             }
         else:
-            print("✓ All questions completed!\n")
+            log.info("Questionnaire complete")
             response_text = "Thank you for letting me in. I can only imagine how that feels..."
 
             return {
-                **state,
-                "score": score,
-                "messages": state.get('messages', []) + [AIMessage(content=response_text)],
+                "messages": [AIMessage(content=response_text)],
                 "current_question_id": None,
-                "questionnaire_config": config,
-                "disorder": disorder,  # Preserve disorder
+                "open_items": open_items,
+                "extra_scores": None,
                 "next_node": "total_score_label",
             }
 
     except Exception as e:
-        print(f"❌ Error saving: {e}\n")
+        log.error("Error saving score: %s", e, extra={"question_id": question_id})
         error_text = f"Error saving your answer: {e}"
 
         return {
-            **state,
-            "messages": state.get('messages', []) + [AIMessage(content=error_text)],
+            "messages": [AIMessage(content=error_text)],
             "next_node": "end"
         }
 
@@ -561,26 +549,14 @@ def save_answer_score(state: UnifiedState) -> UnifiedState:
 
 def total_score_label(state: UnifiedState) -> UnifiedState:
     """Calculate total score and provide assessment - works for all questionnaire types"""
-    print("\n" + "="*50)
-    print("CALCULATING FINAL RESULTS")
-    print("="*50)
-
     student_id = state.get('student_id')
     disorder = state.get('disorder', 'stress')
 
-    # Get config - first try from state, then fall back to disorder mapping
-    config = state.get('questionnaire_config')
-    if config is None:
-        print(f"⚠️ No questionnaire_config in state, using disorder: {disorder}")
-        config = QUESTIONNAIRES.get(disorder, QUESTIONNAIRES['stress'])
+    config = get_questionnaire_config(disorder)
 
-    questionnaire_type = config['type']
-    questionnaire_name = config['name']
-    max_score = config['max_score']
-    score_ranges = config['score_ranges']
-
-    print(f"Using config for: {questionnaire_name} (type: {questionnaire_type})")
-    print(f"Expected questions: {len(config['questions'])}")
+    questionnaire_type = config.type
+    questionnaire_name = config.name
+    max_score = config.max_score
 
     scores = []
 
@@ -588,74 +564,51 @@ def total_score_label(state: UnifiedState) -> UnifiedState:
         exists = supabase.table('student_questionnaire_results').select('*').eq('student_id', student_id).execute()
 
         if exists.data:
-            record = exists.data[0]
-            print(f"\n📊 Collecting scores from database:")
-            for i in range(1, len(config['questions']) + 1):
-                key = f'{questionnaire_type}{i}'
-                value = record.get(key)
-                print(f"  {key}: {value}")
-                if value is not None:
-                    scores.append(value)
+            scores = [value for value in config.scores(exists.data[0])[1:] if value is not None]
 
         total_score = sum([x for x in scores if isinstance(x, int)])
 
-        print(f"\n✓ Individual scores: {scores}")
-        print(f"✓ Total score: {total_score}/{max_score}\n")
-
-        # Determine score label based on ranges
-        score_label = 'Unknown'
-        severity = 'unknown'
-        for min_score, max_score_range, label in score_ranges:
-            if min_score <= total_score <= max_score_range:
-                score_label = label
-                severity = label.lower()
-                break
-
-        print(f"Assessment: {score_label}\n")
-
-        # Update database with results
-        update_data = {
-            f'{questionnaire_type}_total_score': total_score,
-            f'{questionnaire_type}_score_label': score_label
-        }
-
-        print(f"Updating database with: {update_data}")
-
-        update_result = supabase.table('student_questionnaire_results').update(
-            update_data
-        ).eq('student_id', student_id).execute()
-
-        print(f"✓ Database update result: {update_result.data}")
-
-        # Verify the update
-        verify = supabase.table('student_questionnaire_results').select('*').eq('student_id', student_id).execute()
-        if verify.data:
-            print(f"✓ Verification - Total score in DB: {verify.data[0].get(f'{questionnaire_type}_total_score')}")
-            print(f"✓ Verification - Score label in DB: {verify.data[0].get(f'{questionnaire_type}_score_label')}")
+        # Score band by bisect over the compiled score_ranges
+        score_label = config.band(total_score) or 'Unknown'
+        severity = score_label.lower()
+
+        items_saved = config.item_count - len(scores)
+        questionnaire_items_saved.labels(questionnaire_type).observe(items_saved)
+        log.info("Questionnaire scored", extra={
+            "questionnaire": questionnaire_name, "total_score": total_score, "max_score": max_score,
+            "label": score_label, "items_saved": items_saved
+        })
+
+        # Update database with results (and the assessment cache)
+        update_result = save_student_assessment(student_id, questionnaire_type, disorder, total_score, score_label)
+
+        if log.isEnabledFor(DEBUG):
+            # Read back what was stored; an extra round trip, so only when debugging
+            verify = supabase.table('student_questionnaire_results').select('*').eq('student_id', student_id).execute()
+            stored = verify.data[0] if verify.data else {}
+            log.debug("Assessment stored", extra={
+                "scores": scores, "rows_updated": len(update_result.data or []),
+                "stored_total": stored.get(config.total_column),
+                "stored_label": stored.get(config.label_column)
+            })
 
         response_text = """ I am really glad you shared that with me, it takes courage to open up about how you are feeling. 
         You are not facing this alone; I am here with you, and I am ready to support you however I can."""
 
         return {
-            **state,
             'total_score': total_score,
             'score_label': score_label,
             'severity': severity,
-            'disorder': disorder,  # Preserve disorder
-            'questionnaire_config': config,  # Preserve config
-            'messages': state.get('messages', []) + [AIMessage(content=response_text)],
+            'messages': [AIMessage(content=response_text)],
             'next_node': 'transition_to_recommendations'
         }
 
     except Exception as e:
-        print(f"❌ Error calculating total: {e}\n")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error calculating total: %s", e)
         error_text = f'Error calculating results: {e}'
 
         return {
-            **state,
-            'messages': state.get('messages', []) + [AIMessage(content=error_text)],
+            'messages': [AIMessage(content=error_text)],
             'next_node': 'end'
         }
 
@@ -675,30 +628,17 @@ def transition_to_recommendations(state: UnifiedState) -> UnifiedState:
     condition = state.get("condition", "stress")
     student_id = state.get("student_id")
 
-    print(f"\n🔄 Transitioning from conversation to recommendations...")
-    print(f"   condition identified from conversation: {condition}")
-
     # Try to fetch from database first
     if student_id:
-        print(f"   Fetching assessment from database for student: {student_id}...")
-        condition, severity = get_student_assessment_from_db(student_id)
-        print(f"   ✓ Database assessment: {condition} ({severity})")
+        condition, severity = get_student_assessment(student_id)
     else:
         # Fallback: Use conversation condition with default severity
-        print(f"   No student_id provided, using conversation assessment...")
-        severity_mapping = {
-            "anxiety": "moderate anxiety",
-            "depression": "moderate depression",
-            "stress": "moderate stress"
-        }
-        condition = condition
-        severity = severity_mapping.get(condition, "moderate stress")
-        print(f"   ✓ Using mapped severity: {severity}")
+        log.info("No student_id provided, using conversation assessment")
+        severity = get_questionnaire_config(condition).default_severity
 
-    print(f"   Final assessment: {condition} at {severity} level\n")
+    log.info("Transitioning to recommendations", extra={"condition": condition, "severity": severity})
 
     return {
-        **state,
         "condition": condition,
         "severity": severity,
         "workflow_stage": "recommendation"
@@ -708,18 +648,13 @@ def transition_to_recommendations(state: UnifiedState) -> UnifiedState:
 def determine_route(state: UnifiedState) -> UnifiedState:
     """Determine whether student needs treatment plan or appointment."""
     severity = state["severity"].lower()
-    route = SEVERITY_ROUTING.get(severity, "treatment_plan")
-    print(f"✓ Route determined: {route}")
-    return {**state, "route": route}
-
-
-def generate_treatment_plan(state: UnifiedState) -> UnifiedState:
-    """Generate self-care treatment plan for lower severity cases."""
-    condition = state["condition"]
-    severity = state["severity"]
+    route = route_for_severity(severity)
+    log.info("Route determined", extra={"route": route})
+    return {"route": route}
 
-    rag_context = retrieve_context_for_recommendation(condition, severity)
 
+def write_treatment_plan(condition: str, severity: str, rag_context: str) -> str:
+    """One LLM-written self-care plan (cached per condition and severity by generate_treatment_plan)."""
     system_prompt = f"""You are a compassionate mental health support assistant.
 
 The person has been assessed with {severity} level {condition} based on our conversation.
@@ -744,13 +679,63 @@ Do NOT diagnose or provide medical advice."""
     ]
 
     response = llm.invoke(messages)
-    print(f"✓ Treatment plan generated")
+    log.debug("Treatment plan generated")
+    return response.content
+
+
+def personalize_plan(plan: str, messages: list) -> str:
+    """Short LLM-written opening that ties a cached plan to what this student shared."""
+    shared = "\n".join(msg.content for msg in messages if isinstance(msg, HumanMessage))[-1500:]
+    response = llm.invoke([
+        SystemMessage(content="""You are a compassionate mental health support assistant.
+Write one or two warm sentences that connect the self-care plan below to what the student shared.
+Do not repeat the plan, diagnose, or give medical advice.
+
+PLAN:
+""" + plan),
+        HumanMessage(content=f"What the student shared:\n{shared}")
+    ])
+    return f"{response.content}\n\n{plan}"
+
+
+def generate_treatment_plan(state: UnifiedState) -> UnifiedState:
+    """
+    Self-care treatment plan for lower severity cases. Plans are reused from
+    src/plan_cache.py when enough variants exist for this condition and severity.
+    """
+    condition = state["condition"]
+    severity = state["severity"]
+    student_id = state.get("student_id") or ""
+
+    # With a known index version a cached plan needs neither RAG nor the LLM
+    plan = None
+    if PLAN_CACHE_ENABLED and KB_INDEX_VERSION:
+        plan = plan_cache.lookup(KB_INDEX_VERSION, condition, severity, seed=student_id)
+
+    if plan is None:
+        # Bounded by RAG_TIMEOUT_SECONDS; the plan is written without context if the knowledge base is slow
+        rag_context = fan_out({
+            "rag": Branch(lambda: retrieve_context_for_recommendation(condition, severity), RAG_TIMEOUT_SECONDS, "")
+        })["rag"]
+        version = KB_INDEX_VERSION or context_fingerprint(rag_context)
+
+        if PLAN_CACHE_ENABLED and not KB_INDEX_VERSION:
+            plan = plan_cache.lookup(version, condition, severity, seed=student_id)
+        if plan is None:
+            plan = write_treatment_plan(condition, severity, rag_context)
+            # Plans written without context (RAG timed out or failed) are not reused
+            if PLAN_CACHE_ENABLED and rag_context:
+                plan_cache.add(version, condition, severity, plan)
+
+    if PLAN_PERSONALIZE:
+        try:
+            plan = personalize_plan(plan, state.get("messages", []))
+        except Exception as e:
+            log.warning("Plan personalization failed, sending the cached plan: %s", e)
 
     return {
-        **state,
-        "recommendation": response.content,
-        "rag_context": rag_context,
-        "messages": state.get("messages", []) + [AIMessage(content=response.content)] #added a line here
+        "recommendation": plan,
+        "messages": [AIMessage(content=plan)] #added a line here
 
     }
 
@@ -759,9 +744,23 @@ def generate_appointment_recommendation(state: UnifiedState) -> UnifiedState:
     """Node 3b: Generate appointment recommendation for higher severity cases."""
     condition = state["condition"]
     severity = state["severity"]
+    student_id = state.get("student_id")
 
-    rag_context = retrieve_context_for_recommendation(condition, severity)
-    nearest_slots = get_nearest_available_slot.invoke({})
+    # Knowledge-base context and slots are independent: fetch both at once,
+    # so a slow Qdrant does not hold up the slots (and vice versa)
+    results = fan_out({
+        "rag": Branch(lambda: retrieve_context_for_recommendation(condition, severity), RAG_TIMEOUT_SECONDS, ""),
+        # Hold the first slot we can get for this student; a hold taken after the timeout is given back
+        "slots": Branch(lambda: hold_first_slot(find_available_slots(), student_id), SLOTS_TIMEOUT_SECONDS, None,
+                        on_discard=lambda held: release_held_slot(held, student_id)),
+    })
+    rag_context = results["rag"]
+    if results["slots"] is not None:
+        suggested_appointment_id, slots = results["slots"]
+        nearest_slots = format_slots(slots)
+    else:
+        suggested_appointment_id = None
+        nearest_slots = "Appointment times could not be loaded right now; offer to check again in a moment."
 
     system_prompt = f"""You are a compassionate mental health support assistant with appointment booking capabilities.
 
@@ -793,23 +792,100 @@ Keep your response conversational and encouraging (2 paragraphs max)."""
     ]
 
     response = llm.invoke(messages)
-
-    print(f"✓ Appointment recommendation with nearest slot generated")
+    log.debug("Appointment recommendation generated")
 
     return {
-        **state,
         "recommendation": response.content,
-        "rag_context": rag_context,
-        "messages": state.get("messages", []) + [AIMessage(content=response.content)] #added a line here
+        "suggested_appointment_id": suggested_appointment_id,
+        "messages": [AIMessage(content=response.content)] #added a line here
 
     }
 
 
+def handle_appointment_intent(intent: Intent, student_id: str, suggested_appointment_id: str) -> tuple:
+    """
+    Act on a locally classified booking reply by calling the tools directly.
+    Returns (response text, booking confirmed, appointment_id now held for the student).
+    """
+    if intent.kind == "confirm":
+        result = book_appointment.invoke({"appointment_id": str(suggested_appointment_id), "student_id": student_id})
+        if "✓" in result:
+            return f"{result}\n\nYou're all set. Reaching out takes courage, and I'm glad you did.", True, suggested_appointment_id
+        # Taken in the meantime: offer (and hold) the next ones instead
+        held_id, slots = hold_first_slot(find_available_slots(), student_id)
+        return f"{result}\n\nHere are the next available times:\n{format_slots(slots)}\n\nShall I book the first one for you?", False, held_id
+
+    # One hold per student: give back the suggested slot before holding another
+    if suggested_appointment_id:
+        release_held_slot((suggested_appointment_id, None), student_id)
+
+    if intent.kind == "alternatives":
+        slots = [slot for slot in find_available_slots(num_suggestions=4) if str(slot['id']) != str(suggested_appointment_id)]
+        held_id, slots = hold_first_slot(slots[:3], student_id)
+        intro = "Of course, here are some other times:"
+    else:
+        requested = when(intent.time)
+        held_id, slots = hold_first_slot(find_available_slots(requested.strftime("%Y-%m-%d %H:%M:%S")), student_id)
+        intro = f"Here's what's open closest to {requested.strftime('%A %d %B, %H:%M')}:"
+
+    if not slots:
+        return "I couldn't find any open slots around then. Is there another day or time that could work for you?", False, None
+    return f"{intro}\n{format_slots(slots)}\n\nWould you like me to book the first one, or does another time suit you better?", False, held_id
+
+
+def run_appointment_tool_calls(tool_calls: list, student_id: str) -> tuple:
+    """
+    Run the booking LLM's tool calls and return (result texts, booking confirmed).
+    Read-only lookups run concurrently; bookings/cancellations stay in order.
+    """
+    calls = []
+    for tool_call in tool_calls or []:
+        args = tool_call["args"]
+        if tool_call["name"] in ["book_appointment", "update_appointment"]:
+            args["student_id"] = student_id
+        calls.append((tool_call["name"], args))
+
+    tool_results = [tool_result_text(result) for result in run_tool_calls(calls, {tool.name: tool for tool in APPOINTMENT_TOOLS})]
+
+    booking_confirmed = False
+    for (tool_name, _), result in zip(calls, tool_results):
+        # Only mark as confirmed if booking was successful
+        if tool_name == "book_appointment" and ("successfully booked" in result.lower() or "✓" in result):
+            booking_confirmed = True
+    return tool_results, booking_confirmed
+
+
 def handle_appointment_interaction(state: UnifiedState) -> UnifiedState:
-    """Node 4: Interactive appointment booking/management."""
+    """
+    Node 4: Interactive appointment booking/management.
+    Confirmations, requests for other times and date/time replies are routed
+    locally (src/appointment_intents.py); the LLM only sees the other messages.
+    """
     student_id = state["student_id"]
-    user_message = state.get("user_message", "")
+    # Pause until the student replies to the suggestion (resumed via run_turn)
+    user_message = interrupt({"suggested_appointment_id": state.get("suggested_appointment_id")})
+    suggested_appointment_id = state.get("suggested_appointment_id")
+
+    intent = classify_appointment_reply(user_message)
+    if intent and (intent.kind != "confirm" or suggested_appointment_id):
+        try:
+            full_response, booking_confirmed, suggested_appointment_id = handle_appointment_intent(
+                intent, student_id, suggested_appointment_id
+            )
+            log.info("Appointment reply handled locally", extra={"intent": intent.kind, "confirmed": booking_confirmed})
+            return {
+                "recommendation": full_response,
+                "appointment_confirmed": booking_confirmed,
+                "suggested_appointment_id": suggested_appointment_id,
+                "user_message": user_message,
+                "messages": [HumanMessage(content=user_message), AIMessage(content=full_response)]
+            }
+        except Exception as e:
+            log.warning("Local appointment handling failed, falling back to the LLM: %s", e)
+
     previous_recommendation = state.get("recommendation", "")
+    if suggested_appointment_id:
+        previous_recommendation += f"\n\n(Slot held for this student - appointment_id: {suggested_appointment_id})"
 
     system_prompt = """You are an appointment booking assistant for mental health services.
 
@@ -843,43 +919,16 @@ IMPORTANT: When user confirms (yes/confirm/book it), look at the PREVIOUS RECOMM
 
     response = llm_with_tools_full.invoke(messages)
 
-    tool_results = []
-    booking_confirmed = False
-
-    if response.tool_calls:
-        for tool_call in response.tool_calls:
-            tool_name = tool_call["name"]
-            args = tool_call["args"]
-
-            if tool_name in ["book_appointment", "update_appointment"]:
-                args["student_id"] = student_id
-
-            if tool_name == "get_nearest_available_slot":
-                result = get_nearest_available_slot.invoke(args)
-            elif tool_name == "book_appointment":
-                result = book_appointment.invoke(args)
-                # Only mark as confirmed if booking was successful
-                if "successfully booked" in str(result).lower() or "✓" in str(result):
-                    booking_confirmed = True
-            elif tool_name == "check_conflicts":
-                result = check_conflicts.invoke(args)
-            elif tool_name == "cancel_appointment":
-                result = cancel_appointment.invoke(args)
-            elif tool_name == "update_appointment":
-                result = update_appointment.invoke(args)
-            else:
-                result = f"Unknown tool: {tool_name}"
-
-            tool_results.append(result)
+    tool_results, booking_confirmed = run_appointment_tool_calls(response.tool_calls, student_id)
 
     response_text = response.content if hasattr(response, 'content') else str(response)
     full_response = response_text + "\n\n" + "\n\n".join(tool_results) if tool_results else response_text
 
     return {
-        **state,
         "recommendation": full_response,
         "appointment_confirmed": booking_confirmed,
-        "messages": state.get("messages", []) + [AIMessage(content=full_response)]
+        "user_message": user_message,
+        "messages": [HumanMessage(content=user_message), AIMessage(content=full_response)]
     }
 
 
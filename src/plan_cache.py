@@ -0,0 +1,131 @@
+## TREATMENT PLAN CACHE ##
+# Self-care plans depend only on (condition, severity) and the knowledge-base
+# context retrieved for them, so a few pre-generated variants per pair are
+# reused across students instead of writing a new plan with the LLM each time.
+#
+#   PLAN_CACHE        1 (default) | 0 to always write a fresh plan
+#   PLAN_VARIANTS     variants kept per (condition, severity); default 3
+#   PLAN_PERSONALIZE  0 (default) | 1 to add a short LLM-written opening that ties the plan to the conversation
+#   PLAN_CACHE_PATH   JSON file the variants are loaded from and saved to (default plan_cache.json)
+#   KB_INDEX_VERSION  version of the knowledge-base index; bump it when the collection is
+#                     re-ingested. If unset, the retrieved context's fingerprint is used,
+#                     so the RAG lookup still runs but the LLM call is skipped.
+#
+# Variants are filled lazily (each miss writes one more until PLAN_VARIANTS are
+# cached) or offline, for every treatment-plan severity:
+#
+#   python -m src.plan_cache
+from threading import Lock
+from typing import Optional
+import argparse
+import hashlib
+import json
+import os
+import zlib
+
+from src.logs import get_logger
+from src.metrics import cache_lookup
+
+log = get_logger(__name__)
+
+PLAN_CACHE_ENABLED = os.environ.get("PLAN_CACHE", "1") != "0"
+PLAN_VARIANTS = int(os.environ.get("PLAN_VARIANTS", 3))
+PLAN_PERSONALIZE = os.environ.get("PLAN_PERSONALIZE", "0") == "1"
+PLAN_CACHE_PATH = os.environ.get("PLAN_CACHE_PATH", "plan_cache.json")
+KB_INDEX_VERSION = os.environ.get("KB_INDEX_VERSION", "")
+
+
+def context_fingerprint(rag_context: str) -> str:
+    """Version for plans written from this exact retrieved context."""
+    return "ctx-" + hashlib.sha256(rag_context.encode("utf-8")).hexdigest()[:12]
+
+
+class PlanCache:
+    """Thread-safe {(kb version, condition, severity): [plan variants]}, persisted as JSON."""
+
+    def __init__(self, path: str = PLAN_CACHE_PATH, variants: int = PLAN_VARIANTS):
+        self.path = path
+        self.variants = variants
+        self._plans = None
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(version: str, condition: str, severity: str) -> str:
+        return f"{version}|{condition.lower()}|{severity.lower()}"
+
+    def _load(self) -> dict:
+        if self._plans is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._plans = json.load(f)["plans"]
+                log.info("Treatment plan cache loaded", extra={"path": self.path, "entries": len(self._plans)})
+            except FileNotFoundError:
+                self._plans = {}
+            except (OSError, ValueError, KeyError) as e:
+                log.warning("Treatment plan cache unreadable, starting empty: %s", e)
+                self._plans = {}
+        return self._plans
+
+    def lookup(self, version: str, condition: str, severity: str, seed: str = "") -> Optional[str]:
+        """
+        A cached plan once all variants exist, else None (the caller writes one
+        and add()s it). The same seed, e.g. the student ID, always gets the same variant.
+        """
+        with self._lock:
+            variants = self._load().get(self._key(version, condition, severity), [])
+        hit = len(variants) >= self.variants
+        cache_lookup("treatment_plans", hit)
+        if not hit:
+            return None
+        return variants[zlib.crc32(seed.encode("utf-8")) % len(variants)]
+
+    def add(self, version: str, condition: str, severity: str, plan: str) -> None:
+        with self._lock:
+            variants = self._load().setdefault(self._key(version, condition, severity), [])
+            if len(variants) >= self.variants:
+                return
+            variants.append(plan)
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"plans": self._plans}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning("Treatment plan cache not saved: %s", e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._plans = {}
+
+
+plan_cache = PlanCache()
+
+
+def main():
+    """Pre-generate every variant for the severities routed to a treatment plan."""
+    from src.helperfunctions import retrieve_context_for_recommendation
+    from src.nodes import write_treatment_plan
+    from src.questionnaires import QUESTIONNAIRES
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--variants", type=int, default=PLAN_VARIANTS)
+    args = parser.parse_args()
+    plan_cache.variants = args.variants
+
+    bands = [(spec.disorder, label.lower()) for spec in QUESTIONNAIRES.values()
+             for label, route in zip(spec.band_labels, spec.band_routes) if route == "treatment_plan"]
+    for condition, severity in bands:
+        rag_context = retrieve_context_for_recommendation(condition, severity)
+        version = KB_INDEX_VERSION or context_fingerprint(rag_context)
+        while plan_cache.lookup(version, condition, severity) is None:
+            plan_cache.add(version, condition, severity, write_treatment_plan(condition, severity, rag_context))
+        print(f"{severity:<32} {args.variants} variants ({version})")
+
+
+if __name__ == "__main__":
+    main()
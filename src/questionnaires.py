@@ -0,0 +1,197 @@
+## QUESTIONNAIRE ENGINE ##
+# Instruments are declared in questionnaires.json (or QUESTIONNAIRES_PATH) and
+# compiled once at import into QuestionnaireSpec objects, so the nodes never
+# parse question IDs or walk score bands per answer:
+#
+#   item_numbers   column name -> item number ('pss7' -> 7), one dict lookup
+#   reverse_mask   bit n set if item n is reverse scored (same for mandatory/risk items)
+#   score_lut      final score = score_lut[reversed][base]
+#   band_floors    lower bound of each score band, searched with bisect
+#
+# Answered items are tracked as a bitmask (bit n = item n), so the next open
+# item and the open count are bit operations. Adding an instrument means adding
+# an entry to the JSON file; see the existing ones for the fields. Each score
+# band names the route it leads to (one of ROUTES), and the database columns,
+# the classifier's choices and SEVERITY_ROUTING are all derived from the specs.
+from bisect import bisect_right
+from typing import Dict, List, Optional
+import json
+import os
+
+QUESTIONNAIRES_PATH = os.environ.get(
+    "QUESTIONNAIRES_PATH", os.path.join(os.path.dirname(__file__), "questionnaires.json")
+)
+DEFAULT_DISORDER = "stress"
+ROUTES = ("treatment_plan", "appointment")
+
+
+def _mask(item_numbers) -> int:
+    mask = 0
+    for n in item_numbers:
+        mask |= 1 << n
+    return mask
+
+
+class QuestionnaireSpec:
+    """One compiled instrument. Item numbers start at 1."""
+
+    __slots__ = (
+        "disorder", "type", "name", "scale_type", "item_max", "item_count", "max_score",
+        "items", "columns", "item_numbers", "all_items_mask",
+        "reverse_mask", "mandatory", "risk_mask", "score_lut", "keywords", "scale_legend",
+        "band_floors", "band_ceilings", "band_labels", "band_routes", "default_severity", "symptoms",
+        "db_type", "total_column", "label_column", "definition",
+    )
+
+    def __init__(self, definition: dict):
+        self.definition = definition
+        self.disorder = definition["disorder"]
+        self.type = definition["type"]
+        self.name = definition["name"]
+        self.symptoms = definition["symptoms"]
+        self.db_type = self.type.upper()  # 'type' column of student_questionnaire_results
+        self.total_column = f"{self.type}_total_score"
+        self.label_column = f"{self.type}_score_label"
+        self.scale_type = definition["scale"]
+        self.item_max = int(self.scale_type.split("-")[1])
+
+        self.items = ("",) + tuple(definition["items"])  # index by item number
+        self.item_count = len(definition["items"])
+        self.max_score = self.item_count * self.item_max
+        self.columns = ("",) + tuple(f"{self.type}{n}" for n in range(1, self.item_count + 1))
+        self.item_numbers = {column: n for n, column in enumerate(self.columns) if n}
+        self.all_items_mask = _mask(range(1, self.item_count + 1))
+
+        self.reverse_mask = _mask(definition.get("reverse_scoring", []))
+        self.mandatory = tuple(definition.get("mandatory", []))
+        self.risk_mask = _mask(definition.get("risk_items", []))
+        direct = tuple(range(self.item_max + 1))
+        self.score_lut = (direct, direct[::-1])
+
+        # Checked in order; the first base score with a matching keyword wins
+        self.keywords = tuple((base, tuple(words)) for base, words in enumerate(definition["keywords"]))
+        self.scale_legend = ", ".join(f'"{label}"={base}' for base, label in enumerate(definition["scale_labels"]))
+
+        bands = sorted(definition["score_ranges"])
+        for (_, high, label, _), (next_low, _, _, _) in zip(bands, bands[1:]):
+            if next_low != high + 1:
+                raise ValueError(f"{self.type}: score band '{label}' is not followed by a contiguous band")
+        if bands[0][0] != 0 or bands[-1][1] != self.max_score:
+            raise ValueError(f"{self.type}: score bands must cover 0..{self.max_score}")
+        for _, _, label, route in bands:
+            if route not in ROUTES:
+                raise ValueError(f"{self.type}: score band '{label}' has route {route!r}, expected one of {ROUTES}")
+        self.band_floors = tuple(low for low, _, _, _ in bands)
+        self.band_ceilings = tuple(high for _, high, _, _ in bands)
+        self.band_labels = tuple(label for _, _, label, _ in bands)
+        self.band_routes = tuple(route for _, _, _, route in bands)
+        if definition["default_band"] not in self.band_labels:
+            raise ValueError(f"{self.type}: default_band {definition['default_band']!r} is not a score band")
+        self.default_severity = definition["default_band"].lower()
+
+    def __repr__(self):
+        return f"QuestionnaireSpec({self.type!r}, items={self.item_count})"
+
+    ## ITEMS ##
+    @property
+    def questions(self) -> Dict[int, str]:
+        return {n: self.items[n] for n in range(1, self.item_count + 1)}
+
+    def item_number(self, question_id: str) -> Optional[int]:
+        """'phq3' -> 3; None for IDs that do not belong to this instrument."""
+        return self.item_numbers.get(question_id)
+
+    def is_reverse(self, n: int) -> bool:
+        return bool(self.reverse_mask >> n & 1)
+
+    def is_risk_item(self, n: int) -> bool:
+        return bool(self.risk_mask >> n & 1)
+
+    ## SCORING ##
+    def final_score(self, n: int, base: int) -> int:
+        """Score stored for item n given a frequency on the scale (clamped, reverse scoring applied)."""
+        base = min(max(base, 0), self.item_max)
+        return self.score_lut[self.reverse_mask >> n & 1][base]
+
+    def keyword_base_score(self, answer: str) -> Optional[int]:
+        """Scale value of the first keyword found in a lowercased answer, or None."""
+        for base, words in self.keywords:
+            for word in words:
+                if word in answer:
+                    return base
+        return None
+
+    def band(self, total: int) -> Optional[str]:
+        i = bisect_right(self.band_floors, total) - 1
+        if i < 0 or total > self.band_ceilings[i]:
+            return None
+        return self.band_labels[i]
+
+    ## PROGRESS ##
+    def scores(self, record: dict) -> List[Optional[int]]:
+        """Stored scores from a results row, indexed by item number (index 0 unused)."""
+        return [None] + [record.get(column) for column in self.columns[1:]]
+
+    def answered_mask(self, scores: List[Optional[int]]) -> int:
+        return _mask(n for n in range(1, self.item_count + 1) if scores[n] is not None)
+
+    def next_open(self, answered: int, after: int = 0) -> Optional[int]:
+        """Lowest unanswered item number greater than `after`."""
+        free = self.all_items_mask & ~answered & ~((1 << (after + 1)) - 1)
+        return (free & -free).bit_length() - 1 if free else None
+
+    def open_items(self, answered: int) -> List[int]:
+        return [n for n in range(1, self.item_count + 1) if not answered >> n & 1]
+
+    def open_count(self, answered: int) -> int:
+        return bin(self.all_items_mask & ~answered).count("1")
+
+    def pending_mandatory(self, answered: int) -> List[int]:
+        return [n for n in self.mandatory if not answered >> n & 1]
+
+    def decided_band(self, scores: List[Optional[int]], answered: int) -> Optional[str]:
+        """
+        The score label if it can no longer change, else None. Every item spans
+        0..item_max whichever way it is scored, so the possible totals are
+        [answered sum, answered sum + open items * item_max].
+        """
+        low = sum(score for score in scores[1:] if score is not None)
+        high = low + self.open_count(answered) * self.item_max
+        label = self.band(low)
+        return label if label is not None and self.band(high) == label else None
+
+
+def load_questionnaires(path: str = QUESTIONNAIRES_PATH) -> Dict[str, QuestionnaireSpec]:
+    """Compile every instrument in a declarative file, keyed by disorder."""
+    with open(path, encoding="utf-8") as f:
+        definitions = json.load(f)["instruments"]
+    return {definition["disorder"]: QuestionnaireSpec(definition) for definition in definitions}
+
+
+def severity_routing(specs: Dict[str, QuestionnaireSpec]) -> Dict[str, str]:
+    """Lowercased score label -> route, across every instrument."""
+    routing = {}
+    for spec in specs.values():
+        for label, route in zip(spec.band_labels, spec.band_routes):
+            if routing.setdefault(label.lower(), route) != route:
+                raise ValueError(f"Score label '{label}' is routed differently by two instruments")
+    return routing
+
+
+QUESTIONNAIRES = load_questionnaires()
+QUESTIONNAIRES_BY_TYPE = {spec.db_type: spec for spec in QUESTIONNAIRES.values()}
+DISORDERS = tuple(QUESTIONNAIRES)
+SEVERITY_ROUTING = severity_routing(QUESTIONNAIRES)
+
+
+def get_questionnaire_config(disorder: str) -> QuestionnaireSpec:
+    """Compiled questionnaire for a disorder (state only stores the key)."""
+    return QUESTIONNAIRES.get(disorder, QUESTIONNAIRES[DEFAULT_DISORDER])
+
+
+def route_for_severity(severity: str) -> str:
+    """Route for a score label; raises ValueError for labels no instrument defines."""
+    route = SEVERITY_ROUTING.get(severity.lower())
+    if route is None:
+        raise ValueError(f"No route for score label {severity!r}; add it to a score band in {QUESTIONNAIRES_PATH}")
+    return route
@@ -0,0 +1,66 @@
+## APPOINTMENT HOLDS ##
+# Short-lived reservations so the slot shown in a recommendation is kept for
+# that student while they decide. The SQL side lives in build/appointment_holds.sql.
+from threading import Lock
+import os
+import time
+from src.supabase import supabase
+
+HOLD_TTL_SECONDS = int(os.environ.get("APPOINTMENT_HOLD_TTL_SECONDS", 300))
+SWEEP_INTERVAL_SECONDS = 30
+
+_sweep_lock = Lock()
+_last_sweep = 0.0
+
+
+def hold_slot(appointment_id: str, student_id: str, ttl_seconds: int = HOLD_TTL_SECONDS):
+    """
+    Place a TTL hold on a slot for one student.
+    Returns the held appointment record, or None if someone else got it first.
+    """
+    result = supabase.rpc("hold_appointment", {
+        "p_appointment_id": str(appointment_id),
+        "p_student_id": student_id,
+        "p_ttl_seconds": ttl_seconds
+    }).execute()
+    return result.data[0] if result.data else None
+
+
+def confirm_hold(appointment_id: str, student_id: str):
+    """
+    Turn the student's hold (or a still-available slot) into a booking in one RPC.
+    Returns the booked appointment record, or None if the slot is taken.
+    """
+    result = supabase.rpc("confirm_appointment_hold", {
+        "p_appointment_id": str(appointment_id),
+        "p_student_id": student_id
+    }).execute()
+    return result.data[0] if result.data else None
+
+
+def release_hold(appointment_id: str, student_id: str):
+    """
+    Give back a slot this student holds (one that will not be shown or confirmed).
+    Returns the released record, or None if the student no longer held it.
+    """
+    result = supabase.rpc("release_appointment_hold", {
+        "p_appointment_id": str(appointment_id),
+        "p_student_id": student_id
+    }).execute()
+    return result.data[0] if result.data else None
+
+
+def sweep_expired_holds(force: bool = False) -> int:
+    """
+    Release every expired hold in one bulk update.
+    Throttled to once per SWEEP_INTERVAL_SECONDS per process unless forced.
+    """
+    global _last_sweep
+    with _sweep_lock:
+        now = time.monotonic()
+        if not force and now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+            return 0
+        _last_sweep = now
+
+    result = supabase.rpc("release_expired_holds", {}).execute()
+    return result.data if isinstance(result.data, int) else 0
@@ -0,0 +1,158 @@
+## RISK DETECTION ##
+# In-process screen for self-harm and suicide risk, run on every student
+# message before any LLM, Qdrant or Supabase call (track_conversation and
+# score_user_answer). Everything is compiled at import; a check is one
+# tokenization, one walk of a token trie and one dot product.
+#
+#   1. Phrase automaton: explicit crisis phrases, matched over tokens so
+#      "don't" / "dont" and extra spaces make no difference.
+#   2. Local classifier: hand-set linear weights over tokens, for messages
+#      that describe risk without any of the listed phrases.
+#
+# A hit routes the turn to safety_response, which answers immediately and
+# calls the escalation handlers. False positives are acceptable; misses are not.
+from typing import Callable, List, NamedTuple, Optional
+import math
+import re
+
+from src.logs import get_logger
+from src.metrics import risk_detections
+
+log = get_logger(__name__)
+
+SAFETY_RESPONSE = (
+    "I'm really glad you told me, and I'm taking what you said seriously. "
+    "You don't have to go through this alone. If you might act on these thoughts or are in danger right now, "
+    "please call your local emergency number. In the US you can call or text 988 (Suicide & Crisis Lifeline) "
+    "any time, day or night. You can also reach out to your campus counselling service or someone you trust and let them know how you're feeling. "
+    "I'm still here if you'd like to keep talking."
+)
+
+# Explicit phrases per category. Entries marked with a leading "?" are
+# ignored when one of the three preceding tokens negates them ("not suicidal").
+RISK_PHRASES = {
+    "suicide": [
+        "kill myself", "killing myself", "end my life", "ending my life", "take my own life", "take my life",
+        "want to die", "wanna die", "wish i was dead", "wish i were dead", "better off dead", "better off without me",
+        "dont want to live", "do not want to live", "dont want to be alive", "do not want to be alive",
+        "no reason to live", "nothing to live for", "not worth living", "end it all", "ending it all",
+        "dont want to wake up", "do not want to wake up", "never wake up", "goodbye forever",
+        "want to end it", "wanna end it", "going to end it", "gonna end it", "end it now", "end it tonight",
+        "dont want to be here", "do not want to be here", "dont wanna be here", "dont want to exist",
+        "do not want to exist", "wish i didnt exist", "wish i was never born", "wish i wasnt here",
+        "wish i could disappear", "want to disappear", "wanna disappear", "disappear forever",
+        "jump off a bridge", "jumping off a bridge", "jump off the bridge", "jumping off the bridge",
+        "jump off a building", "jumping off a building", "jump off the roof", "jumping off the roof",
+        "jump in front of", "jumping in front of",
+        "burden to everyone", "burden on everyone", "im a burden", "i am a burden", "such a burden",
+        "everyone would be better off", "cant go on", "cannot go on", "can not go on",
+        "?suicide", "?suicidal",
+    ],
+    "self_harm": [
+        "hurt myself", "hurting myself", "harm myself", "harming myself", "cut myself", "cutting myself",
+        "burn myself", "burning myself", "punish myself", "starve myself", "overdose",
+        "?self harm", "?selfharm", "?self harming",
+    ],
+}
+NEGATORS = {"not", "no", "never", "dont", "didnt", "isnt", "wasnt", "arent", "without", "nor"}
+
+# Classifier weights (log-odds per token present); anything unlisted is 0
+CLASSIFIER_WEIGHTS = {
+    "die": 1.6, "dying": 1.2, "dead": 1.2, "death": 1.2, "suicide": 2.5, "suicidal": 2.5,
+    "kill": 1.4, "killing": 1.0, "hurt": 1.0, "harm": 1.2, "cut": 0.8, "cutting": 1.0,
+    "pills": 1.4, "overdose": 2.5, "rope": 1.6, "bridge": 0.8, "jump": 0.8, "jumping": 0.8, "gun": 1.4, "blade": 1.4,
+    "myself": 0.9, "end": 0.7, "ending": 0.8, "life": 0.4, "live": 0.6, "alive": 0.8,
+    "hopeless": 1.0, "worthless": 0.9, "burden": 1.2, "goodbye": 1.0, "pointless": 0.8, "anymore": 0.5,
+    "plan": 0.6, "tonight": 0.6, "want": 0.3, "disappear": 0.9, "exist": 0.7,
+    "not": -0.8, "never": -0.6, "dont": -0.2, "exam": -1.0, "exams": -1.0, "tired": -0.6, "joke": -1.5,
+}
+CLASSIFIER_BIAS = -2.5
+CLASSIFIER_THRESHOLD = 0.5
+
+
+class RiskMatch(NamedTuple):
+    category: str   # suicide | self_harm
+    trigger: str    # matched phrase, top classifier tokens, or questionnaire item
+    source: str     # phrase | classifier | questionnaire
+
+
+## COMPILED MATCHERS ##
+_TOKEN = re.compile(r"[a-z0-9]+")
+_END = object()  # trie key for "a phrase ends here"
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, with apostrophes dropped so "don't" == "dont"."""
+    return _TOKEN.findall(text.lower().replace("'", "").replace("’", ""))
+
+
+def _compile_trie(phrases_by_category: dict) -> dict:
+    root = {}
+    for category, phrases in phrases_by_category.items():
+        for phrase in phrases:
+            negatable = phrase.startswith("?")
+            node = root
+            for token in tokenize(phrase.lstrip("?")):
+                node = node.setdefault(token, {})
+            node[_END] = (category, phrase.lstrip("?"), negatable)
+    return root
+
+
+_PHRASE_TRIE = _compile_trie(RISK_PHRASES)
+
+
+def match_phrase(tokens: List[str]) -> Optional[RiskMatch]:
+    for start in range(len(tokens)):
+        node = _PHRASE_TRIE.get(tokens[start])
+        end = start + 1
+        while node is not None:
+            found = node.get(_END)
+            if found is not None:
+                category, phrase, negatable = found
+                if not (negatable and NEGATORS.intersection(tokens[max(0, start - 3):start])):
+                    return RiskMatch(category, phrase, "phrase")
+            if end == len(tokens):
+                break
+            node = node.get(tokens[end])
+            end += 1
+    return None
+
+
+def classify(tokens: List[str]) -> Optional[RiskMatch]:
+    features = set(tokens)
+    logit = CLASSIFIER_BIAS + sum(CLASSIFIER_WEIGHTS.get(token, 0.0) for token in features)
+    if 1 / (1 + math.exp(-logit)) < CLASSIFIER_THRESHOLD:
+        return None
+    top = sorted(features, key=lambda token: -CLASSIFIER_WEIGHTS.get(token, 0.0))[:3]
+    return RiskMatch("suicide", " ".join(top), "classifier")
+
+
+def detect_risk(text: str) -> Optional[RiskMatch]:
+    """First risk signal in a message, or None. Microseconds; no I/O."""
+    if not text:
+        return None
+    tokens = tokenize(text)
+    return match_phrase(tokens) or classify(tokens)
+
+
+## ESCALATION ##
+_escalation_handlers: List[Callable[[dict, RiskMatch], None]] = []
+
+
+def register_escalation_handler(handler: Callable[[dict, RiskMatch], None]) -> None:
+    """Called with (state, match) on every detection, e.g. to page the on-call counsellor."""
+    _escalation_handlers.append(handler)
+
+
+def escalate(state: dict, match: RiskMatch) -> None:
+    """Record the detection and run the escalation handlers. Handler errors never block the response."""
+    risk_detections.labels(match.source, match.category).inc()
+    log.warning("Risk detected, escalating", extra={
+        "student_id": state.get("student_id"), "category": match.category, "source": match.source,
+        "stage": state.get("workflow_stage")
+    })
+    for handler in _escalation_handlers:
+        try:
+            handler(state, match)
+        except Exception:
+            log.exception("Escalation handler failed")
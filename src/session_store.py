@@ -0,0 +1,301 @@
+## SESSION STORE ##
+# Durable LangGraph checkpoint saver on SQLite. Checkpoints are serialized with
+# the graph's msgpack serde (ormsgpack) and compressed with zstandard. Recently
+# used sessions stay in memory and are evicted after SESSION_IDLE_TTL_SECONDS;
+# anything not in memory is loaded lazily from the database, so any app process
+# pointed at the same store can pick up any session. A cached session is only
+# served while it is still the latest checkpoint in the database (another
+# process may have advanced it), and the cache holds copies, never the dicts
+# the graph loop mutates.
+from threading import RLock, local
+import asyncio
+import copy
+import os
+import sqlite3
+import time
+
+import zstandard
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from src.metrics import cache_lookup
+
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "sessions.db")
+SESSION_IDLE_TTL_SECONDS = float(os.environ.get("SESSION_IDLE_TTL_SECONDS", 900))
+# Older checkpoints per session are pruned; only the recent ones are needed to resume
+CHECKPOINTS_KEPT_PER_SESSION = int(os.environ.get("CHECKPOINTS_KEPT_PER_SESSION", 3))
+ZSTD_LEVEL = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    updated_at REAL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+
+class SQLiteSessionSaver(BaseCheckpointSaver):
+    """Compressed, TTL-cached checkpoint saver keyed by thread_id (= session_id)."""
+
+    def __init__(self, path: str = SESSION_STORE_PATH, idle_ttl_seconds: float = SESSION_IDLE_TTL_SECONDS,
+                 keep_checkpoints: int = CHECKPOINTS_KEPT_PER_SESSION, *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.keep_checkpoints = keep_checkpoints
+        self.lock = RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # zstd (de)compressors are not thread-safe; each thread gets its own pair
+        self._zstd = local()
+        # (thread_id, checkpoint_ns) -> [latest CheckpointTuple, last access time]
+        self._hot = {}
+
+    # ----- serialization -----
+    def _codecs(self):
+        if not hasattr(self._zstd, "compressor"):
+            self._zstd.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            self._zstd.decompressor = zstandard.ZstdDecompressor()
+        return self._zstd
+
+    def _dump(self, obj):
+        type_, data = self.serde.dumps_typed(obj)
+        return type_, self._codecs().compressor.compress(data)
+
+    def _load(self, type_, blob):
+        return self.serde.loads_typed((type_, self._codecs().decompressor.decompress(blob)))
+
+    # ----- in-memory session cache -----
+    def _evict_idle(self):
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        for key in [key for key, (_, last_access) in self._hot.items() if last_access < cutoff]:
+            del self._hot[key]
+
+    def hot_sessions(self) -> int:
+        """Number of sessions currently held in memory."""
+        with self.lock:
+            self._evict_idle()
+            return len(self._hot)
+
+    # ----- reads -----
+    def _row_to_tuple(self, thread_id, checkpoint_ns, row) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, blob, metadata_type, metadata_blob = row
+        writes = self.conn.execute(
+            """SELECT task_id, channel, type, value FROM writes
+               WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+               ORDER BY task_id, idx""",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}},
+            checkpoint=self._load(type_, blob),
+            metadata=self._load(metadata_type, metadata_blob),
+            parent_config=(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                if parent_id else None
+            ),
+            pending_writes=[(task_id, channel, self._load(w_type, value)) for task_id, channel, w_type, value in writes]
+        )
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        with self.lock:
+            self._evict_idle()
+            hot = self._hot.get(key)
+            if hot and self._is_current(hot[0], checkpoint_id):
+                hot[1] = time.monotonic()
+                cache_lookup("sessions", True)
+                return self._copy(hot[0])
+            cache_lookup("sessions", False)
+
+            columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+            if checkpoint_id:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"""SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                        ORDER BY checkpoint_id DESC LIMIT 1""",
+                    (thread_id, checkpoint_ns)
+                ).fetchone()
+            if row is None:
+                return None
+
+            checkpoint_tuple = self._row_to_tuple(thread_id, checkpoint_ns, row)
+            if checkpoint_id is None:
+                self._hot[key] = [self._copy(checkpoint_tuple), time.monotonic()]
+            return checkpoint_tuple
+
+    def _is_current(self, cached: CheckpointTuple, checkpoint_id) -> bool:
+        """
+        Whether a cached tuple is what the database would return. Pinned reads
+        only need the same ID; latest reads also check that no other process has
+        written a newer checkpoint or more pending writes since it was cached.
+        """
+        configurable = cached.config["configurable"]
+        if checkpoint_id is not None:
+            return configurable["checkpoint_id"] == checkpoint_id
+        latest = self.conn.execute(
+            """SELECT c.checkpoint_id,
+                      (SELECT COUNT(*) FROM writes w WHERE w.thread_id = c.thread_id
+                         AND w.checkpoint_ns = c.checkpoint_ns AND w.checkpoint_id = c.checkpoint_id)
+               FROM checkpoints c WHERE c.thread_id = ? AND c.checkpoint_ns = ?
+               ORDER BY c.checkpoint_id DESC LIMIT 1""",
+            (configurable["thread_id"], configurable["checkpoint_ns"])
+        ).fetchone()
+        return latest is not None and latest == (configurable["checkpoint_id"], len(cached.pending_writes))
+
+    @staticmethod
+    def _copy(checkpoint_tuple: CheckpointTuple) -> CheckpointTuple:
+        # The Pregel loop updates channel_versions/versions_seen of the checkpoint it is given in place
+        return copy.deepcopy(checkpoint_tuple)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        query = "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata FROM checkpoints"
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                checkpoint_tuple = self._row_to_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+
+    # ----- writes -----
+    def put(self, config, checkpoint, metadata, new_versions):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        metadata = get_checkpoint_metadata(config, metadata)
+        type_, blob = self._dump(checkpoint)
+        metadata_type, metadata_blob = self._dump(metadata)
+        next_config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}}
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, blob, metadata_type, metadata_blob, time.time())
+            )
+            self._prune(thread_id, checkpoint_ns)
+            self.conn.commit()
+            self._hot[(thread_id, checkpoint_ns)] = [
+                CheckpointTuple(
+                    config=next_config,
+                    checkpoint=copy.deepcopy(checkpoint),
+                    metadata=metadata,
+                    parent_config=(
+                        {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent_id}}
+                        if parent_id else None
+                    ),
+                    pending_writes=[]
+                ),
+                time.monotonic()
+            ]
+        return next_config
+
+    def _prune(self, thread_id, checkpoint_ns):
+        stale = self.conn.execute(
+            """SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+               ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?""",
+            (thread_id, checkpoint_ns, self.keep_checkpoints)
+        ).fetchall()
+        for (checkpoint_id,) in stale:
+            params = (thread_id, checkpoint_ns, checkpoint_id)
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params)
+            self.conn.execute("DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special channels (errors, interrupts) overwrite; ordinary writes are kept once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+
+        with self.lock:
+            for idx, (channel, value) in enumerate(writes):
+                type_, blob = self._dump(value)
+                self.conn.execute(
+                    f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint_id, task_id, task_path,
+                     WRITES_IDX_MAP.get(channel, idx), channel, type_, blob)
+                )
+            self.conn.commit()
+            # Reload with the new pending writes on next access
+            self._hot.pop((thread_id, checkpoint_ns), None)
+
+    def delete_thread(self, thread_id):
+        with self.lock:
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self.conn.commit()
+            for key in [key for key in self._hot if key[0] == thread_id]:
+                del self._hot[key]
+
+    # ----- async variants (SQLite work runs on a worker thread) -----
+    async def aget_tuple(self, config):
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
@@ -0,0 +1,73 @@
+## BOOKED SLOT INDEX ##
+# In-memory index of booked appointment times, one sorted list per date.
+# check_conflicts answers ±1 hour window queries with two bisects instead of
+# a Supabase round trip; book/cancel keep the index in step with the table.
+from bisect import bisect_left, bisect_right, insort
+from threading import RLock
+import os
+import time
+
+# How long a date's index is trusted before it is reloaded from Supabase.
+# Bookings made by other app processes show up after at most this long.
+# Set to 0 to disable the index and always run the windowed query.
+INDEX_TTL_SECONDS = float(os.environ.get("SLOT_INDEX_TTL_SECONDS", 60))
+
+
+class BookedSlotIndex:
+    """Per-date sorted index of booked appointment times ("HH:MM:SS" strings)."""
+
+    def __init__(self, ttl_seconds: float = INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._times = {}
+        self._loaded_at = {}
+        self._lock = RLock()
+
+    def is_fresh(self, date: str) -> bool:
+        """True if the index for this date was loaded recently enough to trust."""
+        loaded_at = self._loaded_at.get(date)
+        return loaded_at is not None and time.monotonic() - loaded_at < self.ttl_seconds
+
+    def load(self, date: str, booked_times: list) -> None:
+        """Replace the index for a date with the given booked times."""
+        with self._lock:
+            self._times[date] = sorted(booked_times)
+            self._loaded_at[date] = time.monotonic()
+
+    def add(self, date: str, slot_time: str) -> None:
+        """Record a booking. Dates that were never loaded are left alone."""
+        with self._lock:
+            times = self._times.get(date)
+            if times is None:
+                return
+            i = bisect_left(times, slot_time)
+            if i == len(times) or times[i] != slot_time:
+                insort(times, slot_time)
+
+    def remove(self, date: str, slot_time: str) -> None:
+        """Record a cancellation. Dates that were never loaded are left alone."""
+        with self._lock:
+            times = self._times.get(date)
+            if times is None:
+                return
+            i = bisect_left(times, slot_time)
+            if i < len(times) and times[i] == slot_time:
+                del times[i]
+
+    def conflicts(self, date: str, start_time: str, end_time: str) -> list:
+        """Booked times on `date` within [start_time, end_time]."""
+        with self._lock:
+            times = self._times.get(date, [])
+            return times[bisect_left(times, start_time):bisect_right(times, end_time)]
+
+    def invalidate(self, date: str = None) -> None:
+        """Drop one date (or everything) so the next check reloads from Supabase."""
+        with self._lock:
+            if date is None:
+                self._times.clear()
+                self._loaded_at.clear()
+            else:
+                self._times.pop(date, None)
+                self._loaded_at.pop(date, None)
+
+
+booked_slots = BookedSlotIndex()
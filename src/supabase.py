@@ -1,9 +1,106 @@
 ## SUPABASE CONNECTION ##
-from supabase import create_client, Client
-from dotenv import load_dotenv
+# Clients are built on first use, not at import time, so importing src.nodes or
+# src.tools needs no credentials and opens no connections.
+# SUPABASE_BACKEND=sqlite swaps in the local SQLite stand-in (src/local_backend.py).
+from threading import Lock
+import asyncio
 import os
+from dotenv import load_dotenv
+from src.logs import get_logger
+from src.tracing import traced_query
 load_dotenv()
 
-supabase: Client = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'])
+log = get_logger(__name__)
+
+# Connection-pool settings for the underlying httpx clients
+POOL_MAX_CONNECTIONS = int(os.environ.get("SUPABASE_POOL_MAX_CONNECTIONS", 20))
+POOL_MAX_KEEPALIVE = int(os.environ.get("SUPABASE_POOL_MAX_KEEPALIVE", 10))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("SUPABASE_POOL_KEEPALIVE_EXPIRY", 30))
+REQUEST_TIMEOUT = float(os.environ.get("SUPABASE_REQUEST_TIMEOUT", 10))
+
+BACKEND = os.environ.get("SUPABASE_BACKEND", "supabase").lower()
+SQLITE_PATH = os.environ.get("SUPABASE_SQLITE_PATH", "local_supabase.db")
+
+_client = None
+_client_lock = Lock()
+_async_client = None
+_async_client_lock = None
+
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+    )
+
+
+def get_supabase():
+    """Return the shared synchronous Supabase client, creating it on first call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None and BACKEND == "sqlite":
+                from src.local_backend import LocalSupabase
+                _client = LocalSupabase(SQLITE_PATH)
+            elif _client is None:
+                import httpx
+                from supabase import create_client, ClientOptions
+
+                options = ClientOptions(
+                    postgrest_client_timeout=REQUEST_TIMEOUT,
+                    httpx_client=httpx.Client(limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+                )
+                _client = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'], options=options)
+    return _client
+
+
+async def aget_supabase():
+    """Return the shared async Supabase client (acreate_client), for async nodes."""
+    global _async_client, _async_client_lock
+    if _async_client is None:
+        if _async_client_lock is None:
+            _async_client_lock = asyncio.Lock()
+        async with _async_client_lock:
+            if _async_client is None and BACKEND == "sqlite":
+                _async_client = get_supabase().as_async()
+            elif _async_client is None:
+                import httpx
+                from supabase import acreate_client, AsyncClientOptions
+
+                options = AsyncClientOptions(
+                    postgrest_client_timeout=REQUEST_TIMEOUT,
+                    httpx_client=httpx.AsyncClient(limits=_pool_limits(), timeout=REQUEST_TIMEOUT)
+                )
+                _async_client = await acreate_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'], options=options)
+    return _async_client
+
+
+def warm_up() -> bool:
+    """
+    Build the client and open a pooled connection with one cheap query.
+    Call from app startup so the first student request does not pay for it.
+    """
+    try:
+        get_supabase().table("appointments").select("appointment_id").limit(1).execute()
+        return True
+    except Exception as e:
+        log.warning("Supabase warm-up failed: %s", e)
+        return False
+
+
+class _LazySupabase:
+    """Stand-in for the old module-level client; resolves on first attribute access."""
+
+    def table(self, name):
+        return traced_query(get_supabase().table(name), name)
+
+    def rpc(self, name, params=None):
+        return traced_query(get_supabase().rpc(name, params or {}), f"rpc.{name}", params)
+
+    def __getattr__(self, name):
+        return getattr(get_supabase(), name)
 
 
+supabase = _LazySupabase()
@@ -1,129 +1,205 @@
-from typing import List
+from typing import TYPE_CHECKING, List
 from langchain_core.documents import Document
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.tools import tool
-from langchain_community.vectorstores import FAISS
-from qdrant_client import QdrantClient
-from langchain_qdrant import QdrantVectorStore
 from datetime import datetime
-from src.models import Feedback
+from threading import Lock
+from src.models import AnswerScores, Feedback
 from src.supabase import supabase
+from src.slot_index import booked_slots
+from src.reservations import confirm_hold, sweep_expired_holds
+from src.metrics import cache_lookup, embedding_calls, qdrant_latency, qdrant_searches
+from src.tracing import payload_size, record_call, span, traced
+from src.logs import get_logger
 from dotenv import load_dotenv
 import os
+import time
 load_dotenv()
 
+if TYPE_CHECKING:
+    from langchain_qdrant import QdrantVectorStore
 
-llm = ChatOpenAI(temperature=0.5)
+log = get_logger(__name__)
 
 
-@tool
-def rag(query: str, k: int = 5) -> List[Document]:
-    """Retrieve top related documents from Qdrant Cloud."""
-    
-    embeddings = OpenAIEmbeddings()
+## LAZY LLM CLIENTS ##
+# langchain_openai and qdrant_client are slow to import and need credentials,
+# so the chat model, its tool-bound variants and the vector store are built on
+# first use rather than when src.tools is imported.
+class LazyModel:
+    """Module-level stand-in for a model/runnable; builds it on first attribute access."""
 
-    # ✅ Connect to Qdrant Cloud directly using qdrant-client
-    client = QdrantClient(
-        url=os.environ["QDRANT_ENDPOINT"],
-        api_key=os.environ["QDRANT_API_KEY"],
-    
-    )
+    def __init__(self, factory):
+        self._factory = factory
+        self._model = None
+        self._lock = Lock()
 
-    # ✅ Use LangChain’s dedicated QdrantVectorStore wrapper
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name="MentalHealthData",
-        embedding=embeddings
-    )
+    def resolve(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._factory()
+        return self._model
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+def _chat_model():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(temperature=0.5)
+
+
+llm = LazyModel(_chat_model)
+
+# Embeddings, Qdrant client and vector store are built once per process and
+# shared by every retrieval call, instead of being reconstructed per call
+_vectorstore = None
+_vectorstore_lock = Lock()
+
+def get_vectorstore() -> "QdrantVectorStore":
+    """Shared Qdrant Cloud vector store for the knowledge base."""
+    global _vectorstore
+    if _vectorstore is None:
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                from langchain_openai import OpenAIEmbeddings
+                from langchain_qdrant import QdrantVectorStore
+                from qdrant_client import QdrantClient
+
+                embeddings = OpenAIEmbeddings()
+
+                # ✅ Connect to Qdrant Cloud directly using qdrant-client
+                client = QdrantClient(
+                    url=os.environ["QDRANT_ENDPOINT"],
+                    api_key=os.environ["QDRANT_API_KEY"],
+                )
+
+                # ✅ Use LangChain’s dedicated QdrantVectorStore wrapper
+                _vectorstore = QdrantVectorStore(
+                    client=client,
+                    collection_name="MentalHealthData",
+                    embedding=embeddings
+                )
+    return _vectorstore
+
+
+def search_knowledge_base(query: str, k: int = 5, site: str = "rag") -> List[Document]:
+    """Embed the query and search Qdrant (one embedding call + one search)."""
+    vectorstore = get_vectorstore()
 
     # 🔍 Perform semantic search
-    docs = vectorstore.similarity_search(query, k=k)
+    start = time.perf_counter()
+    with span("qdrant.similarity_search", "qdrant", k=k):
+        docs = vectorstore.similarity_search(query, k=k)
+        record_call("qdrant", len(query), payload_size([doc.page_content for doc in docs]))
+    embedding_calls.labels(site).inc()
+    qdrant_searches.labels(site).inc()
+    qdrant_latency.labels(site).observe(time.perf_counter() - start)
     return docs
-llm_with_tools = llm.bind_tools([rag])
-llm_structured = llm.with_structured_output(Feedback)
 
 
-## Graph 3 Tools
 @tool
-def get_nearest_available_slot(datetime_str: str = None, num_suggestions: int = 3) -> str:
-    """Get the nearest available appointment slots starting from requested time or now."""
-    try:
-        from dateutil import parser
-        from datetime import timedelta
+@traced("tool.rag", "tool")
+def rag(query: str, k: int = 5) -> List[Document]:
+    """Retrieve top related documents from Qdrant Cloud."""
+    return search_knowledge_base(query, k)
+llm_with_tools = LazyModel(lambda: llm.bind_tools([rag]))
+llm_structured = LazyModel(lambda: llm.with_structured_output(Feedback))
+llm_answer_scores = LazyModel(lambda: llm.with_structured_output(AnswerScores))
 
-        if datetime_str:
-            dt = parser.parse(datetime_str, fuzzy=True, default=datetime.now())
-        else:
-            dt = datetime.now()
 
-        target_date = dt.date().isoformat()
-        target_time = dt.time().strftime("%H:%M:%S")
+## Graph 3 Tools
+def find_available_slots(datetime_str: str = None, num_suggestions: int = 3) -> List[dict]:
+    """Nearest available slots at or after the requested time (or now)."""
+    from dateutil import parser
 
-        result = (
+    if datetime_str:
+        dt = parser.parse(datetime_str, fuzzy=True, default=datetime.now())
+    else:
+        dt = datetime.now()
+
+    target_date = dt.date().isoformat()
+    target_time = dt.time().strftime("%H:%M:%S")
+
+    # Return slots whose holds have lapsed to the pool before listing
+    try:
+        sweep_expired_holds()
+    except Exception as e:
+        log.warning("Hold sweep failed: %s", e)
+
+    def available():
+        return (
             supabase.table('appointments')
             .select("appointment_id, appointment_time, appointment_date")
             .eq("status", "Available")
-            .gte("appointment_date", target_date)
+        )
+
+    # Past times on the target day are filtered before the limit, not after it;
+    # otherwise a day full of earlier slots hides every later one
+    records = (
+        available()
+        .eq("appointment_date", target_date)
+        .gte("appointment_time", target_time)
+        .order("appointment_time")
+        .limit(num_suggestions)
+        .execute()
+    ).data or []
+    if len(records) < num_suggestions:
+        records += (
+            available()
+            .gt("appointment_date", target_date)
             .order("appointment_date")
             .order("appointment_time")
-            .limit(10)
+            .limit(num_suggestions - len(records))
             .execute()
-        )
+        ).data or []
 
-        if not result.data:
-            return "No available slots found."
+    return [
+        {
+            'id': record['appointment_id'],
+            'datetime': f"{record['appointment_date']} at {record['appointment_time']}",
+            'date': record['appointment_date'],
+            'time': record['appointment_time']
+        }
+        for record in records
+    ]
 
-        available_slots = []
-        for record in result.data:
-            slot_date = record['appointment_date']
-            slot_time = record['appointment_time']
 
-            if slot_date == target_date and slot_time < target_time:
-                continue
+def format_slots(available_slots: List[dict]) -> str:
+    """Render slots the way the booking prompts expect (nearest first, with IDs)."""
+    if not available_slots:
+        return "No available slots found."
 
-            available_slots.append({
-                'id': record['appointment_id'],
-                'datetime': f"{slot_date} at {slot_time}",
-                'date': slot_date,
-                'time': slot_time
-            })
+    nearest = available_slots[0]
+    response = f"📅 Nearest available slot: {nearest['datetime']} (ID: {nearest['id']})"
 
-            if len(available_slots) >= num_suggestions:
-                break
+    if len(available_slots) > 1:
+        response += "\n\nOther available options:"
+        for slot in available_slots[1:]:
+            response += f"\n  • {slot['datetime']} (ID: {slot['id']})"
 
-        if not available_slots:
-            return "No available slots found after the requested time."
+    return response
 
-        nearest = available_slots[0]
-        response = f"📅 Nearest available slot: {nearest['datetime']} (ID: {nearest['id']})"
 
-        if len(available_slots) > 1:
-            response += "\n\nOther available options:"
-            for slot in available_slots[1:]:
-                response += f"\n  • {slot['datetime']} (ID: {slot['id']})"
-
-        return response
+@tool
+@traced("tool.get_nearest_available_slot", "tool")
+def get_nearest_available_slot(datetime_str: str = None, num_suggestions: int = 3) -> str:
+    """Get the nearest available appointment slots starting from requested time or now."""
+    try:
+        return format_slots(find_available_slots(datetime_str, num_suggestions))
 
     except Exception as e:
         return f"Error getting nearest slots: {e}"
 
 @tool
+@traced("tool.book_appointment", "tool")
 def book_appointment(appointment_id: str, student_id: str) -> str:
     """Book an appointment using the appointment ID after user confirmation."""
     try:
-        result = (
-            supabase.table('appointments')
-            .update({
-                "status": "Booked",
-                "student_id": student_id
-            })
-            .eq("appointment_id", appointment_id)
-            .eq("status", "Available")
-            .execute()
-        )
+        appointment = confirm_hold(appointment_id, student_id)
 
-        if result.data:
-            appointment = result.data[0]
+        if appointment:
+            booked_slots.add(appointment.get('appointment_date'), appointment.get('appointment_time'))
             return f"✓ Appointment confirmed! Booked for {appointment.get('appointment_date')} at {appointment.get('appointment_time')}. Appointment ID: {appointment_id}"
         else:
             return f"✗ Unable to book. This slot may no longer be available."
@@ -131,7 +207,28 @@ def book_appointment(appointment_id: str, student_id: str) -> str:
     except Exception as e:
         return f"Error booking appointment: {e}"
     
+def fetch_booked_times(target_date: str, start_time: str = None, end_time: str = None) -> list:
+    """Booked appointment times on a date, optionally limited to [start_time, end_time].
+
+    Date, status and time window are all filtered by PostgREST, so only the
+    matching rows cross the network.
+    """
+    query = (
+        supabase.table('appointments')
+        .select("appointment_time")
+        .eq("appointment_date", target_date)
+        .eq("status", "Booked")
+    )
+    if start_time:
+        query = query.gte("appointment_time", start_time)
+    if end_time:
+        query = query.lte("appointment_time", end_time)
+    result = query.order("appointment_time").execute()
+    return [record["appointment_time"] for record in result.data or []]
+
+
 @tool
+@traced("tool.check_conflicts", "tool")
 def check_conflicts(datetime_str: str) -> str:
     """Check for conflicts within 1 hour of the specified time."""
     try:
@@ -142,27 +239,22 @@ def check_conflicts(datetime_str: str) -> str:
         dt = dt.replace(minute=0 if dt.minute < 30 else 30, second=0, microsecond=0)
 
         target_date = dt.date().isoformat()
-        target_time = dt.time()
 
-        start_dt = datetime.combine(dt.date(), target_time) - timedelta(hours=1)
-        end_dt = datetime.combine(dt.date(), target_time) + timedelta(hours=1)
+        # Clamp the window to the target date so string comparison stays valid
+        start_dt = max(dt - timedelta(hours=1), datetime.combine(dt.date(), datetime.min.time()))
+        end_dt = min(dt + timedelta(hours=1), datetime.combine(dt.date(), datetime.max.time()))
         start_time = start_dt.time().strftime("%H:%M:%S")
         end_time = end_dt.time().strftime("%H:%M:%S")
 
-        result = (
-            supabase.table('appointments')
-            .select("appointment_time, status")
-            .eq("appointment_date", target_date)
-            .execute()
-        )
-
-        if not result.data:
-            return "No appointments found for that date."
-
-        conflicts = []
-        for record in result.data:
-            if start_time <= record["appointment_time"] <= end_time and record["status"] == "Booked":
-                conflicts.append(record["appointment_time"])
+        if booked_slots.ttl_seconds > 0:
+            # Common case: answer from the in-memory index, loading the date once
+            fresh = booked_slots.is_fresh(target_date)
+            cache_lookup("booked_slots", fresh)
+            if not fresh:
+                booked_slots.load(target_date, fetch_booked_times(target_date))
+            conflicts = booked_slots.conflicts(target_date, start_time, end_time)
+        else:
+            conflicts = fetch_booked_times(target_date, start_time, end_time)
 
         if conflicts:
             return f"⚠ Conflicts found at: {', '.join(conflicts)}"
@@ -173,6 +265,7 @@ def check_conflicts(datetime_str: str) -> str:
 
 
 @tool
+@traced("tool.cancel_appointment", "tool")
 def cancel_appointment(appointment_id: str) -> str:
     """Cancel an existing appointment by ID."""
     try:
@@ -184,6 +277,8 @@ def cancel_appointment(appointment_id: str) -> str:
         )
 
         if result.data:
+            appointment = result.data[0]
+            booked_slots.remove(appointment.get('appointment_date'), appointment.get('appointment_time'))
             return f"✓ Appointment {appointment_id} cancelled successfully."
         return f"✗ Appointment {appointment_id} not found."
 
@@ -191,6 +286,7 @@ def cancel_appointment(appointment_id: str) -> str:
         return f"Error cancelling appointment: {e}"
 
 @tool
+@traced("tool.update_appointment", "tool")
 def update_appointment(old_appointment_id: str, student_id: str) -> str:
     """Update an existing appointment to a new time by first canceling, then showing available slots."""
     try:
@@ -208,39 +304,23 @@ def update_appointment(old_appointment_id: str, student_id: str) -> str:
 
 
 @tool
+@traced("tool.retrieve_treatment_info", "tool")
 def retrieve_treatment_info(condition: str, severity: str, k: int = 5) -> List[Document]:
     """
     Retrieve treatment plans and recommendations from the knowledge base
     for a specific mental health condition and severity level.
     """
-    embeddings = OpenAIEmbeddings()
-
-    # ✅ Connect to Qdrant Cloud directly using qdrant-client
-    client = QdrantClient(
-        url=os.environ["QDRANT_ENDPOINT"],
-        api_key=os.environ["QDRANT_API_KEY"],
-      
-    )
-
-    # ✅ Use LangChain’s dedicated QdrantVectorStore wrapper
-    vectorstore = QdrantVectorStore(
-        client=client,
-        collection_name="MentalHealthData",
-        embedding=embeddings
-    )
-
     query = f"treatment plan, advices or recommendations for {condition} at {severity} severity level"
-    # 🔍 Perform semantic search
-    docs = vectorstore.similarity_search(query, k=k)
-    return docs
+    return search_knowledge_base(query, k, site="treatment_info")
 
 
 # Bind all tools to LLM
-llm_with_tools_full = llm.bind_tools([
+APPOINTMENT_TOOLS = [
     retrieve_treatment_info,
     get_nearest_available_slot,
     book_appointment,
     check_conflicts,
     cancel_appointment,
     update_appointment
-])
\ No newline at end of file
+]
+llm_with_tools_full = LazyModel(lambda: llm.bind_tools(APPOINTMENT_TOOLS))
\ No newline at end of file
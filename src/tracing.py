@@ -0,0 +1,233 @@
+## TRACING ##
+# Span recording for workflow nodes, tools and outbound calls (LLM, Qdrant,
+# Supabase), exported as Chrome trace-event JSON (open in chrome://tracing or
+# https://ui.perfetto.dev). Each sampled turn becomes one file in TRACE_DIR.
+#
+# TRACE_SAMPLE_RATE=0 (default) disables tracing: spans cost one flag check.
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import count
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.metrics import supabase_latency, supabase_requests
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+TRACE_DIR = os.environ.get("TRACE_DIR", "traces")
+
+_current_span = ContextVar("current_span", default=None)
+_UNSAMPLED = object()
+_file_counter = count(1)
+
+
+def tracing_enabled() -> bool:
+    return TRACE_SAMPLE_RATE > 0
+
+
+def set_sample_rate(rate: float) -> None:
+    """Change the sampling rate at runtime (0 disables tracing)."""
+    global TRACE_SAMPLE_RATE
+    TRACE_SAMPLE_RATE = rate
+
+
+class Trace:
+    """Events of one sampled root span (normally one conversation turn)."""
+
+    __slots__ = ("events", "lock", "origin")
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+
+    def export(self, name: str) -> str:
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"trace-{os.getpid()}-{next(_file_counter):06d}-{name}.json")
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+class Span:
+    __slots__ = ("name", "category", "trace", "parent", "start", "args", "calls")
+
+    def __init__(self, name, category, trace, parent, args):
+        self.name = name
+        self.category = category
+        self.trace = trace
+        self.parent = parent
+        self.args = args
+        self.calls = {}
+        self.start = time.perf_counter()
+
+    def finish(self, error: str = None):
+        end = time.perf_counter()
+        args = dict(self.args)
+        with self.trace.lock:
+            totals = [(kind, list(stats)) for kind, stats in self.calls.items()]
+        for kind, (calls, sent, received) in totals:
+            args[f"{kind}.calls"] = calls
+            args[f"{kind}.bytes_sent"] = sent
+            args[f"{kind}.bytes_received"] = received
+        if error:
+            args["error"] = error
+        event = {
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self.start - self.trace.origin) * 1e6,
+            "dur": (end - self.start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args
+        }
+        with self.trace.lock:
+            self.trace.events.append(event)
+
+
+@contextmanager
+def span(name: str, category: str = "node", **args):
+    """Record a span under the current one; starts a new sampled trace at the root."""
+    if TRACE_SAMPLE_RATE <= 0:
+        yield None
+        return
+
+    parent = _current_span.get()
+    if parent is _UNSAMPLED:
+        yield None
+        return
+    if parent is None and random.random() >= TRACE_SAMPLE_RATE:
+        token = _current_span.set(_UNSAMPLED)
+        try:
+            yield None
+        finally:
+            _current_span.reset(token)
+        return
+
+    current = Span(name, category, parent.trace if parent else Trace(), parent, args)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        # GraphInterrupt is how ask_question/handle_appointment pause; not a failure
+        error = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish(error)
+        if parent is None:
+            current.trace.export(name)
+
+
+def record_call(kind: str, sent: int = 0, received: int = 0) -> None:
+    """Count one outbound call (and its payload sizes) on every open span."""
+    current = _current_span.get()
+    if current is None or current is _UNSAMPLED:
+        return
+    # Fan-out threads record on the same spans
+    with current.trace.lock:
+        while current is not None:
+            stats = current.calls.setdefault(kind, [0, 0, 0])
+            stats[0] += 1
+            stats[1] += sent
+            stats[2] += received
+            current = current.parent
+
+
+def payload_size(obj) -> int:
+    """Approximate serialized size of a payload, only computed while tracing."""
+    current = _current_span.get()
+    if current is None or current is _UNSAMPLED:
+        return 0
+    try:
+        return len(json.dumps(obj, default=str))
+    except (TypeError, ValueError):
+        return len(str(obj))
+
+
+def traced(name: str, category: str = "node"):
+    """Decorator: run the function inside a span. Keeps the signature for LangGraph/@tool."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if TRACE_SAMPLE_RATE <= 0:
+                return fn(*args, **kwargs)
+            with span(name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def turn_span(session_id: str):
+    """Root span for one conversation turn; the sampling decision is made here."""
+    with span("turn", "turn", session_id=session_id) as current:
+        yield current
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Counts LLM calls and prompt/completion sizes on the current span."""
+
+    def __init__(self):
+        self._sent = {}  # run_id -> prompt size; one handler serves every turn and thread
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._sent[run_id] = sum(len(str(m.content)) for batch in messages for m in batch)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._sent[run_id] = sum(len(p) for p in prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        received = sum(len(g.text or "") for batch in response.generations for g in batch)
+        record_call("llm", self._sent.pop(run_id, 0), received)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._sent.pop(run_id, None)
+
+
+tracing_callback = TracingCallbackHandler()
+
+
+_WRITE_METHODS = ("insert", "update", "upsert")
+
+
+class _TracedQuery:
+    """Proxy for a PostgREST request builder that records execute() round trips (metrics + traces)."""
+
+    __slots__ = ("_inner", "_table", "_sent")
+
+    def __init__(self, inner, table, sent=0):
+        self._inner = inner
+        self._table = table
+        self._sent = sent
+
+    def __getattr__(self, name):
+        attr = getattr(self._inner, name)
+        if name == "execute":
+            def execute():
+                start = time.perf_counter()
+                with span(f"supabase.{self._table}", "supabase"):
+                    result = attr()
+                    record_call("supabase", self._sent, payload_size(getattr(result, "data", None)))
+                supabase_requests.labels(self._table).inc()
+                supabase_latency.labels(self._table).observe(time.perf_counter() - start)
+                return result
+            return execute
+        if callable(attr):
+            def call(*args, **kwargs):
+                sent = self._sent + (payload_size(args[0]) if args and name in _WRITE_METHODS else 0)
+                return _TracedQuery(attr(*args, **kwargs), self._table, sent)
+            return call
+        return attr
+
+
+def traced_query(query, label: str, params=None):
+    """Wrap a Supabase table()/rpc() builder so its round trip is counted and traced."""
+    return _TracedQuery(query, label, payload_size(params) if params else 0)
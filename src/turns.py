@@ -0,0 +1,181 @@
+## BACKGROUND TURNS ##
+# Graph turns run on a worker pool instead of the Streamlit script thread, with
+# one task handle per session. The UI polls the handle from a fragment and shows
+# which stage the turn has reached ("retrieving", "scoring", "booking", ...), and
+# collects the result with take_turn() once it is done.
+#
+# A session runs at most one turn at a time. A message sent while its session
+# still has a turn (a double submit or an impatient retry) is dropped, and so is
+# the same message sent again within TURN_DEBOUNCE_SECONDS of its turn finishing.
+#
+#   TURN_WORKERS           turns running at once per process (default 8)
+#   TURN_DEBOUNCE_SECONDS  window for dropping a repeated message (default 1.0)
+#   TURN_POLL_SECONDS      how often the UI checks on a running turn (default 0.5)
+#   TURN_RESULT_TTL_SECONDS  finished turns nobody collected (the tab was closed)
+#                            are dropped after this long (default 600)
+#
+# Expired entries are swept at most every SWEEP_INTERVAL_SECONDS, when a turn is
+# submitted or collected, so neither map grows with sessions that went away.
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Optional
+import contextvars
+import os
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.logs import get_logger
+from src.metrics import turns_dropped
+
+log = get_logger(__name__)
+
+TURN_WORKERS = int(os.environ.get("TURN_WORKERS", 8))
+TURN_DEBOUNCE_SECONDS = float(os.environ.get("TURN_DEBOUNCE_SECONDS", 1.0))
+TURN_POLL_SECONDS = float(os.environ.get("TURN_POLL_SECONDS", 0.5))
+TURN_RESULT_TTL_SECONDS = float(os.environ.get("TURN_RESULT_TTL_SECONDS", 600))
+SWEEP_INTERVAL_SECONDS = 30
+
+# What the student sees while each node runs
+NODE_STAGES = {
+    "start_conversation": "thinking",
+    "track": "thinking",
+    "retrieve": "retrieving",
+    "respond": "writing",
+    "classify": "reviewing",
+    "safety_response": "writing",
+    "transition_to_questionnaire": "preparing questions",
+    "create_questionnaire": "preparing questions",
+    "ask_question": "preparing questions",
+    "score_answer": "scoring",
+    "save_score": "scoring",
+    "total_score_label": "scoring",
+    "transition_to_recommendations": "planning",
+    "determine_route": "planning",
+    "treatment_plan": "planning",
+    "appointment": "booking",
+    "handle_appointment": "booking",
+}
+
+_executor = None
+_turns = {}       # session ID -> TurnTask until the UI takes it
+_last_done = {}   # session ID -> (message, time its turn was collected)
+_lock = Lock()
+_last_sweep = 0.0
+
+
+class TurnTask:
+    """Handle on one session's running (or finished, not yet collected) turn."""
+
+    def __init__(self, session_id: str, message: str, phase: str = None):
+        self.session_id = session_id
+        self.message = message
+        self.phase = phase        # UI phase the message was sent in
+        self.stage = "thinking"
+        self.node = None
+        self.started = time.monotonic()
+        self.finished = None      # set when the turn completes
+        self.future: Optional[Future] = None
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def result(self) -> dict:
+        """The turn's final state; raises whatever the turn raised."""
+        return self.future.result()
+
+    @property
+    def callbacks(self) -> list:
+        """Callbacks to pass to the graph so the stage follows the running node."""
+        return [ProgressCallbackHandler(self)]
+
+
+class ProgressCallbackHandler(BaseCallbackHandler):
+    """Sets a TurnTask's stage from the node each graph step starts."""
+
+    def __init__(self, task: TurnTask):
+        self.task = task
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if node in NODE_STAGES and node != self.task.node:
+            self.task.node = node
+            self.task.stage = NODE_STAGES[node]
+
+
+def get_turn_executor() -> ThreadPoolExecutor:
+    # Separate from the tool pool in src/concurrency.py: nodes run tool calls on that one and wait on them
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="turn")
+    return _executor
+
+
+def submit_turn(session_id: str, message: str, run: Callable[[TurnTask], dict], phase: str = None) -> Optional[TurnTask]:
+    """
+    Start run(task) in the background and return the task, or None if the
+    message was dropped because the session is busy or just sent it.
+    """
+    now = time.monotonic()
+    with _lock:
+        _sweep(now)
+        if session_id in _turns:
+            turns_dropped.labels("busy").inc()
+            log.info("Turn dropped, session busy", extra={"session_id": session_id})
+            return None
+        last = _last_done.pop(session_id, None)
+        if last is not None and last[0] == message and now - last[1] < TURN_DEBOUNCE_SECONDS:
+            _last_done[session_id] = last
+            turns_dropped.labels("repeat").inc()
+            log.info("Turn dropped, repeated message", extra={"session_id": session_id})
+            return None
+        task = _turns[session_id] = TurnTask(session_id, message, phase)
+    task.future = get_turn_executor().submit(contextvars.copy_context().run, run, task)
+    task.future.add_done_callback(lambda _: setattr(task, "finished", time.monotonic()))
+    return task
+
+
+def _sweep(now: float) -> None:
+    """Drop expired debounce entries and finished turns nobody collected. Call with _lock held."""
+    global _last_sweep
+    if now - _last_sweep < SWEEP_INTERVAL_SECONDS:
+        return
+    _last_sweep = now
+    for session_id in [sid for sid, (_, done_at) in _last_done.items() if now - done_at >= TURN_DEBOUNCE_SECONDS]:
+        del _last_done[session_id]
+    abandoned = [sid for sid, task in _turns.items()
+                 if task.finished is not None and now - task.finished >= TURN_RESULT_TTL_SECONDS]
+    for session_id in abandoned:
+        del _turns[session_id]
+    if abandoned:
+        log.info("Dropped uncollected turns", extra={"sessions": len(abandoned)})
+
+
+def current_turn(session_id: str) -> Optional[TurnTask]:
+    """The session's turn, running or finished, until take_turn() collects it."""
+    return _turns.get(session_id)
+
+
+def take_turn(session_id: str) -> Optional[TurnTask]:
+    """Remove and return the session's turn so the session can send again."""
+    now = time.monotonic()
+    with _lock:
+        _sweep(now)
+        task = _turns.pop(session_id, None)
+        if task is not None:
+            _last_done[session_id] = (task.message, now)
+        return task
+
+
+def end_session(session_id: str) -> None:
+    """Forget a session's turn and debounce state (the student started over)."""
+    with _lock:
+        _turns.pop(session_id, None)
+        _last_done.pop(session_id, None)
@@ -1,54 +1,105 @@
 ## Build the workflow
+import os
 from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.types import Command
+from langchain_core.messages import HumanMessage
 from src.models import UnifiedState
 from src.nodes import *
-from src.helperfunctions import should_classify
+from src.helperfunctions import should_classify, route_entry, has_user_message
+from src.logs import with_session_id
+from src.metrics import metrics_callback, timed_node
+from src.tracing import traced, tracing_callback, tracing_enabled, turn_span
+
+# Process-wide so checkpoints survive the workflow being rebuilt (e.g. on Streamlit reruns).
+# SESSION_STORE=sqlite (default) persists sessions to SESSION_STORE_PATH; "memory" keeps them in-process.
+_default_checkpointer = None
+
+def get_default_checkpointer():
+    """Shared checkpointer for compiled workflows, created on first use."""
+    global _default_checkpointer
+    if _default_checkpointer is None:
+        if os.environ.get("SESSION_STORE", "sqlite").lower() == "memory":
+            _default_checkpointer = InMemorySaver()
+        else:
+            from src.session_store import SQLiteSessionSaver
+            _default_checkpointer = SQLiteSessionSaver()
+    return _default_checkpointer
 # BUILD THE UNIFIED WORKFLOW
 # ============================================
 # =============================================
 # FIXED WORKFLOW STRUCTURE FINAL VERSION OF NODES AND USER TEST CASE
 # =============================================
 
-def create_unified_workflow():
-    """Creates the complete 3-graph workflow with appointment interaction loop"""
+def create_unified_workflow(checkpointer=None):
+    """
+    Creates the complete 3-graph workflow with appointment interaction loop.
+
+    State is checkpointed per session (thread_id = session_id), and the graph
+    pauses with interrupt() in ask_question and handle_appointment, so each
+    turn only runs the nodes it needs. Drive it with run_turn().
+    """
     workflow = StateGraph(UnifiedState)
 
+    def add_node(name, node):
+        # Every node is timed for /metrics, runs inside a trace span (a no-op
+        # unless TRACE_SAMPLE_RATE > 0) and logs with its session's ID
+        workflow.add_node(name, timed_node(name, traced(name)(with_session_id(node))))
+
     # ===== GRAPH 1 NODES (Conversation & Classification) =====
-    workflow.add_node("start_conversation", start_conversation)
-    workflow.add_node("track", track_conversation)
-    workflow.add_node("retrieve", retrieve_context)
-    workflow.add_node("respond", generate_response)
-    workflow.add_node("classify", classify_disorder)
+    add_node("start_conversation", start_conversation)
+    add_node("track", track_conversation)
+    add_node("retrieve", retrieve_context)
+    add_node("respond", generate_response)
+    add_node("classify", classify_disorder)
+    add_node("safety_response", safety_response)
 
     # ===== BRIDGE NODE 1: Classification → Questionnaire =====
-    workflow.add_node("transition_to_questionnaire", transition_to_questionnaire)
+    add_node("transition_to_questionnaire", transition_to_questionnaire)
 
     # ===== GRAPH 2 NODES (Questionnaire) =====
-    workflow.add_node("create_questionnaire", create_questionnaire)
-    workflow.add_node("ask_question", ask_question_node)
-    workflow.add_node("score_answer", score_user_answer)
-    workflow.add_node("save_score", save_answer_score)
-    workflow.add_node("total_score_label", total_score_label)
+    add_node("create_questionnaire", create_questionnaire)
+    add_node("ask_question", ask_question_node)
+    add_node("score_answer", score_user_answer)
+    add_node("save_score", save_answer_score)
+    add_node("total_score_label", total_score_label)
 
     # ===== BRIDGE NODE 2: Questionnaire → Recommendations =====
-    workflow.add_node("transition_to_recommendations", transition_to_recommendations)
+    add_node("transition_to_recommendations", transition_to_recommendations)
 
     # ===== GRAPH 3 NODES (Recommendations) =====
-    workflow.add_node("determine_route", determine_route)
-    workflow.add_node("treatment_plan", generate_treatment_plan)
-    workflow.add_node("appointment", generate_appointment_recommendation)
-    workflow.add_node("handle_appointment", handle_appointment_interaction)  # ✅ NEW NODE
+    add_node("determine_route", determine_route)
+    add_node("treatment_plan", generate_treatment_plan)
+    add_node("appointment", generate_appointment_recommendation)
+    add_node("handle_appointment", handle_appointment_interaction)  # ✅ NEW NODE
 
     # ===== GRAPH 1 EDGES (Conversation) =====
-    workflow.add_edge(START, "start_conversation")
-    workflow.add_edge("start_conversation", "track")
+    # Returning sessions skip the greeting and go straight to tracking
+    workflow.add_conditional_edges(
+        START,
+        route_entry,
+        {
+            "start_conversation": "start_conversation",
+            "track": "track",
+            "end": END
+        }
+    )
+    workflow.add_conditional_edges(
+        "start_conversation",
+        has_user_message,
+        {
+            True: "track",
+            False: END
+        }
+    )
 
     workflow.add_conditional_edges(
         "track",
         should_classify,
         {
             "continue": "retrieve",
-            "classify": "classify"
+            "classify": "classify",
+            "safety": "safety_response"
         }
     )
 
@@ -70,8 +121,27 @@ def create_unified_workflow():
         }
     )
 
-    workflow.add_edge("ask_question", END)
-    workflow.add_edge("score_answer", "save_score")
+    # ask_question pauses for the student's answer, then scoring continues
+    workflow.add_edge("ask_question", "score_answer")
+    workflow.add_conditional_edges(
+        "score_answer",
+        lambda state: state.get('next_node', 'save_score'),
+        {
+            'save_score': 'save_score',
+            'safety_response': 'safety_response'
+        }
+    )
+
+    # Risk hits (src/risk.py) answer immediately, then end the turn or save the
+    # flagged questionnaire answer and carry on with the next item
+    workflow.add_conditional_edges(
+        "safety_response",
+        lambda state: state.get('next_node', 'end'),
+        {
+            'save_score': 'save_score',
+            'end': END
+        }
+    )
 
     workflow.add_conditional_edges(
         "save_score",
@@ -106,7 +176,85 @@ def create_unified_workflow():
     )
 
     workflow.add_edge("treatment_plan", END)
-    workflow.add_edge("appointment", END)  # ✅ This now shows initial suggestion and ends
-    workflow.add_edge("handle_appointment", END)  # ✅ This handles user interactions
+    workflow.add_edge("appointment", "handle_appointment")  # ✅ Shows initial suggestion, then waits for the student
+    workflow.add_conditional_edges(
+        "handle_appointment",
+        lambda state: "end" if state.get("appointment_confirmed") else "handle_appointment",
+        {
+            "handle_appointment": "handle_appointment",  # ✅ Keep handling replies until booked
+            "end": END
+        }
+    )
+
+    return workflow.compile(checkpointer=checkpointer or get_default_checkpointer())
+
+
+def session_config(session_id: str, callbacks: list = ()) -> dict:
+    """LangGraph config that keys checkpoints by session, plus any per-turn callbacks."""
+    # LLM calls and token usage per node for /metrics; payload sizes for traces when sampling
+    defaults = [metrics_callback, tracing_callback] if tracing_enabled() else [metrics_callback]
+    return {"configurable": {"thread_id": session_id}, "callbacks": defaults + list(callbacks)}
+
+
+def start_session(app, session_id: str, student_id: str) -> dict:
+    """Run the greeting for a new session and return the resulting state."""
+    with turn_span(session_id):
+        return app.invoke(
+            {"student_id": student_id, "session_id": session_id, "messages": []},
+            session_config(session_id)
+        )
+
+
+def run_turn(app, session_id: str, user_input: str, callbacks: list = ()) -> dict:
+    """
+    Advance a session by one student message.
+    Resumes the pending interrupt (question or booking reply) if there is one,
+    otherwise sends just the new message into the conversation.
+    Callbacks (e.g. src/turns.py progress) are added for this turn only.
+    """
+    config = session_config(session_id, callbacks)
+    if app.get_state(config).next:
+        payload = Command(resume=user_input)
+    else:
+        payload = {"messages": [HumanMessage(content=user_input)]}
+    with turn_span(session_id):
+        return app.invoke(payload, config)
+
+
+async def aturn_payload(app, session_id: str, user_input: str):
+    """Async counterpart of run_turn's input: resume value or new message."""
+    snapshot = await app.aget_state(session_config(session_id))
+    if snapshot.next:
+        return Command(resume=user_input)
+    return {"messages": [HumanMessage(content=user_input)]}
+
+
+async def arun_turn(app, session_id: str, user_input: str) -> dict:
+    """Async run_turn, for async hosts (src/api.py)."""
+    payload = await aturn_payload(app, session_id, user_input)
+    with turn_span(session_id):
+        return await app.ainvoke(payload, session_config(session_id))
+
+
+def session_phase(state: dict) -> str:
+    """Which of the three phases a session is in: conversation, questionnaire or recommendations."""
+    stage = state.get("workflow_stage")
+    if stage in (None, "conversation"):
+        return "conversation"
+    if stage in ("classified", "questionnaire"):
+        return "questionnaire"
+    return "recommendations"
+
+
+_workflow = None
 
-    return workflow.compile()
\ No newline at end of file
+def get_workflow():
+    """
+    Process-wide compiled workflow. Hosts that re-execute their entry script
+    (Streamlit reruns) or serve many sessions should use this instead of
+    calling create_unified_workflow() per request.
+    """
+    global _workflow
+    if _workflow is None:
+        _workflow = create_unified_workflow()
+    return _workflow
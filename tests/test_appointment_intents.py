@@ -0,0 +1,40 @@
+import pytest
+
+from src.appointment_intents import classify_appointment_reply
+
+
+@pytest.mark.parametrize("message", [
+    "I can't do Monday",
+    "I cant do monday",
+    "not today",
+    "anything but friday",
+    "any day except tuesday",
+    "is there parking at 5?",
+    "can we do 3pm?",
+    "ok cancel it",
+    "no",
+])
+def test_negated_and_question_replies_go_to_the_llm(message):
+    assert classify_appointment_reply(message) is None
+
+
+@pytest.mark.parametrize("message", ["other times", "anything else?", "that doesn't work"])
+def test_alternatives(message):
+    assert classify_appointment_reply(message).kind == "alternatives"
+
+
+def test_time_request():
+    intent = classify_appointment_reply("Monday afternoon")
+    assert intent.kind == "time"
+    assert intent.time.weekday == 0 and intent.time.hour == 13
+
+
+def test_tomorrow_at_three():
+    intent = classify_appointment_reply("tomorrow at 3")
+    assert intent.kind == "time"
+    assert intent.time.day_offset == 1 and intent.time.hour == 15
+
+
+@pytest.mark.parametrize("message", ["yes", "sounds good", "book it please"])
+def test_confirm(message):
+    assert classify_appointment_reply(message).kind == "confirm"
@@ -0,0 +1,22 @@
+from benchmarks.standins import install_standins
+
+install_standins()
+
+from src.nodes import run_appointment_tool_calls  # noqa: E402
+
+
+def test_mixed_tool_calls_become_text():
+    tool_calls = [
+        {"name": "retrieve_treatment_info", "args": {"condition": "stress", "severity": "moderate stress"}},
+        {"name": "get_nearest_available_slot", "args": {"num_suggestions": 2}},
+        {"name": "check_conflicts", "args": {"datetime_str": "2030-01-07 10:00"}},
+        {"name": "not_a_tool", "args": {}},
+    ]
+
+    results, confirmed = run_appointment_tool_calls(tool_calls, "S0001")
+
+    assert len(results) == len(tool_calls)
+    assert all(isinstance(result, str) for result in results)
+    assert results[0].startswith("Retrieved Knowledge Base Context")
+    assert results[3] == "Unknown tool: not_a_tool"
+    assert not confirmed
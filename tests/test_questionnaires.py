@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from src.questionnaires import QUESTIONNAIRES_PATH, QuestionnaireSpec, route_for_severity
+
+
+def _definition(**changes):
+    with open(QUESTIONNAIRES_PATH, encoding="utf-8") as f:
+        definition = json.load(f)["instruments"][0]
+    return {**definition, **changes}
+
+
+def test_routes_come_from_score_bands():
+    assert route_for_severity("Moderate stress") == "treatment_plan"
+    assert route_for_severity("high stress") == "appointment"
+    assert route_for_severity("Severe anxiety") == "appointment"
+
+
+def test_unmapped_score_label_fails():
+    with pytest.raises(ValueError):
+        route_for_severity("Unknown")
+
+
+def test_band_with_unknown_route_fails_at_load():
+    definition = _definition()
+    bands = [list(band) for band in definition["score_ranges"]]
+    bands[0][3] = "self_help"
+    with pytest.raises(ValueError):
+        QuestionnaireSpec({**definition, "score_ranges": bands})
+
+
+def test_database_columns_follow_the_type():
+    spec = QuestionnaireSpec(_definition(type="who", disorder="wellbeing"))
+    assert spec.db_type == "WHO"
+    assert spec.columns[1] == "who1"
+    assert (spec.total_column, spec.label_column) == ("who_total_score", "who_score_label")
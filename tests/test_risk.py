@@ -0,0 +1,38 @@
+import pytest
+
+from src.risk import detect_risk
+
+FLAGGED = [
+    "I want to end it",
+    "I don't want to be here anymore",
+    "I dont want to be here anymore",
+    "i dont wanna be here",
+    "thinking about jumping off a bridge",
+    "I wish I could disappear",
+    "I feel like a burden to everyone",
+    "I'm a burden",
+    "Im a burden",
+    "I want to end it all",
+    "I don't want to live",
+    "I dont want to live",
+    "I can't go on",
+    "I cant go on",
+    "I've been thinking about taking all my pills tonight, I have a plan",
+]
+
+NOT_FLAGGED = [
+    "sometimes",
+    "nearly every day",
+    "I've been so stressed with exams, I can barely sleep and I keep worrying about failing.",
+    "I'm not suicidal, just really overwhelmed with everything going on at home and at uni.",
+]
+
+
+@pytest.mark.parametrize("message", FLAGGED)
+def test_crisis_phrasings_are_flagged(message):
+    assert detect_risk(message) is not None
+
+
+@pytest.mark.parametrize("message", NOT_FLAGGED)
+def test_ordinary_messages_are_not_flagged(message):
+    assert detect_risk(message) is None
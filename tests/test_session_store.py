@@ -0,0 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from src.session_store import SQLiteSessionSaver
+
+
+def test_concurrent_round_trips():
+    saver = SQLiteSessionSaver(":memory:")
+    payloads = [{"messages": [f"student {n} message {i}" * (n + 1) for i in range(50)]} for n in range(8)]
+
+    def round_trip(payload):
+        for _ in range(200):
+            type_, blob = saver._dump(payload)
+            assert saver._load(type_, blob) == payload
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(round_trip, payloads))